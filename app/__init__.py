@@ -2,16 +2,14 @@
 
 import os
 import logging
+import click
 from logging.config import dictConfig
-from datetime import datetime
-from flask import Flask, render_template, url_for
+from flask import Flask, render_template, url_for, request
 from flask_login import LoginManager, current_user, login_required
-from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect, generate_csrf
 
 from .config     import Config
 from .extensions import db, mail
-from .utils      import setup_pandoc, initialize_nltk_resources
 
 # Blueprints imports
 from .auth.routes      import auth_bp
@@ -51,7 +49,6 @@ def configure_logging():
     })
 
 # Logging config
-logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 # Configure Flask app
@@ -90,7 +87,14 @@ def create_app():
     # Initialise extensions
     db.init_app(app)
     mail.init_app(app)
-    Migrate(app, db)
+    # Flask-Migrate imports alembic, which only the `flask db` commands need; workers and tests skip it
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    # Keep the admin dashboard's daily rollup current as rows are written
+    from .stats import register_rollup_listeners
+    register_rollup_listeners()
 
     # Set up login
     login_manager = LoginManager(app)
@@ -118,27 +122,40 @@ def create_app():
     @login_required
     def dashboard():
         from .models import UploadedDocument, QueryHistory, Folder
-        docs = UploadedDocument.query.filter_by(user_id=current_user.id) \
-                  .order_by(UploadedDocument.upload_date.desc()).all()
-        qs = QueryHistory.query.filter_by(user_id=current_user.id) \
-                  .order_by(QueryHistory.timestamp.asc()).all()
-        folders = Folder.query.filter_by(user_id=current_user.id).all()
-        return render_template("dashboard.html", documents=docs, queries=qs, folders=folders)
-
-    # Update last activity timestamp
+        from .pagination import keyset_page
+        # Only the newest page of each list is rendered; older pages are fetched as the user scrolls
+        size = app.config.get("DASHBOARD_PAGE_SIZE", 50)
+        docs, documents_cursor = keyset_page(
+            UploadedDocument.query.filter_by(user_id=current_user.id),
+            UploadedDocument.upload_date, UploadedDocument.id, limit=size
+        )
+        qs, history_cursor = keyset_page(
+            QueryHistory.query.filter_by(user_id=current_user.id),
+            QueryHistory.timestamp, QueryHistory.id, limit=size
+        )
+        # History is shown oldest first, ending with the latest answer
+        qs.reverse()
+        folders = Folder.query.filter_by(user_id=current_user.id).order_by(Folder.name).all()
+        return render_template("dashboard.html", documents=docs, queries=qs, folders=folders,
+                               documents_cursor=documents_cursor, history_cursor=history_cursor)
+
+    # Resume interrupted ingestion jobs once this process starts serving (no-op after the first request)
+    @app.before_request
+    def start_ingestion():
+        from .ingestion import start_ingestion_workers
+        start_ingestion_workers(app)
+
+    # Record last activity in memory; the tracker writes it in throttled batches from a background thread.
+    # Static files never touch the user row (and skip loading the user altogether).
     @app.before_request
     def update_last_activity():
+        if request.endpoint == "static":
+            return
         if current_user.is_authenticated:
-            current_user.last_activity = datetime.utcnow()
-            try:
-                db.session.commit()
-            except Exception as e:
-                logger.error("Error updating last_activity: %s", e)
-                db.session.rollback()
+            from .activity import get_activity_tracker
+            get_activity_tracker(app).touch(current_user.id)
 
-    # External utilities
-    setup_pandoc()
-    initialize_nltk_resources()
+    # pandoc and NLTK data are located the first time a document is parsed (see ingestion._parse_file)
 
     return app
 
@@ -164,6 +181,171 @@ def create_admin_command(app):
         else:
             print("No user found with that email.")
 
+# CLI command to (re)build users' vector stores from their uploaded files
+# Documents whose content hash is already indexed are skipped, so it is safe to re-run.
+# Use --rebuild once to clear collections created before incremental indexing (they contain duplicates).
+def create_reindex_command(app):
+    import click
+
+    @app.cli.command("reindex-documents")
+    @click.option("--user-id", type=int, default=None, help="Only reindex this user's documents.")
+    @click.option("--rebuild", is_flag=True, help="Drop existing collections and re-embed everything.")
+    def reindex_documents(user_id, rebuild):
+        from app.models import UploadedDocument
+        from app.ingestion import index_uploaded_document
+        query = UploadedDocument.query
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        docs = query.order_by(UploadedDocument.user_id, UploadedDocument.id).all()
+
+        if rebuild:
+            from langchain_chroma import Chroma
+            from chromadb.config import Settings
+            from .utils import get_user_vectorstore, invalidate_user_vectorstore, get_user_lexical_index
+            for uid in sorted({d.user_id for d in docs}):
+                get_user_vectorstore(uid, None, Chroma, Settings).delete_collection()
+                invalidate_user_vectorstore(uid)
+                get_user_lexical_index(uid).clear()
+            for d in docs:
+                d.indexed_at = None
+            db.session.commit()
+
+        embedded = skipped = failed = 0
+        for d in docs:
+            path = os.path.join('uploads', str(d.user_id), d.filename)
+            if not os.path.exists(path):
+                failed += 1
+                continue
+            try:
+                if index_uploaded_document(d, path):
+                    embedded += 1
+                else:
+                    skipped += 1
+            except Exception as e:
+                db.session.rollback()
+                failed += 1
+                print(f"Error indexing {path}: {e}")
+        print(f"Indexed {embedded} document(s), {skipped} already up to date, {failed} failed.")
+
+        # Fill keyword indexes for collections embedded before lexical search existed
+        from langchain_chroma import Chroma
+        from chromadb.config import Settings
+        from .utils import get_embeddings, get_user_vectorstore, sync_lexical_index
+        emb = get_embeddings(app.config)
+        for uid in sorted({d.user_id for d in docs}):
+            synced = sync_lexical_index(uid, get_user_vectorstore(uid, emb, Chroma, Settings))
+            if synced:
+                print(f"Rebuilt keyword index for user {uid} ({synced} chunks).")
+
+
+# CLI command to recompute the admin dashboard's daily rollup from the source tables
+# Run once after upgrading, or to repair the rollup after bulk edits made outside the app.
+def create_stats_command(app):
+    import click
+
+    @app.cli.command("rebuild-daily-stats")
+    @click.option("--days", type=int, default=None, help="Only rebuild the most recent N days.")
+    def rebuild_daily_stats_command(days):
+        from datetime import datetime, timedelta
+        from .stats import rebuild_daily_stats
+        start = datetime.utcnow().date() - timedelta(days=days - 1) if days else None
+        written = rebuild_daily_stats(start_day=start)
+        print(f"Rebuilt daily stats for {written} day(s).")
+
+
+# CLI command to ingest many documents for one user: files, folders and zip/tar archives.
+# Parsing is spread over a process pool; embedding and store writes run in this process, in order.
+def create_bulk_ingest_command(app):
+    import click
+
+    @app.cli.command("ingest-bulk")
+    @click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+    @click.option("--user-id", type=int, required=True, help="Owner of the ingested documents.")
+    @click.option("--workers", type=int, default=None, help="Parser processes (default one per CPU, 0 parses inline).")
+    def ingest_bulk(paths, user_id, workers):
+        from .models import User
+        from .bulk_ingestion import save_entries, iter_local_sources, register_documents, run_bulk_ingestion
+        if db.session.get(User, user_id) is None:
+            print(f"No user with id {user_id}.")
+            return
+        filenames = save_entries(
+            user_id,
+            iter_local_sources(paths),
+            max_files=app.config.get("BULK_MAX_FILES", 20000),
+            max_bytes=app.config.get("BULK_MAX_BYTES", 2 * 1024 ** 3)
+        )
+        jobs = register_documents(user_id, filenames)
+        summary = run_bulk_ingestion(app, [job.id for job in jobs], workers=workers)
+        print(f"Ingested {len(filenames)} file(s): {summary['succeeded']} indexed, "
+              f"{summary['skipped']} unchanged, {summary['failed']} failed.")
+
+def create_crawl_command(app):
+    import click
+
+    @app.cli.command("crawl")
+    @click.argument("url")
+    @click.option("--user-id", type=int, required=True, help="Owner of the crawled pages.")
+    @click.option("--max-pages", type=int, default=None, help="Page limit (default CRAWL_MAX_PAGES).")
+    @click.option("--depth", type=int, default=None, help="Link depth from the seed (default CRAWL_MAX_DEPTH).")
+    def crawl(url, user_id, max_pages, depth):
+        from .models import User
+        from .crawler import run_crawl
+        if db.session.get(User, user_id) is None:
+            print(f"No user with id {user_id}.")
+            return
+        counts = run_crawl(app, user_id, url, max_pages=max_pages, max_depth=depth)
+        print(f"Crawled {url}: {counts['changed']} changed, {counts['not_modified']} not modified, "
+              f"{counts['unchanged']} unchanged, {counts['blocked']} blocked by robots.txt, "
+              f"{counts['failed']} failed; {counts['indexed']} indexed.")
+
+# CLI command to rebuild vector stores and keyword indexes without deleted or orphaned chunks
+def create_compact_command(app):
+    import click
+
+    @app.cli.command("compact-vectorstores")
+    @click.option("--user-id", type=int, default=None, help="Only compact this user's indexes.")
+    def compact_vectorstores(user_id):
+        from .models import User
+        from .document_index import compact_user_index
+        query = db.session.query(User.id)
+        if user_id is not None:
+            query = query.filter(User.id == user_id)
+        total = 0
+        for (uid,) in query.order_by(User.id):
+            try:
+                report = compact_user_index(uid)
+            except Exception as e:
+                print(f"User {uid}: compaction failed: {e}")
+                continue
+            total += report["reclaimed"]
+            print(f"User {uid}: {report['chunks']} chunks kept, {report['orphans']} orphaned removed, "
+                  f"{report['bytes_before']} -> {report['bytes_after']} bytes.")
+        print(f"Reclaimed {total} bytes.")
+
+def create_migrate_vectorstores_command(app):
+    import click
+
+    @app.cli.command("migrate-vectorstores")
+    @click.option("--user-id", type=int, default=None, help="Only migrate this user's store.")
+    @click.option("--quantization", default=None,
+                  help="none, int8 or pq. Applied to new copies (default VECTOR_QUANTIZATION) and to stores "
+                       "already migrated.")
+    @click.option("--remove-source", is_flag=True, help="Delete each Chroma store once its vectors are copied.")
+    def migrate_vectorstores(user_id, quantization, remove_source):
+        from .models import User
+        from .document_index import migrate_user_index
+        query = db.session.query(User.id)
+        if user_id is not None:
+            query = query.filter(User.id == user_id)
+        for (uid,) in query.order_by(User.id):
+            try:
+                report = migrate_user_index(uid, quantization, remove_source)
+            except Exception as e:
+                print(f"User {uid}: migration failed: {e}")
+                continue
+            print(f"User {uid}: {report['chunks']} chunks ({report['copied']} copied from Chroma), "
+                  f"quantization {report['quantization']}, {report['bytes_before']} -> {report['bytes_after']} bytes.")
+        print("Set VECTOR_ENGINE=mmap to serve questions from the migrated stores.")
 
 # Create the app instance
 if __name__ == "__main__":
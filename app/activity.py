@@ -0,0 +1,109 @@
+# app/activity.py
+import atexit
+import logging
+import datetime
+import threading
+
+from sqlalchemy import bindparam
+
+from app.extensions import db
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+
+# Coalesces last_activity writes: each user is recorded at most once per touch_interval seconds,
+# and recorded touches are written in one executemany UPDATE every flush_interval seconds by a
+# background thread instead of a commit on every request. With flush_interval <= 0 there is no
+# thread and pending touches are written only by explicit flush() calls (tests, CLI).
+class ActivityTracker:
+    def __init__(self, app, touch_interval=60, flush_interval=10):
+        self.app = app
+        self.touch_interval = touch_interval
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._recorded = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats = {'touches': 0, 'recorded': 0, 'flushes': 0, 'rows_written': 0}
+
+    # Note a request by user_id; returns True if it will be written
+    def touch(self, user_id, now=None):
+        now = now or datetime.datetime.utcnow()
+        with self._lock:
+            self._stats['touches'] += 1
+            last = self._recorded.get(user_id)
+            if last is not None and (now - last).total_seconds() < self.touch_interval:
+                return False
+            self._recorded[user_id] = now
+            self._pending[user_id] = now
+            self._stats['recorded'] += 1
+        self._ensure_thread()
+        return True
+
+    # Write all pending touches; returns the number of users updated
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        table = User.__table__
+        # Never move last_activity backwards (another process may have written a later value)
+        statement = table.update().where(
+            table.c.id == bindparam('uid'),
+            table.c.last_activity < bindparam('seen')
+        ).values(last_activity=bindparam('seen'))
+        rows = [{'uid': uid, 'seen': seen} for uid, seen in pending.items()]
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(statement, rows)
+        except Exception as e:
+            logger.error('Error flushing last_activity for %s user(s): %s', len(rows), e)
+            # Keep the touches for the next flush unless newer ones arrived meanwhile
+            with self._lock:
+                for uid, seen in pending.items():
+                    self._pending.setdefault(uid, seen)
+            return 0
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['rows_written'] += len(rows)
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending))
+
+    def _ensure_thread(self):
+        if self.flush_interval <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+            self._thread.start()
+        # Write whatever is left when the process exits
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+
+# The app's tracker, created on first use from ACTIVITY_TOUCH_SECONDS / ACTIVITY_FLUSH_SECONDS
+def get_activity_tracker(app):
+    tracker = app.extensions.get('activity_tracker')
+    if tracker is None:
+        tracker = app.extensions.setdefault('activity_tracker', ActivityTracker(
+            app,
+            touch_interval=app.config.get('ACTIVITY_TOUCH_SECONDS', 60),
+            flush_interval=app.config.get('ACTIVITY_FLUSH_SECONDS', 10)
+        ))
+    return tracker
@@ -1,14 +1,16 @@
 # app/admin/routes.py
 import logging
-import calendar
 from datetime import datetime, timedelta
 
-from flask import render_template, request, flash, redirect, url_for, current_app
+from flask import render_template, request, flash, redirect, url_for, current_app, jsonify
 from flask_login import login_required, current_user
-from sqlalchemy import extract
+from sqlalchemy import func
 
 from app.extensions import db
-from app.models import User, UploadedDocument, QueryHistory
+from app.models import User, QueryHistory
+from app.user_search import search_users
+from app.activity import get_activity_tracker
+from app.stats import activity_series, ensure_daily_stats, totals
 from . import admin_bp, admin_required
 
 logger = logging.getLogger(__name__)
@@ -23,133 +25,47 @@ def admin_dashboard():
     search_query = request.args.get("q", "").strip()
     now          = datetime.utcnow()
 
-    # Global metrics
-    total_users     = User.query.count()
-    total_documents = UploadedDocument.query.count()
-    total_queries   = QueryHistory.query.count()
+    # Write buffered last_activity touches so the lookup is current to within ACTIVITY_TOUCH_SECONDS
+    # (the write bypasses the session, so already loaded users are expired to pick it up)
+    if get_activity_tracker(current_app).flush():
+        db.session.expire_all()
+
+    # Global metrics, summed from the daily rollup
+    ensure_daily_stats()
+    counts          = totals()
+    total_users     = counts["users"]
+    total_documents = counts["documents"]
+    total_queries   = counts["queries"]
 
     # count of distinct users who ran 1 or more queries in the last 7 days
+    # (an indexed range scan over the last week's queries only)
     week_ago     = now - timedelta(days=7)
     active_users = (
-        db.session.query(QueryHistory.user_id)
+        db.session.query(func.count(func.distinct(QueryHistory.user_id)))
                   .filter(QueryHistory.timestamp >= week_ago)
-                  .distinct()
-                  .count()
+                  .scalar()
     )
 
-    # Build timeseries data
-    if timeframe == "month":
-        year, month = now.year, now.month
-        labels = [calendar.month_abbr[m] for m in range(1, month + 1)]
-        user_growth = [
-            # Count users who joined in each month of the current year
-            User.query.filter(
-                extract('year', User.date_joined) == year,
-                extract('month', User.date_joined) == m
-            ).count()
-            for m in range(1, month + 1)
-        ]
-        # Count documents uploaded in each month of the current year
-        doc_uploads = [
-            UploadedDocument.query.filter(
-                extract('year', UploadedDocument.upload_date) == year,
-                extract('month', UploadedDocument.upload_date) == m
-            ).count()
-            for m in range(1, month + 1)
-        ]
-        # Count queries made in each month of the current year
-        query_counts = [
-            QueryHistory.query.filter(
-                extract('year', QueryHistory.timestamp) == year,
-                extract('month', QueryHistory.timestamp) == m
-            ).count()
-            for m in range(1, month + 1)
-        ]
-    elif timeframe == "week":
-        # For weekly data - last 4 weeks
-        weeks = 4
-        delta = timedelta(weeks=1)
-        start = now - delta * weeks
-        labels = []
-        user_growth = []
-        doc_uploads = []
-        query_counts = []
-        # For each week, get the start date and count users/documents/queries
-        for _ in range(weeks):
-            labels.append(start.strftime("%Y-%m-%d"))
-            user_growth.append(
-                User.query.filter(
-                    User.date_joined >= start,
-                    User.date_joined <  start + delta
-                ).count()
-            )
-            doc_uploads.append(
-                UploadedDocument.query.filter(
-                    UploadedDocument.upload_date >= start,
-                    UploadedDocument.upload_date <  start + delta
-                ).count()
-            )
-            query_counts.append(
-                QueryHistory.query.filter(
-                    QueryHistory.timestamp >= start,
-                    QueryHistory.timestamp <  start + delta
-                ).count()
-            )
-            start += delta
-    else:  
-        # For daily data - last 7 days
-        days = 7
-        delta = timedelta(days=1)
-        start = now - delta * days
-        labels = []
-        user_growth = []
-        doc_uploads = []
-        query_counts = []
-        # For each day, get the start date and count users/documents/queries
-        for _ in range(days):
-            labels.append(start.strftime("%Y-%m-%d"))
-            user_growth.append(
-                User.query.filter(
-                    User.date_joined >= start,
-                    User.date_joined <  start + delta
-                ).count()
-            )
-            doc_uploads.append(
-                UploadedDocument.query.filter(
-                    UploadedDocument.upload_date >= start,
-                    UploadedDocument.upload_date <  start + delta
-                ).count()
-            )
-            query_counts.append(
-                QueryHistory.query.filter(
-                    QueryHistory.timestamp >= start,
-                    QueryHistory.timestamp <  start + delta
-                ).count()
-            )
-            start += delta
-
-    # Prepare data for the graph
-    graph_data = {
-        "user_growth":   {"labels": labels, "values": user_growth},
-        "doc_uploads":   {"labels": labels, "values": doc_uploads},
-        "query_counts":  {"labels": labels, "values": query_counts},
-    }
+    # Build timeseries data from the daily rollup: one read of O(days) rows per page view
+    graph_data = activity_series(timeframe, now)
 
-    # User lookup
+    # User lookup: one indexed, paginated query with per-user counts
     user_lookup = []
+    next_cursor = None
     if search_query:
-        results = User.query.filter(
-            (User.username.ilike(f"%{search_query}%")) |
-            (User.email.ilike(f"%{search_query}%"))
-        ).all()
-        for u in results:
+        results, next_cursor = search_users(
+            search_query,
+            cursor=request.args.get("after"),
+            limit=current_app.config.get("ADMIN_LOOKUP_PAGE_SIZE", 25)
+        )
+        for u, doc_count, query_count in results:
             user_lookup.append({
                 "id":            u.id,
                 "username":      u.username,
                 "email":         u.email,
                 "is_admin":      u.is_admin,
-                "doc_count":     UploadedDocument.query.filter_by(user_id=u.id).count(),
-                "query_count":   QueryHistory.query.filter_by(user_id=u.id).count(),
+                "doc_count":     doc_count,
+                "query_count":   query_count,
                 "date_joined":   u.date_joined.strftime("%Y-%m-%d"),
                 "last_activity": u.last_activity.strftime("%Y-%m-%d %H:%M:%S"),
             })
@@ -165,6 +81,28 @@ def admin_dashboard():
         timeframe=timeframe,
         search_query=search_query,
         user_lookup=user_lookup,
+        lookup_next=next_cursor,
+        lookup_paged=bool(request.args.get("after")),
+    )
+
+# Cache and pool statistics for this worker process
+@admin_bp.route('/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    from app.answer_cache import get_answer_cache
+    from app.embedding_cache import get_embedding_cache
+    from app.parse_cache import get_parse_cache
+    from app.utils import vectorstore_pool
+    return jsonify(
+        answer_cache=get_answer_cache().stats(),
+        embedding_cache=get_embedding_cache(
+            current_app.config['EMBEDDING_CACHE_PATH'],
+            current_app.config['EMBEDDING_CACHE_MAX_BYTES']
+        ).stats(),
+        parse_cache=get_parse_cache(current_app.config['PARSE_CACHE_DIR']).stats(),
+        vectorstore_pool=vectorstore_pool().stats(),
+        activity_tracker=get_activity_tracker(current_app).stats(),
     )
 
 # Promote user to admin
@@ -213,4 +151,21 @@ def demote_user(user_id):
             logger.error("Error demoting user: %s", e)
             flash("Error demoting your account.")
     # Redirect to the admin dashboard
-    return redirect(url_for('admin.admin_dashboard'))
\ No newline at end of file
+    return redirect(url_for('admin.admin_dashboard'))
+
+# Rebuild a user's vector store and keyword index without deleted or orphaned chunks
+@admin_bp.route('/compact_index/<int:user_id>', methods=['POST'])
+@login_required
+@admin_required
+def compact_index(user_id):
+    from app.document_index import compact_user_index
+    u = User.query.get_or_404(user_id)
+    try:
+        report = compact_user_index(u.id)
+    except Exception as e:
+        logger.error("Error compacting index for user %s: %s", u.id, e)
+        flash(f"Compaction failed for {u.username}.")
+        return redirect(url_for('admin.admin_dashboard'))
+    flash(f"Compacted {u.username}'s index: {report['chunks']} chunks kept, {report['orphans']} orphaned removed, "
+          f"{report['reclaimed'] // 1024} KiB reclaimed.")
+    return redirect(url_for('admin.admin_dashboard'))
@@ -0,0 +1,153 @@
+# app/answer_cache.py
+import re
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from app.models import User, QueryHistory
+
+logger = logging.getLogger(__name__)
+
+# Defaults (overridable through app config)
+DEFAULT_SIMILARITY = 0.95
+DEFAULT_MAX_PER_USER = 256
+
+
+# Canonical form used for exact matching: case, spacing and trailing punctuation are ignored
+def normalize_question(question):
+    text = unicodedata.normalize('NFKC', question).casefold()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' ?!.')
+
+
+def question_hash(question):
+    return hashlib.sha256(normalize_question(question).encode('utf-8')).hexdigest()
+
+
+# Mark a user's document set as changed so previously cached answers are no longer served
+def bump_corpus_version(user_id):
+    User.query.filter_by(id=user_id).update(
+        {User.corpus_version: User.corpus_version + 1}, synchronize_session=False
+    )
+    get_answer_cache().invalidate(user_id)
+
+
+# Per-user cache of answers for repeated questions.
+# Exact matches come from QueryHistory (shared by all processes); near duplicates are found by
+# cosine similarity over the question embeddings of answers given by this process. Near-duplicate
+# matching is therefore per process: other workers, and this one after a restart, only match exactly
+# until they have answered similar questions themselves.
+class AnswerCache:
+    def __init__(self, similarity=DEFAULT_SIMILARITY, max_per_user=DEFAULT_MAX_PER_USER):
+        self.similarity = similarity
+        self.max_per_user = max_per_user
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # user_id -> (corpus_version, OrderedDict[question_hash -> entry])
+        self._entries = {}
+
+    # Return (answer, match) where match is 'exact' or 'similar', or (None, None) on a miss.
+    # embed_query is only called when there are near-duplicate candidates to compare against;
+    # if it fails the lookup is a miss rather than an error.
+    def lookup(self, user_id, corpus_version, question, embed_query=None):
+        qhash = question_hash(question)
+        record = (QueryHistory.query
+                  .filter_by(user_id=user_id, question_hash=qhash, corpus_version=corpus_version)
+                  .order_by(QueryHistory.id.desc())
+                  .first())
+        if record is not None:
+            with self._lock:
+                self.exact_hits += 1
+            return record.answer, 'exact'
+
+        match = self._lookup_similar(user_id, corpus_version, question, embed_query) if embed_query else None
+        with self._lock:
+            if match is not None:
+                self.similar_hits += 1
+                return match, 'similar'
+            self.misses += 1
+        return None, None
+
+    def _lookup_similar(self, user_id, corpus_version, question, embed_query):
+        with self._lock:
+            version, entries = self._entries.get(user_id, (None, None))
+            if version != corpus_version or not entries:
+                return None
+            candidates = list(entries.values())
+        # Entries store their question text; their embeddings come from the embedding cache and are
+        # computed outside the lock, then stored under it
+        missing = [c for c in candidates if c['vector'] is None]
+        try:
+            vectors = [_unit(embed_query(c['question'])) for c in missing]
+            query = _unit(embed_query(question))
+        except Exception as e:
+            logger.warning('Answer cache similarity lookup failed: %s', e)
+            return None
+        import numpy as np
+        with self._lock:
+            for entry, vector in zip(missing, vectors):
+                if entry['vector'] is None:
+                    entry['vector'] = vector
+            matrix = np.stack([c['vector'] for c in candidates])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity:
+            return candidates[best]['answer']
+        return None
+
+    # Remember an answer produced by the full pipeline for near-duplicate matching
+    def remember(self, user_id, corpus_version, question, answer):
+        with self._lock:
+            version, entries = self._entries.get(user_id, (None, None))
+            if version != corpus_version or entries is None:
+                entries = OrderedDict()
+                self._entries[user_id] = (corpus_version, entries)
+            entries[question_hash(question)] = {'question': question, 'answer': answer, 'vector': None}
+            entries.move_to_end(question_hash(question))
+            while len(entries) > self.max_per_user:
+                entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            hits = self.exact_hits + self.similar_hits
+            return {
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_rate': (hits / lookups) if lookups else 0.0,
+                'users': len(self._entries),
+                'similarity': self.similarity,
+            }
+
+
+def _unit(vector):
+    import numpy as np
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+# The shared answer cache for this process (created on first use, sized from app config)
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    from flask import current_app, has_app_context
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = current_app.config if has_app_context() else {}
+            _cache = AnswerCache(
+                config.get('ANSWER_CACHE_SIMILARITY', DEFAULT_SIMILARITY),
+                config.get('ANSWER_CACHE_MAX_PER_USER', DEFAULT_MAX_PER_USER)
+            )
+        return _cache
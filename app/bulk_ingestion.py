@@ -0,0 +1,279 @@
+# app/bulk_ingestion.py
+import os
+import uuid
+import logging
+import tarfile
+import zipfile
+import datetime
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.utils import secure_filename
+
+from app.extensions import db
+from app.models import IngestionJob, UploadedDocument
+from app.answer_cache import bump_corpus_version
+from app.chunking import create_chunker
+from app.ingestion import claim_values, ensure_job_monitor, parsed_document, worker_id
+from app.utils import file_content_hash, get_embeddings, index_document
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Defaults (overridable through app config)
+DEFAULT_MAX_FILES = 20000
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# Rows per IN (...) lookup when matching saved files to existing documents
+LOOKUP_BATCH = 500
+
+
+class BulkUploadError(ValueError):
+    pass
+
+
+def is_archive(name):
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+# Yield (name, readable) for each regular file in a zip or tar archive, one entry at a time.
+# Tar archives are read as a stream; zip needs a seekable file (uploads are spooled to disk).
+def iter_archive(fileobj, name):
+    if name.lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as entry:
+                        yield info.filename, entry
+        return
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, archive.extractfile(member)
+
+
+# Flatten an archive path to a safe filename ("docs/q1/report.pdf" -> "docs_q1_report.pdf");
+# None for hidden entries and macOS resource forks
+def _entry_filename(name):
+    parts = [p for p in name.replace('\\', '/').split('/') if p]
+    if not parts or parts[0] == '__MACOSX' or any(p.startswith('.') for p in parts):
+        return None
+    return secure_filename('_'.join(parts)) or None
+
+
+# Save uploaded files and archive entries into the user's upload folder, streaming each one to disk.
+# sources yields (filename, readable). Returns the saved filenames in order (a repeated name keeps the last copy).
+# Entries are staged under .partial/ and only moved into place once every one has been copied, so an upload
+# rejected partway (too many files, too many bytes) leaves the user's existing documents untouched.
+def save_entries(user_id, sources, max_files=DEFAULT_MAX_FILES, max_bytes=DEFAULT_MAX_BYTES):
+    user_dir = os.path.join('uploads', str(user_id))
+    staging = os.path.join(user_dir, '.partial')
+    os.makedirs(staging, exist_ok=True)
+    staged = {}
+    total = 0
+
+    def save(name, readable):
+        nonlocal total
+        filename = _entry_filename(name)
+        if filename is None:
+            return
+        if len(staged) >= max_files and filename not in staged:
+            raise BulkUploadError(f'Too many files (limit {max_files}).')
+        path = os.path.join(staging, f'bulk-{uuid.uuid4().hex}.part')
+        # Registered before copying so a failed copy is cleaned up with the rest
+        previous = staged.pop(filename, None)
+        staged[filename] = path
+        if previous is not None:
+            os.remove(previous)
+        with open(path, 'wb') as out:
+            while True:
+                block = readable.read(1024 * 1024)
+                if not block:
+                    break
+                total += len(block)
+                # Checked while copying so a highly compressed archive cannot fill the disk
+                if total > max_bytes:
+                    raise BulkUploadError(f'Upload exceeds {max_bytes} bytes once extracted.')
+                out.write(block)
+
+    try:
+        for name, readable in sources:
+            if is_archive(name):
+                for entry_name, entry in iter_archive(readable, name):
+                    save(entry_name, entry)
+            else:
+                save(name, readable)
+    except BaseException:
+        for path in staged.values():
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    for filename, path in staged.items():
+        os.replace(path, os.path.join(user_dir, filename))
+    return list(staged)
+
+
+# (name, open file) pairs for files, directories (walked recursively) and archives on disk, for the CLI
+def iter_local_sources(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(dirpath, name)
+                    with open(full, 'rb') as f:
+                        yield os.path.relpath(full, path), f
+        else:
+            with open(path, 'rb') as f:
+                yield os.path.basename(path), f
+
+
+# Create or refresh the UploadedDocument rows for saved files and queue one job per document.
+# Runs a handful of batched queries and a single commit however many files there are.
+def register_documents(user_id, filenames):
+    existing = {}
+    for start in range(0, len(filenames), LOOKUP_BATCH):
+        batch = filenames[start:start + LOOKUP_BATCH]
+        for doc in UploadedDocument.query.filter(UploadedDocument.user_id == user_id,
+                                                 UploadedDocument.filename.in_(batch)):
+            existing[doc.filename] = doc
+    now = datetime.datetime.utcnow()
+    documents = []
+    for filename in filenames:
+        doc = existing.get(filename)
+        if doc is None:
+            doc = UploadedDocument(filename=filename, file_type=filename.rsplit('.', 1)[-1].lower(),
+                                   user_id=user_id, upload_date=now)
+            db.session.add(doc)
+        else:
+            doc.upload_date = now
+        doc.file_size = os.path.getsize(os.path.join('uploads', str(user_id), filename))
+        documents.append(doc)
+    db.session.flush()
+    jobs = [IngestionJob(user_id=user_id, document_id=doc.id, stage_progress={}) for doc in documents]
+    db.session.add_all(jobs)
+    db.session.commit()
+    return jobs
+
+
+# Process pool task: parse and split one file, returning picklable (text, metadata) chunks
+def parse_and_split(path, content_hash, cache_dir, chunker):
+    chunks = parsed_document(path, content_hash, cache_dir=cache_dir).chunks(chunker=chunker)
+    return [(chunk.page_content, chunk.metadata) for chunk in chunks]
+
+
+def _finish(job, status, error=None):
+    job.status = status
+    job.stage = 'done' if status == 'succeeded' else job.stage
+    job.error = error
+    job.finished_at = datetime.datetime.utcnow()
+
+
+# Run queued jobs: parsing and splitting are spread over a process pool, while embedding and store
+# writes go through this thread one document at a time, in job order, so a user's collection only
+# ever has one writer. workers=0 parses inline. Returns counts of succeeded, skipped and failed jobs.
+def run_bulk_ingestion(app, job_ids, workers=None):
+    with app.app_context():
+        # Claim the jobs atomically, tagged with this run's start time so jobs claimed elsewhere are left alone
+        claimed_at = datetime.datetime.utcnow()
+        jobs = []
+        for start in range(0, len(job_ids), LOOKUP_BATCH):
+            batch = job_ids[start:start + LOOKUP_BATCH]
+            IngestionJob.query.filter(IngestionJob.id.in_(batch), IngestionJob.status == 'queued').update(
+                dict(claim_values(claimed_at), stage='load'),
+                synchronize_session=False
+            )
+            db.session.commit()
+            jobs.extend(IngestionJob.query.filter(IngestionJob.id.in_(batch), IngestionJob.status == 'running',
+                                                  IngestionJob.worker_id == worker_id(),
+                                                  IngestionJob.started_at == claimed_at))
+        jobs.sort(key=lambda job: job.id)
+        summary = {'succeeded': 0, 'skipped': 0, 'failed': 0}
+        if not jobs:
+            return summary
+        ensure_job_monitor(app)
+        cache_dir = os.path.abspath(app.config.get('PARSE_CACHE_DIR', os.path.join('instance', 'parse_cache')))
+        if workers is None:
+            workers = app.config.get('BULK_PARSE_WORKERS', os.cpu_count() or 1)
+
+        from langchain.schema import Document
+        from langchain_chroma import Chroma
+        from chromadb.config import Settings
+        embeddings = get_embeddings(app.config)
+        touched_users = set()
+
+        # Hash files up front so unchanged documents never reach the pool
+        pending = []
+        for job in jobs:
+            doc = job.document
+            if doc is None:
+                _finish(job, 'failed', 'Document no longer exists.')
+                summary['failed'] += 1
+                continue
+            path = os.path.abspath(os.path.join('uploads', str(doc.user_id), doc.filename))
+            try:
+                content_hash = file_content_hash(path)
+            except OSError as e:
+                _finish(job, 'failed', str(e))
+                summary['failed'] += 1
+                continue
+            if doc.indexed_at is not None and doc.content_hash == content_hash:
+                _finish(job, 'succeeded')
+                summary['skipped'] += 1
+                continue
+            pending.append((job, doc, path, content_hash, create_chunker(app.config, doc.filename)))
+        db.session.commit()
+
+        def write(job, doc, path, content_hash, chunks):
+            job.stage = 'embed'
+            documents = [Document(page_content=text, metadata=metadata) for text, metadata in chunks]
+            if index_document(doc, path, documents, embeddings, Chroma, Settings, content_hash=content_hash):
+                touched_users.add(doc.user_id)
+            _finish(job, 'succeeded')
+            summary['succeeded'] += 1
+
+        def fail(job, e):
+            db.session.rollback()
+            logger.error('Bulk ingestion job %s failed: %s', job.id, e)
+            job = db.session.get(IngestionJob, job.id)
+            _finish(job, 'failed', str(e))
+            summary['failed'] += 1
+
+        if workers <= 0:
+            for job, doc, path, content_hash, chunker in pending:
+                try:
+                    write(job, doc, path, content_hash, parse_and_split(path, content_hash, cache_dir, chunker))
+                except Exception as e:
+                    fail(job, e)
+                db.session.commit()
+        else:
+            # Spawned workers avoid forking a process that holds database connections and threads
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                # A bounded window keeps the pool busy without holding every parsed file in memory
+                window = deque()
+                queue = iter(pending)
+                for item in queue:
+                    window.append((item, pool.submit(parse_and_split, *item[2:4], cache_dir, item[4])))
+                    if len(window) >= workers * 4:
+                        break
+                while window:
+                    (job, doc, path, content_hash, _chunker), future = window.popleft()
+                    next_item = next(queue, None)
+                    if next_item is not None:
+                        window.append((next_item, pool.submit(parse_and_split, *next_item[2:4], cache_dir,
+                                                              next_item[4])))
+                    try:
+                        write(job, doc, path, content_hash, future.result())
+                    except Exception as e:
+                        fail(job, e)
+                    db.session.commit()
+
+        # New content can change answers; invalidate each owner's cached answers once
+        for user_id in touched_users:
+            bump_corpus_version(user_id)
+        db.session.commit()
+        logger.info('Bulk ingestion finished: %s', summary)
+        return summary
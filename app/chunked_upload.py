@@ -0,0 +1,197 @@
+# app/chunked_upload.py
+import os
+import uuid
+import hashlib
+import datetime
+import threading
+
+from sqlalchemy import func
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.utils import secure_filename
+
+from app.extensions import db
+from app.models import UploadedDocument, UploadSession
+
+# Defaults (overridable through app config)
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+DEFAULT_MAX_FILE_BYTES = 512 * 1024 * 1024
+DEFAULT_QUOTA_BYTES = 2 * 1024 ** 3
+DEFAULT_SESSION_TTL = 24 * 3600
+
+# Bytes read from the request body per write
+BLOCK_SIZE = 64 * 1024
+
+
+# Rejected upload request; status is the HTTP status to answer with
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+# Running SHA-256 per session as (offset, hasher), so appends hash only their own bytes.
+# A session resumed in another process (or after a restart) re-hashes the partial file once.
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+def partial_path(session):
+    return os.path.join('uploads', str(session.user_id), '.partial', f'{session.id}.part')
+
+
+def _hasher_at(session, offset):
+    with _hashers_lock:
+        cached = _hashers.pop(session.id, None)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    digest = hashlib.sha256()
+    remaining = offset
+    if remaining:
+        with open(partial_path(session), 'rb') as f:
+            while remaining:
+                block = f.read(min(BLOCK_SIZE * 16, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+    return digest
+
+
+# Bytes counted against a user's quota: stored documents plus space reserved by unfinished uploads
+def quota_used(user_id):
+    stored = db.session.query(func.coalesce(func.sum(UploadedDocument.file_size), 0)) \
+                       .filter(UploadedDocument.user_id == user_id).scalar()
+    reserved = db.session.query(func.coalesce(func.sum(UploadSession.size), 0)) \
+                         .filter(UploadSession.user_id == user_id, UploadSession.status == 'active').scalar()
+    return int(stored) + int(reserved)
+
+
+def check_file_size(size, config):
+    max_file = config.get('UPLOAD_MAX_FILE_BYTES', DEFAULT_MAX_FILE_BYTES)
+    if size > max_file:
+        raise UploadError(f'File is larger than the {max_file} byte limit.', 413)
+
+
+# Raise UploadError if adding size bytes would exceed the user's quota
+def check_quota(user_id, size, config, replacing=None):
+    quota = config.get('UPLOAD_QUOTA_BYTES', DEFAULT_QUOTA_BYTES)
+    used = quota_used(user_id)
+    # Re-uploading a file replaces it, so its current size is freed
+    if replacing is not None and replacing.file_size:
+        used -= replacing.file_size
+    if used + size > quota:
+        raise UploadError(f'Upload quota exceeded ({used} of {quota} bytes used).', 413)
+
+
+# Abort a user's sessions that have not received data for ttl seconds, freeing their reservations
+def expire_sessions(user_id, ttl=DEFAULT_SESSION_TTL):
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl)
+    for session in UploadSession.query.filter(UploadSession.user_id == user_id, UploadSession.status == 'active',
+                                              UploadSession.updated_at < cutoff):
+        abort_upload(session, commit=False)
+    db.session.commit()
+
+
+# Open a session for a file of the declared size; the size is reserved against the quota up front
+def start_upload(user_id, filename, size, config):
+    name = secure_filename(filename or '')
+    if not name:
+        raise UploadError('A filename is required.')
+    if not isinstance(size, int) or size < 0:
+        raise UploadError('A non-negative integer size is required.')
+    expire_sessions(user_id, config.get('UPLOAD_SESSION_TTL', DEFAULT_SESSION_TTL))
+    check_file_size(size, config)
+    existing = UploadedDocument.query.filter_by(user_id=user_id, filename=name).first()
+    check_quota(user_id, size, config, replacing=existing)
+    session = UploadSession(id=uuid.uuid4().hex, user_id=user_id, filename=name, size=size, received=0)
+    os.makedirs(os.path.dirname(partial_path(session)), exist_ok=True)
+    open(partial_path(session), 'wb').close()
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+# Append the request body at offset, reading at most BLOCK_SIZE bytes at a time.
+# Everything is validated before a byte is read. If the client disconnects midway, the bytes that
+# arrived are kept and the client resumes from the returned offset. Returns the new offset.
+def append_chunk(session, offset, stream, length, config):
+    if session.status != 'active':
+        raise UploadError(f'Upload is {session.status}.', 409, session.received)
+    if offset != session.received:
+        raise UploadError('Offset does not match the bytes received.', 409, session.received)
+    chunk_limit = config.get('UPLOAD_CHUNK_BYTES', DEFAULT_CHUNK_BYTES)
+    if length is None:
+        raise UploadError('Content-Length is required.', 411, session.received)
+    if length > chunk_limit:
+        raise UploadError(f'Chunks are limited to {chunk_limit} bytes.', 413, session.received)
+    if offset + length > session.size:
+        raise UploadError('Chunk extends past the declared file size.', 413, session.received)
+
+    digest = _hasher_at(session, offset)
+    written = 0
+    with open(partial_path(session), 'r+b') as f:
+        # Drop bytes from an earlier attempt that were written but never acknowledged
+        f.truncate(offset)
+        f.seek(offset)
+        while written < length:
+            try:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+            except (OSError, ClientDisconnected):
+                block = b''
+            if not block:
+                break
+            f.write(block)
+            digest.update(block)
+            written += len(block)
+
+    # Only one writer can advance the offset, even across processes
+    moved = UploadSession.query.filter_by(id=session.id, received=offset).update(
+        {'received': offset + written, 'updated_at': datetime.datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    db.session.refresh(session)
+    if not moved:
+        raise UploadError('Another request advanced this upload.', 409, session.received)
+    with _hashers_lock:
+        _hashers[session.id] = (session.received, digest)
+    return session.received
+
+
+# Move a fully received file into the user's uploads folder. Returns (path, sha256 hex digest).
+def complete_upload(session):
+    if session.status != 'active':
+        raise UploadError(f'Upload is {session.status}.', 409, session.received)
+    if session.received != session.size:
+        raise UploadError('Upload is incomplete.', 409, session.received)
+    content_hash = _hasher_at(session, session.received).hexdigest()
+    path = os.path.join('uploads', str(session.user_id), session.filename)
+    os.replace(partial_path(session), path)
+    session.status = 'completed'
+    session.updated_at = datetime.datetime.utcnow()
+    return path, content_hash
+
+
+def abort_upload(session, commit=True):
+    with _hashers_lock:
+        _hashers.pop(session.id, None)
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+    session.status = 'aborted'
+    session.updated_at = datetime.datetime.utcnow()
+    if commit:
+        db.session.commit()
+
+
+def session_to_dict(session, config):
+    return {
+        'id': session.id,
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.received,
+        'status': session.status,
+        'chunk_size': config.get('UPLOAD_CHUNK_BYTES', DEFAULT_CHUNK_BYTES),
+    }
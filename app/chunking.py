@@ -0,0 +1,301 @@
+# app/chunking.py
+import os
+import re
+import logging
+import functools
+
+logger = logging.getLogger(__name__)
+
+# Defaults (overridable through app config)
+DEFAULT_CHUNKER = 'recursive'
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_CHUNK_TOKENS = 256
+DEFAULT_OVERLAP_TOKENS = 32
+DEFAULT_TOKENIZER = 'estimate'
+
+# Smallest token budget a chunk may have; smaller settings are raised to it
+MIN_CHUNK_TOKENS = 16
+
+# Bump when the token chunker's boundaries change so cached chunks are recomputed
+TOKEN_CHUNKER_VERSION = 1
+
+# Boundary strengths: a chunk ends at the strongest boundary in the last part of its budget
+LINE, SENTENCE, PARAGRAPH, HEADING = 1, 2, 3, 4
+
+# Share of the token budget a chunk must hold before a weaker but later boundary is preferred to a
+# stronger one, and before a heading may start a new chunk
+MIN_FILL = 0.5
+MIN_SECTION = 0.2
+
+# Per-document-type settings; anything missing comes from CHUNK_TOKENS / CHUNK_OVERLAP_TOKENS.
+# PDF and plain-text lines are usually hard wraps inside a sentence; scraped pages put each HTML block
+# on its own line; table rows are whole records, so tables break between rows and need no overlap.
+PROFILES = {
+    'default': {'line_strength': LINE},
+    'pdf': {'line_strength': LINE},
+    'markdown': {'line_strength': LINE},
+    'web': {'line_strength': PARAGRAPH},
+    'table': {'line_strength': PARAGRAPH, 'overlap_tokens': 0},
+}
+PROFILE_TYPES = {
+    'pdf': 'pdf',
+    'md': 'markdown', 'markdown': 'markdown', 'rst': 'markdown',
+    'html': 'web', 'htm': 'web',
+    'csv': 'table', 'tsv': 'table', 'xls': 'table', 'xlsx': 'table',
+}
+
+# A line that opens a section: a Markdown heading, a numbered heading ("2.1 Scope") or a short all-caps line
+_HEADING_RE = re.compile(
+    r'#{1,6}[ \t]|(?=[^\n]{1,100}$)(?![^\n]*[.;,:!?]$)(?:\d+(?:\.\d+)*\.?[ \t]+[A-Z]|[A-Z][A-Z0-9 \t&/-]{2,}$)',
+    re.M
+)
+
+
+# Profile for a file: scraped pages are 'web', otherwise chosen by extension
+def profile_name(filename=None):
+    if not filename:
+        return 'default'
+    base = os.path.basename(filename).lower()
+    if base.startswith('scraped_'):
+        return 'web'
+    return PROFILE_TYPES.get(base.rsplit('.', 1)[-1], 'default') if '.' in base else 'default'
+
+
+# Token estimate for text[start:end] without copying it: the larger of ~4 characters per token and
+# ~4 tokens per 3 words, which tracks BPE tokenizers on prose and on dense text such as numbers or code
+def estimate_tokens(text, start=0, end=None):
+    end = len(text) if end is None else end
+    if end <= start:
+        return 0
+    words = text.count(' ', start, end) + text.count('\n', start, end) + 1
+    return max((end - start + 3) // 4, words + words // 3)
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(name):
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+# The tokenizer actually usable for name: a tiktoken encoding if it loads (encodings are downloaded on
+# first use), otherwise 'estimate'. Resolved once per process, so a failed download is not retried per call.
+@functools.lru_cache(maxsize=None)
+def resolve_tokenizer(name=None):
+    name = name or DEFAULT_TOKENIZER
+    if name == 'estimate':
+        return name
+    try:
+        _encoding(name)
+    except Exception as e:
+        logger.warning('Tokenizer %s unavailable (%s); estimating token counts instead.', name, e)
+        return 'estimate'
+    return name
+
+
+# count(text, start, end): the estimate counts in place; a tiktoken encoding has to encode a copy of the slice
+def token_counter(name):
+    if name == 'estimate':
+        return estimate_tokens
+    encode = _encoding(name).encode_ordinary
+    return lambda text, start=0, end=None: len(encode(text[start:end]))
+
+
+# The original splitter: LangChain's RecursiveCharacterTextSplitter measured in characters.
+# Chunks are located in the text so they can be stored as offsets; text the splitter changed is kept verbatim.
+class RecursiveChunker:
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    @property
+    def key(self):
+        return f'{self.chunk_size}:{self.chunk_overlap}'
+
+    # (start, end) for each chunk of text, or the chunk text itself when it is not a slice of text
+    def spans(self, text):
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        offset = 0
+        for chunk in splitter.split_text(text):
+            start = text.find(chunk, offset)
+            if start < 0:
+                yield chunk
+                continue
+            yield start, start + len(chunk)
+            offset = start + 1
+
+
+# Token-budgeted chunks that end at sentence, paragraph or heading boundaries. Only offsets are produced:
+# each chunk sizes a window of about chunk_tokens (at least MIN_CHUNK_TOKENS) from its start, then ends at
+# the strongest boundary in the back half of that window, found by searching backwards from the window's
+# end, so the text is read about once. The default estimate counts tokens in place; a tiktoken tokenizer
+# encodes a copy of each window it sizes. A heading past the first MIN_SECTION of the window starts a new
+# chunk, and the next chunk repeats up to overlap_tokens of whole sentences.
+class TokenChunker:
+    def __init__(self, chunk_tokens=DEFAULT_CHUNK_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                 line_strength=LINE, tokenizer=DEFAULT_TOKENIZER):
+        self.chunk_tokens = max(MIN_CHUNK_TOKENS, int(chunk_tokens))
+        self.overlap_tokens = max(0, min(int(overlap_tokens), self.chunk_tokens // 2))
+        self.line_strength = int(line_strength)
+        self.tokenizer = tokenizer
+
+    @property
+    def key(self):
+        return (f'token{TOKEN_CHUNKER_VERSION}:{self.tokenizer}:{self.chunk_tokens}:'
+                f'{self.overlap_tokens}:{self.line_strength}')
+
+    def spans(self, text):
+        count = token_counter(self.tokenizer)
+        # Boundary finders, strongest first; each returns the last (content end, next start) in a range
+        finders = sorted([(PARAGRAPH, _paragraph_end), (SENTENCE, _sentence_end), (self.line_strength, _line_end)],
+                         key=lambda f: -f[0])
+        stop = len(text)
+        while stop > 0 and text[stop - 1].isspace():
+            stop -= 1
+        pos = _skip_space(text, 0, stop)
+        while pos < stop:
+            end = self._window(text, pos, stop, count)
+            cut, resume, overlap = self._cut(text, pos, end, stop, finders)
+            yield pos, cut
+            start = self._overlap_start(text, pos, cut, count) if overlap else None
+            pos = _skip_space(text, start if start is not None else resume, stop)
+
+    # The furthest end with count(text, pos, end) <= chunk_tokens
+    def _window(self, text, pos, stop, count):
+        limit = self.chunk_tokens
+        end = min(stop, pos + 4 * limit)
+        tokens = count(text, pos, end)
+        # Tokenizers can fit more than 4 characters in a token: grow in proportion while well under budget
+        while end < stop and tokens < 0.9 * limit:
+            end = min(stop, max(end + 1, pos + (end - pos) * limit // max(tokens, 1)))
+            tokens = count(text, pos, end)
+        while tokens > limit:
+            end = pos + (end - pos) * limit // tokens
+            tokens = count(text, pos, end)
+        return end
+
+    # Where the chunk from pos ends: (content end, next start, whether the next chunk overlaps it)
+    def _cut(self, text, pos, end, stop, finders):
+        span = end - pos
+        # Where lines are hard wraps, only a blank line can precede a heading
+        heading = _section_start(text, pos + int(span * MIN_SECTION), end,
+                                 '\n' if self.line_strength >= PARAGRAPH else '\n\n')
+        if heading is not None:
+            return heading + (False,)
+        if end >= stop:
+            return stop, stop, False
+        low = pos + int(span * MIN_FILL)
+        for _strength, finder in finders:
+            found = finder(text, low, end)
+            if found is not None:
+                return found + (True,)
+        # No boundary in reach: cut at the last space, or mid-word in text without spaces
+        space = text.rfind(' ', pos + span // 2, end)
+        cut = space if space > pos else end
+        return cut, cut, True
+
+    # The earliest sentence start in the last overlap_tokens before cut whose tail fits, or None
+    def _overlap_start(self, text, pos, cut, count):
+        if not self.overlap_tokens:
+            return None
+        # At ~4 characters per token nothing earlier fits
+        low = max(pos + 1, cut - 4 * self.overlap_tokens)
+        while True:
+            found = _sentence_start(text, low, cut)
+            if found is None:
+                return None
+            if count(text, found, cut) <= self.overlap_tokens:
+                return found
+            low = found
+
+
+_SPACE_RE = re.compile(r'\s*')
+
+
+def _skip_space(text, pos, stop):
+    return min(_SPACE_RE.match(text, pos).end(), stop) if pos < stop and text[pos].isspace() else pos
+
+
+# The first break (sep) in [low, end) followed by a heading line, as (content end, heading start)
+def _section_start(text, low, end, sep):
+    i = text.find(sep, low, end)
+    while i >= 0:
+        start = _skip_space(text, i, len(text))
+        # Headings are short lines; most candidates fail this before the pattern is tried
+        line_end = text.find('\n', start, start + 101)
+        if (line_end >= 0 or len(text) - start <= 100) and _HEADING_RE.match(text, start):
+            return i, start
+        i = text.find(sep, start, end)
+    return None
+
+
+def _paragraph_end(text, low, end):
+    i = text.rfind('\n\n', low, end)
+    return None if i < 0 else (i, i + 2)
+
+
+def _line_end(text, low, end):
+    i = text.rfind('\n', low, end)
+    return None if i < 0 else (i, i + 1)
+
+
+def _starts_sentence(text, i):
+    return i < len(text) and (text[i].isupper() or text[i].isdigit() or text[i] in '"\'([')
+
+
+# The first sentence start after a ". ", "? " or "! " in [low, end), or None
+def _sentence_start(text, low, end):
+    while True:
+        found = [i for i in (text.find('. ', low, end), text.find('? ', low, end), text.find('! ', low, end))
+                 if i >= 0]
+        if not found:
+            return None
+        start = _skip_space(text, min(found) + 1, end)
+        if start < end and _starts_sentence(text, start):
+            return start
+        low = min(found) + 1
+
+
+# The last ". ", "? " or "! " in [low, end) that is followed by the start of a sentence
+def _sentence_end(text, low, end):
+    while True:
+        i = text.rfind('. ', low, end)
+        # Only the stretch after the last full stop can hold a later ? or !
+        i = max(i, text.rfind('? ', max(i, low), end), text.rfind('! ', max(i, low), end))
+        if i < 0:
+            return None
+        start = _skip_space(text, i + 1, len(text))
+        if _starts_sentence(text, start):
+            return i + 1, start
+        end = i
+
+
+def chunker_names():
+    return ['recursive', 'token']
+
+
+# Profile settings for name with CHUNK_PROFILES overrides applied
+def profile_settings(name, config=None):
+    config = config or {}
+    settings = {
+        'chunk_tokens': config.get('CHUNK_TOKENS') or DEFAULT_CHUNK_TOKENS,
+        'overlap_tokens': config.get('CHUNK_OVERLAP_TOKENS', DEFAULT_OVERLAP_TOKENS),
+        'line_strength': LINE,
+    }
+    settings.update(PROFILES.get(name, PROFILES['default']))
+    settings.update((config.get('CHUNK_PROFILES') or {}).get(name, {}))
+    return settings
+
+
+# The configured chunker for a file (its name picks the profile); raises ValueError for unknown names
+def create_chunker(config=None, filename=None):
+    config = config or {}
+    name = (config.get('CHUNKER') or DEFAULT_CHUNKER).lower()
+    if name == 'recursive':
+        return RecursiveChunker(config.get('CHUNK_SIZE') or DEFAULT_CHUNK_SIZE,
+                                config.get('CHUNK_OVERLAP', DEFAULT_CHUNK_OVERLAP))
+    if name != 'token':
+        raise ValueError(f"Unknown CHUNKER {name!r}; expected one of {', '.join(chunker_names())}.")
+    return TokenChunker(tokenizer=resolve_tokenizer(config.get('CHUNK_TOKENIZER')),
+                        **profile_settings(profile_name(filename), config))
@@ -1,6 +1,7 @@
 # app/config.py
 from pathlib import Path
 import os
+import json
 from dotenv import load_dotenv
 
 # Determine base directory (project root)
@@ -38,4 +39,125 @@ class Config:
 
     # External API keys
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-    ADMIN_SECRET_CODE = os.getenv("ADMIN_SECRET_CODE", "")
\ No newline at end of file
+    # Optional OpenAI-compatible endpoint (proxy, local server); empty means api.openai.com
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+    # Chat model used to answer questions
+    QA_MODEL = os.getenv("QA_MODEL") or "gpt-4o-mini"
+    ADMIN_SECRET_CODE = os.getenv("ADMIN_SECRET_CODE", "")
+
+    # Embeddings and the on-disk embedding cache (keyed by model + SHA-256 of chunk text).
+    # EMBEDDING_PROVIDER is "openai" or "local" (offline CPU hashing vectors of LOCAL_EMBEDDING_DIM dimensions)
+    EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER") or "openai"
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or "text-embedding-ada-002"
+    LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM") or 384)
+    # Shortened OpenAI vectors (text-embedding-3 models only); empty keeps the model's full size
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS") or 0) or None
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or str(INSTANCE_DIR / "embedding_cache.sqlite3")
+    EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES") or 512 * 1024 * 1024)
+
+    # Parsed-document cache: extracted text and chunk boundaries per file hash and loader version
+    PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR") or str(INSTANCE_DIR / "parse_cache")
+
+    # Ingestion embedding scheduler: concurrent batches, token budget per batch, retries on 429
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY") or 4)
+    EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS") or 8000)
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE") or 64)
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES") or 6)
+
+    # Vector store engine: "chroma", or "mmap" (vectors in a memory-mapped float32/float16 file, searched
+    # exactly up to VECTOR_ENGINE_HNSW_THRESHOLD chunks and through an HNSW graph beyond that)
+    VECTOR_ENGINE = os.getenv("VECTOR_ENGINE") or "chroma"
+    VECTOR_ENGINE_DTYPE = os.getenv("VECTOR_ENGINE_DTYPE") or "float32"
+    VECTOR_ENGINE_HNSW_THRESHOLD = int(os.getenv("VECTOR_ENGINE_HNSW_THRESHOLD") or 20000)
+    # mmap engine quantization for new collections: "none", "int8" (4x smaller scan) or "pq" (product
+    # quantization, one byte per VECTOR_PQ_SUBVECTOR_DIMS dimensions). Codes are trained once a collection
+    # holds VECTOR_QUANTIZATION_TRAIN_MIN chunks; the best k * VECTOR_RESCORE_FACTOR are re-scored exactly.
+    VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION") or "none"
+    VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR") or 10)
+    VECTOR_QUANTIZATION_TRAIN_MIN = int(os.getenv("VECTOR_QUANTIZATION_TRAIN_MIN") or 1024)
+    VECTOR_PQ_SUBVECTOR_DIMS = int(os.getenv("VECTOR_PQ_SUBVECTOR_DIMS") or 16)
+
+    # Open per-user vector store and BM25 index handles kept per process (LRU by count and estimated bytes)
+    VECTORSTORE_POOL_MAX_HANDLES = int(os.getenv("VECTORSTORE_POOL_MAX_HANDLES") or 32)
+    VECTORSTORE_POOL_MAX_BYTES = int(os.getenv("VECTORSTORE_POOL_MAX_BYTES") or 1024 * 1024 * 1024)
+
+    # Chunking: "recursive" splits by characters (CHUNK_SIZE / CHUNK_OVERLAP); "token" counts CHUNK_TOKENS /
+    # CHUNK_OVERLAP_TOKENS with CHUNK_TOKENIZER ("estimate" or a tiktoken encoding such as cl100k_base) and
+    # ends chunks at sentence, paragraph and heading boundaries, with per-document-type profiles.
+    # CHUNK_TOKENS below 16 is raised to 16
+    CHUNKER = os.getenv("CHUNKER") or "recursive"
+    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE") or 1000)
+    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP") or 200)
+    CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS") or 256)
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS") or 32)
+    CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER") or "estimate"
+    # Per-profile overrides (default, pdf, markdown, web, table) as JSON, e.g. {"pdf": {"chunk_tokens": 384}}
+    CHUNK_PROFILES = json.loads(os.getenv("CHUNK_PROFILES") or "{}")
+
+    # Retrieval: "hybrid" fuses vector and BM25 rankings (reciprocal rank fusion), or "vector" / "lexical"
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE") or "hybrid"
+    RETRIEVAL_K = int(os.getenv("RETRIEVAL_K") or 3)
+    # Candidates taken from each ranking before fusion, and the RRF damping constant
+    RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K") or 20)
+    RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K") or 60)
+    # Reranking of the top RERANK_CANDIDATES fused chunks down to RETRIEVAL_K: "none", "mmr"
+    # (diversity over the stored vectors, weighted by RERANK_MMR_LAMBDA) or "overlap" (term/phrase cross-scorer)
+    RERANKER = os.getenv("RERANKER") or "none"
+    RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES") or 10)
+    RERANK_MMR_LAMBDA = float(os.getenv("RERANK_MMR_LAMBDA") or 0.7)
+    # Prompt context: overlapping chunks of a document are merged, near-duplicate passages (sharing
+    # CONTEXT_DUPLICATE_THRESHOLD of their word shingles) dropped, and the rest kept in ranked order within
+    # CONTEXT_MAX_TOKENS (0 for no limit, else at least 16), counted with CONTEXT_TOKENIZER ("estimate" or a
+    # tiktoken encoding)
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS") or 3000)
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD") or 0.8)
+    CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER") or "estimate"
+
+    # Documents and questions rendered per dashboard page (older pages load on scroll)
+    DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE") or 50)
+
+    # last_activity is recorded at most once per user per ACTIVITY_TOUCH_SECONDS and written in
+    # batches every ACTIVITY_FLUSH_SECONDS (0 disables the background writer)
+    ACTIVITY_TOUCH_SECONDS = int(os.getenv("ACTIVITY_TOUCH_SECONDS") or 60)
+    ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS") or 10)
+
+    # Users per page in the admin user lookup
+    ADMIN_LOOKUP_PAGE_SIZE = int(os.getenv("ADMIN_LOOKUP_PAGE_SIZE") or 25)
+
+    # Answer cache for repeated questions (exact and near-duplicate by cosine similarity)
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "True").lower() in ("true", "1", "yes")
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY") or 0.95)
+    ANSWER_CACHE_MAX_PER_USER = int(os.getenv("ANSWER_CACHE_MAX_PER_USER") or 256)
+
+    # Background ingestion: worker pool size caps concurrent ingestions per process
+    INGESTION_MAX_WORKERS = int(os.getenv("INGESTION_MAX_WORKERS") or 2)
+    # Processes refresh a heartbeat on the jobs they run every INGESTION_HEARTBEAT_SECONDS and sweep for
+    # interrupted jobs at the same pace; a running job whose owner has exited, or whose heartbeat is older
+    # than INGESTION_STALE_SECONDS, is re-queued
+    INGESTION_HEARTBEAT_SECONDS = int(os.getenv("INGESTION_HEARTBEAT_SECONDS") or 30)
+    INGESTION_STALE_SECONDS = int(os.getenv("INGESTION_STALE_SECONDS") or 300)
+    # Run jobs inline in the request instead of on the worker pool (used by tests)
+    INGESTION_EAGER = os.getenv("INGESTION_EAGER", "False").lower() in ("true", "1", "yes")
+
+    # Bulk uploads: parser processes (one per CPU by default, 0 parses inline) and limits on
+    # extracted files and bytes
+    BULK_PARSE_WORKERS = int(os.getenv("BULK_PARSE_WORKERS") or os.cpu_count() or 1)
+    BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES") or 20000)
+    BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES") or 2 * 1024 ** 3)
+
+    # Uploads: per-user quota, largest single file, largest chunk per request and how long an
+    # unfinished chunked upload keeps its reservation (bytes, bytes, bytes, seconds)
+    UPLOAD_QUOTA_BYTES = int(os.getenv("UPLOAD_QUOTA_BYTES") or 2 * 1024 ** 3)
+    UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES") or 512 * 1024 ** 2)
+    UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES") or 8 * 1024 ** 2)
+    UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL") or 24 * 3600)
+
+    # Site crawls: page and link-depth limits, concurrent connections in total and per host,
+    # per-request timeout (seconds), the User-Agent matched against robots.txt and the largest page read
+    CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES") or 100)
+    CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH") or 2)
+    CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY") or 8)
+    CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST") or 4)
+    CRAWL_TIMEOUT = int(os.getenv("CRAWL_TIMEOUT") or 15)
+    CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT") or "MyRAGApp/1.0"
+    CRAWL_MAX_PAGE_BYTES = int(os.getenv("CRAWL_MAX_PAGE_BYTES") or 5 * 1024 ** 2)
@@ -0,0 +1,146 @@
+# app/context_budget.py
+import re
+
+from langchain.schema import Document
+
+from app.chunking import MIN_CHUNK_TOKENS, TokenChunker, resolve_tokenizer, token_counter
+
+# Defaults (overridable through app config)
+DEFAULT_MAX_TOKENS = 3000
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+DEFAULT_TOKENIZER = 'estimate'
+
+# Words per shingle when comparing passages for near-duplicates
+SHINGLE_WORDS = 3
+
+# Chunks of the same element this many characters apart (the whitespace a chunker drops) are adjacent
+MERGE_GAP = 2
+
+# Tokens taken by the blank line between two passages in the prompt
+SEPARATOR_TOKENS = 1
+
+_WORD_RE = re.compile(r'\w+')
+
+
+# Shingle hashes of a passage; passages too short for one shingle use their words
+def _shingles(text):
+    words = _WORD_RE.findall(text.casefold())
+    if len(words) < SHINGLE_WORDS:
+        return {hash(w) for w in words}
+    return {hash(tuple(words[i:i + SHINGLE_WORDS])) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+# Chunks of the same parsed element share all their metadata except start_index, so their offsets compare
+def _element_key(doc):
+    md = doc.metadata or {}
+    if not isinstance(md.get('start_index'), int):
+        return None
+    return tuple(sorted((k, repr(v)) for k, v in md.items() if k != 'start_index'))
+
+
+# Join retrieved chunks of the same element that overlap or touch into one passage, placed at the rank
+# of its best-ranked chunk. Chunks whose shared text does not match (not verbatim slices) are left alone.
+def merge_overlapping(docs):
+    groups = {}
+    for rank, doc in enumerate(docs):
+        key = _element_key(doc)
+        groups.setdefault(key if key is not None else ('rank', rank), []).append((rank, doc))
+
+    passages = []
+    for key, members in groups.items():
+        if key[0] == 'rank' or len(members) == 1:
+            passages.extend(members)
+            continue
+        members.sort(key=lambda m: m[1].metadata['start_index'])
+        rank, current = members[0]
+        start, text = current.metadata['start_index'], current.page_content
+        for next_rank, doc in members[1:]:
+            next_text = doc.page_content
+            offset = doc.metadata['start_index'] - start
+            shared = text[offset:offset + len(next_text)]
+            if offset <= len(text) + MERGE_GAP and next_text.startswith(shared):
+                if offset + len(next_text) > len(text):
+                    text += ('\n' if offset > len(text) else '') + next_text[max(len(text) - offset, 0):]
+                rank = min(rank, next_rank)
+                continue
+            passages.append((rank, _passage(current, start, text)))
+            rank, current, start, text = next_rank, doc, doc.metadata['start_index'], next_text
+        passages.append((rank, _passage(current, start, text)))
+    return [doc for _rank, doc in sorted(passages, key=lambda p: p[0])]
+
+
+def _passage(doc, start, text):
+    if text == doc.page_content:
+        return doc
+    return Document(page_content=text, metadata=dict(doc.metadata, start_index=start), id=doc.id)
+
+
+# Drop passages whose shingles are mostly (threshold) contained in a better-ranked passage, or that
+# mostly contain one: the same boilerplate in two files, or one passage quoting another
+def drop_near_duplicates(docs, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    kept, seen = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if shingles and any(len(shingles & other) >= threshold * min(len(shingles), len(other))
+                            for other in seen):
+            continue
+        kept.append(doc)
+        seen.append(shingles)
+    return kept
+
+
+# Prompt context for a question: overlapping chunks merged, near-duplicates dropped, then passages added
+# in ranked order while they fit max_tokens (0 for no limit, else at least MIN_CHUNK_TOKENS). A passage
+# that does not fit is skipped so a shorter one further down can still be used; if even the first does not
+# fit, it is cut to the budget. stats reports what each step did to the last set of documents.
+class ContextBudget:
+    def __init__(self, max_tokens=DEFAULT_MAX_TOKENS, duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD,
+                 tokenizer=DEFAULT_TOKENIZER):
+        self.max_tokens = max(MIN_CHUNK_TOKENS, int(max_tokens)) if int(max_tokens) > 0 else 0
+        self.duplicate_threshold = duplicate_threshold
+        self.tokenizer = resolve_tokenizer(tokenizer)
+        self.count = token_counter(self.tokenizer)
+        self.stats = {}
+
+    def assemble(self, docs):
+        merged = merge_overlapping(docs)
+        unique = drop_near_duplicates(merged, self.duplicate_threshold)
+        kept, tokens = [], 0
+        for doc in unique:
+            size = self.count(doc.page_content) + (SEPARATOR_TOKENS if kept else 0)
+            if self.max_tokens and tokens + size > self.max_tokens:
+                continue
+            kept.append(doc)
+            tokens += size
+        if unique and not kept:
+            kept = [self._truncated(unique[0])]
+            tokens = self.count(kept[0].page_content)
+        self.stats = {
+            'chunks': len(docs),
+            'merged': len(docs) - len(merged),
+            'duplicates': len(merged) - len(unique),
+            'over_budget': len(unique) - len(kept),
+            'passages': len(kept),
+            'tokens': tokens,
+        }
+        return kept
+
+    def _truncated(self, doc):
+        chunker = TokenChunker(self.max_tokens, 0, tokenizer=self.tokenizer)
+        start, end = next(iter(chunker.spans(doc.page_content)))
+        return Document(page_content=doc.page_content[start:end], metadata=doc.metadata, id=doc.id)
+
+
+# Counts tokens the way the context budget does, for reporting prompt and completion sizes
+def create_token_counter(config):
+    return token_counter(resolve_tokenizer(config.get('CONTEXT_TOKENIZER') or DEFAULT_TOKENIZER))
+
+
+# The configured context budget; CONTEXT_MAX_TOKENS of 0 still merges and de-duplicates but sets no limit,
+# and a positive budget below MIN_CHUNK_TOKENS (16) is raised to it
+def create_context_budget(config):
+    return ContextBudget(
+        max_tokens=config.get('CONTEXT_MAX_TOKENS', DEFAULT_MAX_TOKENS),
+        duplicate_threshold=config.get('CONTEXT_DUPLICATE_THRESHOLD', DEFAULT_DUPLICATE_THRESHOLD),
+        tokenizer=config.get('CONTEXT_TOKENIZER') or DEFAULT_TOKENIZER,
+    )
@@ -0,0 +1,320 @@
+# app/crawler.py
+import os
+import asyncio
+import hashlib
+import logging
+import datetime
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from urllib import robotparser
+from urllib.parse import urljoin, urldefrag, urlsplit
+
+from app.extensions import db
+from app.models import CrawledPage
+
+logger = logging.getLogger(__name__)
+
+# Defaults (overridable through app config)
+DEFAULT_MAX_PAGES = 100
+DEFAULT_MAX_DEPTH = 2
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PER_HOST = 4
+DEFAULT_TIMEOUT = 15
+DEFAULT_MAX_PAGE_BYTES = 5 * 1024 * 1024
+DEFAULT_USER_AGENT = 'MyRAGApp/1.0'
+
+# Elements whose text is page chrome rather than content
+SKIP_TAGS = ('script', 'style', 'noscript', 'template', 'svg', 'nav', 'header', 'footer', 'aside', 'form')
+
+# Outcome of fetching one URL. status is 'changed' (200 with text), 'not_modified' (304),
+# 'blocked' (robots.txt), 'skipped' (not HTML, no text, over the size limit or redirected off the site)
+# or 'failed'.
+PageResult = namedtuple('PageResult', 'url status code text etag last_modified error')
+
+
+# Visible text of an HTML page, one block per line, without scripts, navigation and other chrome
+def extract_text(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    for tag in soup(SKIP_TAGS):
+        tag.decompose()
+    root = soup.body or soup
+    lines = (line.strip() for line in root.get_text('\n').splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+# Absolute http(s) links on a page, without fragments
+def extract_links(html, base_url):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    base = soup.find('base', href=True)
+    if base is not None:
+        base_url = urljoin(base_url, base['href'])
+    links = []
+    for a in soup.find_all('a', href=True):
+        url = normalize_url(urljoin(base_url, a['href']))
+        if url is not None:
+            links.append(url)
+    return links
+
+
+# Canonical form used to de-duplicate URLs; None for anything that is not http(s)
+def normalize_url(url):
+    url, _fragment = urldefrag(url.strip())
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        return None
+    return parts._replace(netloc=parts.netloc.lower(), path=parts.path or '/').geturl()
+
+
+# Stable upload filename for a page, so a re-crawl replaces the same document
+def page_filename(url):
+    host = urlsplit(url).hostname or 'site'
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+    return f"scraped_{host.replace('.', '_')}_{digest}.txt"
+
+
+# <loc> entries of a sitemap or sitemap index; None if the body is not a sitemap
+def parse_sitemap(body):
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError:
+        return None
+    kind = root.tag.rsplit('}', 1)[-1]
+    if kind not in ('urlset', 'sitemapindex'):
+        return None
+    return [el.text.strip() for el in root.iter() if el.tag.rsplit('}', 1)[-1] == 'loc' and el.text]
+
+
+# Breadth-first crawler over one site. All requests share a single pooled aiohttp session, with at
+# most `concurrency` connections open and at most `per_host` to any one host. Known pages are
+# re-fetched with If-None-Match / If-Modified-Since so unchanged pages cost a 304 and no parsing.
+# Redirects are followed only within the seed's host, and bodies over max_page_bytes are not read.
+class Crawler:
+    def __init__(self, max_pages=DEFAULT_MAX_PAGES, max_depth=DEFAULT_MAX_DEPTH, concurrency=DEFAULT_CONCURRENCY,
+                 per_host=DEFAULT_PER_HOST, timeout=DEFAULT_TIMEOUT, user_agent=DEFAULT_USER_AGENT,
+                 max_page_bytes=DEFAULT_MAX_PAGE_BYTES):
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_page_bytes = max_page_bytes
+        self._robots = {}
+        self._robots_lock = None
+
+    # Crawl from seed (a page or a sitemap) and return a PageResult per fetched page.
+    # validators maps url -> (etag, last_modified) from an earlier crawl; revisit lists pages found
+    # by that crawl, which are queued again since a 304 response carries no links to rediscover them.
+    def run(self, seed, validators=None, revisit=()):
+        return asyncio.run(self.crawl(seed, validators, revisit))
+
+    async def crawl(self, seed, validators=None, revisit=()):
+        import aiohttp
+        seed = normalize_url(seed)
+        if seed is None:
+            raise ValueError('Only http(s) URLs can be crawled.')
+        validators = validators or {}
+        host = urlsplit(seed).netloc
+        self._robots = {}
+        self._robots_lock = asyncio.Lock()
+
+        seen = set()
+        queue = asyncio.Queue()
+        results = []
+
+        def enqueue(url, depth):
+            url = normalize_url(url)
+            if url is None or url in seen or urlsplit(url).netloc != host:
+                return
+            if len(seen) >= self.max_pages:
+                return
+            seen.add(url)
+            queue.put_nowait((url, depth))
+
+        enqueue(seed, 0)
+        for url in revisit:
+            enqueue(url, self.max_depth)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers={'User-Agent': self.user_agent}) as session:
+            async def worker():
+                while True:
+                    url, depth = await queue.get()
+                    try:
+                        result, links = await self._visit(session, url, depth, validators.get(url))
+                        if result is not None:
+                            results.append(result)
+                        # Sitemap entries are crawled as if they were the seed itself
+                        for link, link_depth in links:
+                            if link_depth is None and depth < self.max_depth:
+                                enqueue(link, depth + 1)
+                            elif link_depth is not None:
+                                enqueue(link, link_depth)
+                    except Exception as e:
+                        logger.warning('Crawl of %s failed: %s', url, e)
+                        results.append(PageResult(url, 'failed', None, None, None, None, str(e)))
+                    finally:
+                        queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        return results
+
+    # robots.txt for the URL's origin, fetched once per crawl through the shared session
+    async def _allowed(self, session, url):
+        parts = urlsplit(url)
+        origin = f'{parts.scheme}://{parts.netloc}'
+        async with self._robots_lock:
+            parser = self._robots.get(origin)
+            if parser is None:
+                parser = await self._fetch_robots(session, origin)
+                self._robots[origin] = parser
+        return parser.can_fetch(self.user_agent, url)
+
+    async def _fetch_robots(self, session, origin):
+        parser = robotparser.RobotFileParser()
+        try:
+            async with session.get(origin + '/robots.txt') as resp:
+                if resp.status in (401, 403):
+                    parser.disallow_all = True
+                elif resp.status < 400:
+                    parser.parse((await resp.text(errors='replace')).splitlines())
+                else:
+                    parser.allow_all = True
+        except Exception as e:
+            logger.info('No robots.txt for %s: %s', origin, e)
+            parser.allow_all = True
+        return parser
+
+    # Fetch one URL. Returns (PageResult or None, [(link, depth or None)]).
+    async def _visit(self, session, url, depth, known):
+        if not await self._allowed(session, url):
+            return PageResult(url, 'blocked', None, None, None, None, None), []
+        headers = {}
+        if known:
+            etag, last_modified = known
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        async with session.get(url, headers=headers, allow_redirects=False) as resp:
+            etag = resp.headers.get('ETag')
+            last_modified = resp.headers.get('Last-Modified')
+            if resp.status == 304:
+                return PageResult(url, 'not_modified', 304, None, etag, last_modified, None), []
+            if resp.status >= 400:
+                return PageResult(url, 'failed', resp.status, None, None, None, f'HTTP {resp.status}'), []
+            # The target of a redirect is queued like a link at the same depth, so it passes the host check
+            if 300 <= resp.status < 400:
+                target = normalize_url(urljoin(url, resp.headers.get('Location', '')))
+                if target is None or urlsplit(target).netloc != urlsplit(url).netloc:
+                    return PageResult(url, 'skipped', resp.status, None, None, None, 'redirected off the site'), []
+                return None, [(target, depth)]
+            too_large = PageResult(url, 'skipped', resp.status, None, None, None,
+                                   f'larger than {self.max_page_bytes} bytes')
+            if (resp.content_length or 0) > self.max_page_bytes:
+                return too_large, []
+            content_type = resp.content_type or ''
+            raw = await resp.content.read(self.max_page_bytes + 1)
+            if len(raw) > self.max_page_bytes:
+                return too_large, []
+            try:
+                body = raw.decode(resp.charset or 'utf-8', errors='replace')
+            except LookupError:
+                body = raw.decode('utf-8', errors='replace')
+        if 'xml' in content_type or url.endswith('.xml'):
+            locs = parse_sitemap(body)
+            if locs is not None:
+                # Nested sitemaps keep depth 0; pages listed in a sitemap start at depth 0 as well
+                return None, [(loc, 0) for loc in locs]
+        if 'html' not in content_type:
+            return PageResult(url, 'skipped', resp.status, None, etag, last_modified, None), []
+        links = [(link, None) for link in extract_links(body, url)]
+        text = extract_text(body)
+        if not text:
+            return PageResult(url, 'skipped', resp.status, None, etag, last_modified, None), links
+        return PageResult(url, 'changed', resp.status, text, etag, last_modified, None), links
+
+
+def crawler_from_config(config, max_pages=None, max_depth=None):
+    return Crawler(
+        max_pages=max_pages or config.get('CRAWL_MAX_PAGES', DEFAULT_MAX_PAGES),
+        max_depth=max_depth if max_depth is not None else config.get('CRAWL_MAX_DEPTH', DEFAULT_MAX_DEPTH),
+        concurrency=config.get('CRAWL_CONCURRENCY', DEFAULT_CONCURRENCY),
+        per_host=config.get('CRAWL_PER_HOST', DEFAULT_PER_HOST),
+        timeout=config.get('CRAWL_TIMEOUT', DEFAULT_TIMEOUT),
+        user_agent=config.get('CRAWL_USER_AGENT', DEFAULT_USER_AGENT),
+        max_page_bytes=config.get('CRAWL_MAX_PAGE_BYTES', DEFAULT_MAX_PAGE_BYTES),
+    )
+
+
+# Crawl a site for a user and index only the pages whose text changed since the last crawl.
+# Changed pages are written to stable filenames and go through one bulk ingestion run.
+# Returns counts per page outcome plus the bulk ingestion summary.
+def run_crawl(app, user_id, seed, max_pages=None, max_depth=None):
+    from app.bulk_ingestion import register_documents, run_bulk_ingestion
+    with app.app_context():
+        pages = {page.url: page for page in CrawledPage.query.filter_by(user_id=user_id)}
+        seed_url = normalize_url(seed) or seed
+        revisit = [page.url for page in pages.values() if page.seed_url == seed_url]
+        validators = {url: (page.etag, page.last_modified) for url, page in pages.items()}
+
+        results = crawler_from_config(app.config, max_pages, max_depth).run(seed, validators, revisit)
+
+        counts = {'changed': 0, 'unchanged': 0, 'not_modified': 0, 'blocked': 0, 'skipped': 0, 'failed': 0}
+        user_dir = os.path.join('uploads', str(user_id))
+        os.makedirs(user_dir, exist_ok=True)
+        now = datetime.datetime.utcnow()
+        changed = {}
+        for result in results:
+            page = pages.get(result.url)
+            if page is None:
+                if result.status != 'changed':
+                    counts[result.status] += 1
+                    continue
+                page = CrawledPage(user_id=user_id, url=result.url, seed_url=seed_url)
+                db.session.add(page)
+                pages[result.url] = page
+            page.status_code = result.code
+            page.fetched_at = now
+            if result.status == 'not_modified':
+                # Servers may send fresh validators with a 304
+                page.etag = result.etag or page.etag
+                page.last_modified = result.last_modified or page.last_modified
+            elif result.status == 'changed':
+                page.etag = result.etag
+                page.last_modified = result.last_modified
+                text_hash = hashlib.sha256(result.text.encode('utf-8')).hexdigest()
+                # Re-served without validators but identical: nothing to re-index
+                if text_hash == page.text_hash and page.document_id is not None:
+                    counts['unchanged'] += 1
+                    continue
+                filename = page_filename(result.url)
+                with open(os.path.join(user_dir, filename), 'w', encoding='utf-8') as f:
+                    f.write(result.text)
+                page.text_hash = text_hash
+                page.changed_at = now
+                changed[filename] = page
+            counts[result.status] += 1
+        db.session.commit()
+
+        summary = {'succeeded': 0, 'skipped': 0, 'failed': 0}
+        if changed:
+            jobs = register_documents(user_id, list(changed))
+            for job in jobs:
+                changed[job.document.filename].document_id = job.document_id
+            db.session.commit()
+            summary = run_bulk_ingestion(app, [job.id for job in jobs])
+        counts['indexed'] = summary['succeeded']
+        counts['index_failed'] = summary['failed']
+        logger.info('Crawl of %s for user %s finished: %s', seed, user_id, counts)
+        return counts
@@ -0,0 +1,211 @@
+# app/document_index.py
+import os
+import shutil
+import logging
+
+from app.utils import (
+    get_embeddings,
+    get_client_settings_for_user,
+    get_user_vectorstore,
+    invalidate_user_vectorstore,
+    get_user_lexical_index,
+    lexical_index_path,
+    chunk_location_metadata,
+    delete_document_vectors,
+    vector_engine_name,
+    vectorstore_dir,
+    mmap_collection_options,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows read from or written to a collection per call while compacting
+COMPACT_BATCH = 1000
+
+
+# The user's open vector store, or None if they have never indexed anything (so none is created)
+def _existing_vectorstore(user_id):
+    if not os.path.isdir(vectorstore_dir(user_id)):
+        return None
+    from langchain_chroma import Chroma
+    from chromadb.config import Settings
+    from flask import current_app
+    return get_user_vectorstore(user_id, get_embeddings(current_app.config), Chroma, Settings)
+
+
+# Remove a document's chunks from both indexes. Call before the row is deleted; failures are logged
+# rather than raised, and anything left behind is purged by compaction.
+def remove_document_from_index(doc):
+    try:
+        vs = _existing_vectorstore(doc.user_id)
+        if vs is not None:
+            delete_document_vectors(vs, doc.id)
+        get_user_lexical_index(doc.user_id).delete_document(doc.id)
+    except Exception as e:
+        logger.error('Error removing document %s from the index: %s', doc.id, e)
+
+
+# Rewrite a document's chunk metadata after a rename or folder move. Vectors are left untouched,
+# so nothing is re-embedded.
+def update_document_location(doc):
+    changes = chunk_location_metadata(doc)
+    try:
+        vs = _existing_vectorstore(doc.user_id)
+        if vs is not None:
+            ids = vs._collection.get(where={'document_id': doc.id}, include=[])['ids']
+            for start in range(0, len(ids), COMPACT_BATCH):
+                batch = ids[start:start + COMPACT_BATCH]
+                vs._collection.update(ids=batch, metadatas=[changes] * len(batch))
+        get_user_lexical_index(doc.user_id).update_document_metadata(doc.id, changes)
+    except Exception as e:
+        logger.error('Error updating index metadata for document %s: %s', doc.id, e)
+
+
+# Rebuild a user's vector store and keyword index without orphaned or deleted chunks.
+# HNSW only marks deleted vectors and SQLite keeps freed pages, so the stored vectors are copied
+# (not re-embedded) into a fresh store that replaces the old one; the memory-mapped engine rewrites
+# its vector file in place. Chunks whose document no longer exists are dropped. Returns sizes before
+# and after in bytes, plus chunk counts.
+def compact_user_index(user_id):
+    import chromadb
+    from chromadb.config import Settings
+    from app.models import UploadedDocument
+    from app.vectorstore_pool import directory_size, release_chroma_system
+
+    live = {doc_id for (doc_id,) in UploadedDocument.query.with_entities(UploadedDocument.id)
+            .filter_by(user_id=user_id)}
+    store_dir = vectorstore_dir(user_id)
+    lexical_path = lexical_index_path(user_id)
+    report = {'user_id': user_id, 'chunks': 0, 'orphans': 0,
+              'bytes_before': directory_size(store_dir) + _file_size(lexical_path)}
+
+    lexical = get_user_lexical_index(user_id)
+    for doc_id in lexical.document_ids() - live:
+        lexical.delete_document(doc_id)
+    lexical.vacuum()
+
+    if os.path.isdir(store_dir) and vector_engine_name() == 'mmap':
+        report['chunks'], report['orphans'] = _existing_vectorstore(user_id)._collection.compact(live)
+    elif os.path.isdir(store_dir):
+        settings = get_client_settings_for_user(user_id, Settings)
+        source = _existing_vectorstore(user_id)._collection
+        expected = source.count()
+        new_dir = store_dir + '.compact'
+        shutil.rmtree(new_dir, ignore_errors=True)
+        target_client = chromadb.PersistentClient(path=new_dir, settings=Settings(anonymized_telemetry=False))
+        try:
+            target = target_client.create_collection(source.name, metadata=source.metadata)
+            for offset in range(0, expected, COMPACT_BATCH):
+                batch = source.get(limit=COMPACT_BATCH, offset=offset,
+                                   include=['embeddings', 'documents', 'metadatas'])
+                keep = [i for i, md in enumerate(batch['metadatas']) if (md or {}).get('document_id') in live]
+                report['orphans'] += len(batch['ids']) - len(keep)
+                if keep:
+                    target.add(
+                        ids=[batch['ids'][i] for i in keep],
+                        embeddings=[batch['embeddings'][i] for i in keep],
+                        documents=[batch['documents'][i] for i in keep],
+                        metadatas=[batch['metadatas'][i] for i in keep]
+                    )
+            report['chunks'] = target.count()
+            # A write landed while copying; leave the original store in place
+            if source.count() != expected:
+                raise RuntimeError(f'Vector store for user {user_id} changed during compaction; try again.')
+        except Exception:
+            release_chroma_system(new_dir)
+            shutil.rmtree(new_dir, ignore_errors=True)
+            raise
+        release_chroma_system(new_dir)
+
+        # Swap the directories with every handle on the old store closed
+        invalidate_user_vectorstore(user_id)
+        release_chroma_system(settings.persist_directory)
+        old_dir = store_dir + '.old'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(store_dir, old_dir)
+        os.replace(new_dir, store_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    report['bytes_after'] = directory_size(store_dir) + _file_size(lexical_path)
+    report['reclaimed'] = report['bytes_before'] - report['bytes_after']
+    logger.info('Compacted index for user %s: %s', user_id, report)
+    return report
+
+
+# Move a user's Chroma collection to the memory-mapped engine by copying the stored vectors (nothing is
+# re-embedded), and/or change the quantization of their memory-mapped collection. The copy is built
+# beside the target and renamed into place only when complete, so a failed run changes nothing.
+# quantization None keeps VECTOR_QUANTIZATION for new copies and leaves existing collections alone.
+def migrate_user_index(user_id, quantization=None, remove_source=False):
+    import chromadb
+    from chromadb.config import Settings
+    from flask import current_app
+    from app.vector_engine import MmapCollection, release_collection
+    from app.vectorstore_pool import directory_size, release_chroma_system
+
+    source_dir = vectorstore_dir(user_id, engine='chroma')
+    target_dir = vectorstore_dir(user_id, engine='mmap')
+    options = mmap_collection_options(current_app.config)
+    default_kind = options.pop('quantization')
+    kind = quantization or default_kind
+    report = {'user_id': user_id, 'copied': 0, 'chunks': 0, 'quantization': None,
+              'bytes_before': directory_size(source_dir) + directory_size(target_dir)}
+
+    # Nothing in this process may hold either store open while it is copied or swapped
+    invalidate_user_vectorstore(user_id)
+    release_collection(target_dir)
+    release_chroma_system(source_dir)
+
+    if os.path.isdir(source_dir) and not os.path.isdir(target_dir):
+        new_dir = target_dir + '.migrating'
+        shutil.rmtree(new_dir, ignore_errors=True)
+        client = chromadb.PersistentClient(path=source_dir, settings=Settings(anonymized_telemetry=False))
+        target = MmapCollection(new_dir, f'user_{user_id}', quantization='none', **options)
+        try:
+            try:
+                source = client.get_collection(f'user_{user_id}')
+            except Exception:
+                source = None
+            expected = source.count() if source is not None else 0
+            for offset in range(0, expected, COMPACT_BATCH):
+                batch = source.get(limit=COMPACT_BATCH, offset=offset,
+                                   include=['embeddings', 'documents', 'metadatas'])
+                target.upsert(batch['ids'], batch['embeddings'], batch['documents'], batch['metadatas'])
+            report['copied'] = target.count()
+            if source is not None and source.count() != expected:
+                raise RuntimeError(f'Vector store for user {user_id} changed during migration; try again.')
+            # Trained once on a sample of everything copied rather than on the first batches
+            target.set_quantization(kind)
+            target.close()
+        except Exception:
+            target.close()
+            shutil.rmtree(new_dir, ignore_errors=True)
+            raise
+        finally:
+            release_chroma_system(source_dir)
+        os.replace(new_dir, target_dir)
+    elif os.path.isdir(target_dir) and quantization is not None:
+        target = MmapCollection(target_dir, f'user_{user_id}', quantization=kind, **options)
+        try:
+            target.set_quantization(kind)
+        finally:
+            target.close()
+
+    if os.path.isdir(target_dir):
+        target = MmapCollection(target_dir, f'user_{user_id}', **options)
+        stats = target.stats()
+        target.close()
+        report.update(chunks=stats['chunks'], quantization=stats['quantization'])
+        if remove_source and os.path.isdir(source_dir):
+            shutil.rmtree(source_dir, ignore_errors=True)
+
+    report['bytes_after'] = directory_size(source_dir) + directory_size(target_dir)
+    logger.info('Migrated index for user %s: %s', user_id, report)
+    return report
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -9,35 +9,54 @@ from flask import (
     url_for,
     flash,
     render_template,
+    jsonify,
+    abort,
     current_app
 )
 from flask_login import login_required, current_user
-from langchain.schema import Document as LC_Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from app.extensions import db
-from app.models import UploadedDocument, Folder
-from app.utils import update_user_vectorstore, scrape_website, simple_filter_metadata
+from app.models import UploadedDocument, Folder, IngestionJob
+from app.ingestion import enqueue_ingestion, enqueue_bulk_ingestion, enqueue_crawl, job_to_dict
+from app.answer_cache import bump_corpus_version
+from app.document_index import remove_document_from_index, update_document_location
+from app.pagination import keyset_page, page_size
 from . import document_bp
 
-# Try to import UnstructuredLoader
-try:
-    from langchain_unstructured import UnstructuredLoader as UnstructuredFileLoader
-except ImportError:
-    from langchain_community.document_loaders import UnstructuredFileLoader
-
 logger = logging.getLogger(__name__)
 
 # Upload Document
 @document_bp.route('/upload', methods=['POST'])
 @login_required
 def upload_document():
+    # Refuse bodies that cannot fit the user's quota before Werkzeug reads them. The filename is not known
+    # yet, so the body may replace any document: only one that would not fit even in place of the largest
+    # is refused here
+    from app.chunked_upload import check_file_size, check_quota, UploadError
+    size = request.content_length or 0
+    largest = UploadedDocument.query.filter_by(user_id=current_user.id) \
+                                    .order_by(UploadedDocument.file_size.desc()).first()
+    try:
+        check_file_size(size, current_app.config)
+        check_quota(current_user.id, size, current_app.config, replacing=largest)
+    except UploadError as e:
+        flash(str(e))
+        return redirect(url_for('dashboard'))
+
     # Retrieve uploaded file from the form
     file = request.files.get('document')
     if not file or not file.filename:
         flash('No file uploaded.')
         return redirect(url_for('dashboard'))
 
+    # Re-uploading a file frees the space of the document it replaces, and only that
+    existing = UploadedDocument.query.filter_by(user_id=current_user.id, filename=file.filename).first()
+    try:
+        check_quota(current_user.id, size, current_app.config, replacing=existing)
+    except UploadError as e:
+        flash(str(e))
+        return redirect(url_for('dashboard'))
+
     # Check user directory exists
     user_dir = os.path.join('uploads', str(current_user.id))
     os.makedirs(user_dir, exist_ok=True)
@@ -54,12 +73,17 @@ def upload_document():
         flash('Error saving file.')
         return redirect(url_for('dashboard'))
 
-    # Create a new UploadedDocument entry
-    doc = UploadedDocument(
-        filename=file.filename,
-        file_type=file.filename.rsplit('.',1)[-1].lower(),
-        user_id=current_user.id
-    )
+    # Re-uploading a file with the same name replaces the existing entry instead of duplicating it
+    doc = UploadedDocument.query.filter_by(user_id=current_user.id, filename=file.filename).first()
+    if doc is None:
+        doc = UploadedDocument(
+            filename=file.filename,
+            file_type=file.filename.rsplit('.',1)[-1].lower(),
+            user_id=current_user.id
+        )
+    else:
+        doc.upload_date = datetime.datetime.utcnow()
+    doc.file_size = os.path.getsize(path)
     try:
         db.session.add(doc)
         db.session.commit()
@@ -69,44 +93,156 @@ def upload_document():
         flash('Database error.')
         return redirect(url_for('dashboard'))
 
-    # Process and index document
+    # Hand parsing and indexing to the background ingestion workers
+    try:
+        job = enqueue_ingestion(current_user.id, document=doc)
+    except Exception as e:
+        db.session.rollback()
+        logger.error('Error queueing document for processing: %s', e)
+        flash('Document uploaded, but processing could not be started.')
+        return redirect(url_for('dashboard'))
+    # ───── End timing; notify user of the queued job and elapsed time ─────
+    duration = perf_counter() - start
+    if _wants_json():
+        return jsonify(job_to_dict(job)), 202
+    flash(_job_message(job, f'Document uploaded in {duration:.2f}s'), 'success')
+    return redirect(url_for('dashboard'))
+
+# Resumable chunked uploads (JSON API): start with the filename and size, PUT the bytes in chunks
+# with an Upload-Offset header, then complete. GET returns the offset to resume from.
+def _upload_session_or_404(upload_id):
+    from app.models import UploadSession
+    session = db.session.get(UploadSession, upload_id)
+    if session is None or session.user_id != current_user.id:
+        abort(404)
+    return session
+
+def _upload_error(e):
+    return jsonify(error=str(e), offset=e.offset), e.status
+
+@document_bp.route('/uploads', methods=['POST'])
+@login_required
+def start_chunked_upload():
+    from app.chunked_upload import start_upload, session_to_dict, UploadError
+    data = request.get_json(silent=True) or {}
+    try:
+        session = start_upload(current_user.id, data.get('filename'), data.get('size'), current_app.config)
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(session_to_dict(session, current_app.config)), 201
+
+@document_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def chunked_upload_status(upload_id):
+    from app.chunked_upload import session_to_dict
+    return jsonify(session_to_dict(_upload_session_or_404(upload_id), current_app.config))
+
+@document_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def append_chunked_upload(upload_id):
+    from app.chunked_upload import append_chunk, session_to_dict, UploadError
+    session = _upload_session_or_404(upload_id)
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+    except ValueError:
+        return jsonify(error='Upload-Offset header is required.', offset=session.received), 400
+    try:
+        append_chunk(session, offset, request.stream, request.content_length, current_app.config)
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(session_to_dict(session, current_app.config))
+
+@document_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(upload_id):
+    from app.chunked_upload import complete_upload, UploadError
+    session = _upload_session_or_404(upload_id)
+    try:
+        path, content_hash = complete_upload(session)
+    except UploadError as e:
+        return _upload_error(e)
+
+    doc = UploadedDocument.query.filter_by(user_id=current_user.id, filename=session.filename).first()
+    if doc is None:
+        doc = UploadedDocument(
+            filename=session.filename,
+            file_type=session.filename.rsplit('.', 1)[-1].lower(),
+            user_id=current_user.id
+        )
+        db.session.add(doc)
+    else:
+        doc.upload_date = datetime.datetime.utcnow()
+    doc.file_size = session.size
+    db.session.commit()
+
+    # The hash was computed while streaming, so an unchanged re-upload needs no job at all
+    if doc.indexed_at is not None and doc.content_hash == content_hash:
+        return jsonify(document_id=doc.id, content_hash=content_hash, job=None), 200
+    try:
+        job = enqueue_ingestion(current_user.id, document=doc)
+    except Exception as e:
+        db.session.rollback()
+        logger.error('Error queueing chunked upload for processing: %s', e)
+        return jsonify(error='Document uploaded, but processing could not be started.', document_id=doc.id), 500
+    return jsonify(document_id=doc.id, content_hash=content_hash, job=job_to_dict(job)), 202
+
+@document_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_chunked_upload(upload_id):
+    from app.chunked_upload import abort_upload
+    abort_upload(_upload_session_or_404(upload_id))
+    return jsonify(status='aborted')
+
+# Bulk upload: many files and/or zip and tar archives in one request
+@document_bp.route('/upload/bulk', methods=['POST'])
+@login_required
+def bulk_upload():
+    from app.bulk_ingestion import save_entries, BulkUploadError
+    from app.chunked_upload import DEFAULT_QUOTA_BYTES, check_quota, quota_used, UploadError
+    try:
+        check_quota(current_user.id, request.content_length or 0, current_app.config)
+    except UploadError as e:
+        flash(str(e))
+        return redirect(url_for('dashboard'))
+    files = [f for f in request.files.getlist('documents') if f and f.filename]
+    if not files:
+        flash('No files uploaded.')
+        return redirect(url_for('dashboard'))
+
+    # Archive entries are streamed to disk one at a time; what they expand to must also fit the quota
+    remaining = current_app.config.get('UPLOAD_QUOTA_BYTES', DEFAULT_QUOTA_BYTES) - quota_used(current_user.id)
     try:
-        loader = UnstructuredFileLoader(path)
-        raw = loader.load()
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_documents(raw)
-
-        # Convert to LangChain Doucment objects and filter metadata
-        processed = []
-        for chunk in chunks:
-            text = getattr(chunk, 'page_content', str(chunk))
-            md   = getattr(chunk, 'metadata', {}) or {}
-            processed.append(
-                LC_Document(page_content=text,
-                            metadata=simple_filter_metadata(md))
-            )
-
-        # Import embeddings and vectorstore classes  
-        from langchain_openai import OpenAIEmbeddings
-        from langchain_chroma import Chroma
-        from chromadb.config import Settings
-        # Initialise embeddings with OpenAI API key
-        emb = OpenAIEmbeddings(openai_api_key=current_app.config['OPENAI_API_KEY'])
-        # Update the user's vectorstore with the processed documents
-        update_user_vectorstore(
+        filenames = save_entries(
             current_user.id,
-            processed,
-            emb,
-            Chroma,
-            Settings
+            ((f.filename, f.stream) for f in files),
+            max_files=current_app.config.get('BULK_MAX_FILES', 20000),
+            max_bytes=min(current_app.config.get('BULK_MAX_BYTES', 2 * 1024 ** 3), remaining)
         )
+    except BulkUploadError as e:
+        flash(str(e))
+        return redirect(url_for('dashboard'))
     except Exception as e:
-        logger.error('Error processing document: %s', e)
-        flash('Document uploaded, but processing failed.')
+        logger.error('Error saving bulk upload: %s', e)
+        flash('Error saving files.')
         return redirect(url_for('dashboard'))
-    # ───── End timing; notify user of success and elapsed time ─────
-    duration = perf_counter() - start
-    flash(f'Document uploaded and processed successfully in {duration:.2f}s', 'success')
+    if not filenames:
+        flash('No documents found in the upload.')
+        return redirect(url_for('dashboard'))
+
+    try:
+        jobs = enqueue_bulk_ingestion(current_user.id, filenames)
+    except Exception as e:
+        db.session.rollback()
+        logger.error('Error queueing bulk upload: %s', e)
+        flash('Documents uploaded, but processing could not be started.')
+        return redirect(url_for('dashboard'))
+    if _wants_json():
+        return jsonify(count=len(jobs), jobs=[job.id for job in jobs]), 202
+    failed = sum(1 for job in jobs if job.status == 'failed')
+    if all(job.status in ('succeeded', 'failed') for job in jobs):
+        flash(f'{len(jobs)} documents uploaded and processed ({failed} failed).', 'success')
+    else:
+        flash(f'{len(jobs)} documents uploaded; processing in the background.', 'success')
     return redirect(url_for('dashboard'))
 
 # Scrape Website
@@ -118,60 +254,99 @@ def scrape_document():
     if not url:
         flash('URL is required.')
         return redirect(url_for('dashboard'))
-    # Get text from the URL
-    text, error = scrape_website(url)
-    if error:
-        flash(error)
-        return redirect(url_for('dashboard'))
-    #Save scraped text to a .txt file
-    user_dir = os.path.join('uploads', str(current_user.id))
-    os.makedirs(user_dir, exist_ok=True)
-    fname = f"scraped_{datetime.datetime.utcnow():%Y%m%d%H%M%S}.txt"
-    path = os.path.join(user_dir, fname)
-
+    if request.form.get('crawl'):
+        return _crawl_site(url)
+    # Fetching, saving and indexing the page all happen in the background job
     try:
-        with open(path,'w',encoding='utf-8') as f:
-            f.write(text)
+        job = enqueue_ingestion(current_user.id, source_url=url)
     except Exception as e:
-        logger.error('Error writing scraped file: %s', e)
-        flash('Error writing scraped file.')
+        db.session.rollback()
+        logger.error('Error queueing scrape: %s', e)
+        flash('Website scrape could not be started.')
         return redirect(url_for('dashboard'))
+    if _wants_json():
+        return jsonify(job_to_dict(job)), 202
+    flash(_job_message(job, 'Website scrape started'))
+    return redirect(url_for('dashboard'))
 
-    # Create a new UploadedDocument entry for the scraped file
-    doc = UploadedDocument(filename=fname, file_type='txt', user_id=current_user.id)
-    try:
-        db.session.add(doc); db.session.commit()
-    except Exception as e:
-        db.session.rollback(); logger.error('DB error on scrape: %s', e); flash('Database error.'); return redirect(url_for('dashboard'))
-
-    # Process scraped file into vectorstore
+# Crawl the site behind url; only pages changed since the last crawl are re-indexed
+def _crawl_site(url):
+    from app.crawler import normalize_url
+    if normalize_url(url) is None:
+        flash('Only http(s) URLs can be crawled.')
+        return redirect(url_for('dashboard'))
     try:
-        loader = UnstructuredFileLoader(path)
-        raw = loader.load()
-        # Split the document into manageable chunks
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = splitter.split_documents(raw)
-        # Convert to LangChain Document objects and filter metadata
-        processed = []
-        for chunk in chunks:
-            text = getattr(chunk,'page_content',str(chunk))
-            md   = getattr(chunk,'metadata',{}) or {}
-            processed.append(LC_Document(page_content=text, metadata=simple_filter_metadata(md)))
-        # Import embeddings and vectorstore classes    
-        from langchain_openai import OpenAIEmbeddings
-        from langchain_chroma import Chroma
-        from chromadb.config import Settings
-        emb = OpenAIEmbeddings(openai_api_key=current_app.config['OPENAI_API_KEY'])
-        # Update the user's vectorstore with the processed documents
-        update_user_vectorstore(current_user.id, processed, emb, Chroma, Settings)
+        counts = enqueue_crawl(current_user.id, url)
     except Exception as e:
-        logger.error('Error processing scraped document: %s', e)
-        flash('Website scraped, but processing failed.')
+        db.session.rollback()
+        logger.error('Error crawling %s: %s', url, e)
+        flash('Website crawl could not be started.')
+        return redirect(url_for('dashboard'))
+    if counts is None:
+        if _wants_json():
+            return jsonify(status='queued', url=url), 202
+        flash('Website crawl started; changed pages will appear as they are processed.', 'success')
         return redirect(url_for('dashboard'))
-    # Notify user of success
-    flash('Website scraped and document processed successfully!')
+    if _wants_json():
+        return jsonify(status='finished', url=url, **counts)
+    flash(f"Crawl finished: {counts['changed']} new or changed, "
+          f"{counts['not_modified'] + counts['unchanged']} unchanged, {counts['failed']} failed.", 'success')
     return redirect(url_for('dashboard'))
 
+# Ingestion job status
+# API clients ask for JSON; browser form posts get a redirect and flash message
+def _wants_json():
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    return best == 'application/json' and request.accept_mimetypes[best] > request.accept_mimetypes['text/html']
+
+# Flash text for a job that may already have finished (eager mode) or still be running
+def _job_message(job, prefix):
+    if job.status == 'succeeded':
+        return f'{prefix} and processed successfully!'
+    if job.status == 'failed':
+        return f'{prefix}, but processing failed: {job.error}'
+    return f'{prefix}; processing in the background.'
+
+@document_bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    # Poll the progress of one ingestion job
+    job = db.session.get(IngestionJob, job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    return jsonify(job_to_dict(job))
+
+@document_bp.route('/jobs')
+@login_required
+def list_jobs():
+    # Recent jobs for the dashboard; ?active=1 limits to queued/running ones
+    query = IngestionJob.query.filter_by(user_id=current_user.id)
+    if request.args.get('active'):
+        query = query.filter(IngestionJob.status.in_(('queued', 'running')))
+    jobs = query.order_by(IngestionJob.id.desc()).limit(50).all()
+    return jsonify(jobs=[job_to_dict(j) for j in jobs])
+
+# One page of the user's documents, newest first, for the dashboard's lazy-loading table
+@document_bp.route('/documents')
+@login_required
+def list_documents():
+    docs, next_cursor = keyset_page(
+        UploadedDocument.query.filter_by(user_id=current_user.id),
+        UploadedDocument.upload_date, UploadedDocument.id,
+        cursor=request.args.get('cursor'),
+        limit=page_size(request.args.get('limit'), current_app.config.get('DASHBOARD_PAGE_SIZE', 50))
+    )
+    folders = Folder.query.filter_by(user_id=current_user.id).order_by(Folder.name).all()
+    items = [{
+        'id': d.id,
+        'filename': d.filename,
+        'file_type': d.file_type,
+        'upload_date': d.upload_date.isoformat(),
+        'folder_id': d.folder_id,
+        'html': render_template('_document_row.html', doc=d, folders=folders),
+    } for d in docs]
+    return jsonify(items=items, next_cursor=next_cursor)
+
 # Folder Management
 @document_bp.route('/create_folder', methods=['POST'])
 @login_required
@@ -216,11 +391,14 @@ def delete_folder(folder_id):
     if f.user_id != current_user.id:
         flash('Unauthorized access.'); return redirect(url_for('dashboard'))
     # Unassign documents from the folder
-    for doc in UploadedDocument.query.filter_by(folder_id=f.id): doc.folder_id=None
+    docs = UploadedDocument.query.filter_by(folder_id=f.id).all()
+    for doc in docs: doc.folder_id=None
     try:
         db.session.delete(f); db.session.commit(); flash('Folder deleted successfully! Documents have been unassigned.')
     except Exception as e:
         db.session.rollback(); logger.error('Error deleting folder: %s', e); flash('Error deleting folder.')
+        return redirect(url_for('dashboard'))
+    for doc in docs: update_document_location(doc)
     return redirect(url_for('dashboard'))
 
 @document_bp.route('/folder/<int:folder_id>')
@@ -244,6 +422,9 @@ def update_folder(doc_id):
         db.session.commit(); flash('Folder updated successfully!')
     except Exception as e:
         db.session.rollback(); logger.error('Error updating document\'s folder: %s', e); flash('Error updating folder.')
+        return redirect(url_for('dashboard'))
+    # Chunks carry the folder in their metadata; update it in place (no re-embedding)
+    update_document_location(d)
     return redirect(url_for('dashboard'))
 
 @document_bp.route('/delete_document/<int:doc_id>', methods=['POST'])
@@ -258,9 +439,11 @@ def delete_document(doc_id):
         if os.path.exists(p): os.remove(p)
     except Exception as e:
         logger.error('Error deleting file from disk: %s',e)
-    # Delete document from DB
+    # Drop its chunks from the vector store and keyword index so they stop matching searches
+    remove_document_from_index(d)
+    # Delete document from DB; cached answers may have relied on it
     try:
-        db.session.delete(d); db.session.commit(); flash('Document deleted successfully!')
+        db.session.delete(d); bump_corpus_version(current_user.id); db.session.commit(); flash('Document deleted successfully!')
     except Exception as e:
         db.session.rollback(); logger.error('Error deleting document from DB: %s',e); flash('Error deleting document.')
     return redirect(url_for('dashboard'))
@@ -291,4 +474,7 @@ def rename_document(doc_id):
         db.session.rollback()
         logger.error('Error renaming file: %s', e)
         flash('Error renaming file.')
+        return redirect(url_for('dashboard'))
+    # Sources cite the chunk's filename; update it in place (no re-embedding)
+    update_document_location(d)
     return redirect(url_for('dashboard'))
\ No newline at end of file
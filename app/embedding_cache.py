@@ -0,0 +1,189 @@
+# app/embedding_cache.py
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Default cache location and size bound (overridable through app config)
+DEFAULT_CACHE_PATH = os.path.join('instance', 'embedding_cache.sqlite3')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+# Content-addressed key for a chunk of text
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+# Persistent (model, sha256(text)) -> vector store in a local SQLite file with LRU eviction
+class EmbeddingCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS embedding ('
+            ' model TEXT NOT NULL,'
+            ' digest TEXT NOT NULL,'
+            ' vector BLOB NOT NULL,'
+            ' last_used REAL NOT NULL,'
+            ' PRIMARY KEY (model, digest))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_embedding_last_used ON embedding (last_used)')
+        self._conn.commit()
+        row = self._conn.execute('SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding').fetchone()
+        self._total_bytes = row[0]
+
+    # Look up many digests at once; returns {digest: vector} for the hits and refreshes their recency
+    def get_many(self, model, digests):
+        found = {}
+        if not digests:
+            return found
+        unique = list(dict.fromkeys(digests))
+        with self._lock:
+            # SQLite limits bound parameters, so look up in slices
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                marks = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f'SELECT digest, vector FROM embedding WHERE model = ? AND digest IN ({marks})',
+                    [model, *part]
+                ).fetchall()
+                for digest, blob in rows:
+                    vec = array('f')
+                    vec.frombytes(blob)
+                    found[digest] = vec.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    'UPDATE embedding SET last_used = ? WHERE model = ? AND digest = ?',
+                    [(now, model, d) for d in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for d in digests if d in found)
+            self.misses += sum(1 for d in digests if d not in found)
+        return found
+
+    # Store vectors for the given digests, evicting least recently used entries when over budget
+    def put_many(self, model, items):
+        if not items:
+            return
+        now = time.time()
+        rows = [(model, digest, array('f', vector).tobytes(), now) for digest, vector in items]
+        with self._lock:
+            for model_, digest, blob, _ in rows:
+                old = self._conn.execute(
+                    'SELECT LENGTH(vector) FROM embedding WHERE model = ? AND digest = ?',
+                    (model_, digest)
+                ).fetchone()
+                self._total_bytes += len(blob) - (old[0] if old else 0)
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embedding (model, digest, vector, last_used) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    # Drop the oldest entries until the cache is back under 90% of its size bound
+    def _evict(self):
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            batch = self._conn.execute(
+                'SELECT model, digest, LENGTH(vector) FROM embedding ORDER BY last_used LIMIT 256'
+            ).fetchall()
+            if not batch:
+                self._total_bytes = 0
+                break
+            removed = []
+            for model, digest, size in batch:
+                if self._total_bytes <= target:
+                    break
+                removed.append((model, digest))
+                self._total_bytes -= size
+            self._conn.executemany('DELETE FROM embedding WHERE model = ? AND digest = ?', removed)
+            self.evictions += len(removed)
+        logger.info('Embedding cache evicted down to %s bytes (%s evictions so far).',
+                    self._total_bytes, self.evictions)
+
+    # Counters for monitoring; hit_rate is over lookups made by this process
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM embedding').fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': entries,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# LangChain Embeddings wrapper that only sends cache misses to the underlying model
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying, cache, model_name=None):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name or getattr(underlying, 'model', None) or type(underlying).__name__
+        # Reduced-dimension vectors of the same model are different vectors
+        if not model_name and getattr(underlying, 'dimensions', None):
+            self.model_name = f'{self.model_name}@{underlying.dimensions}'
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        digests = [text_digest(t) for t in texts]
+        found = self.cache.get_many(self.model_name, digests)
+
+        # Embed each distinct missing text once, in original order
+        missing = {}
+        for digest, text in zip(digests, texts):
+            if digest not in found and digest not in missing:
+                missing[digest] = text
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = list(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, fresh)
+            found.update(fresh)
+        return [found[d] for d in digests]
+
+    def embed_query(self, text):
+        digest = text_digest(text)
+        found = self.cache.get_many(self.model_name, [digest])
+        if digest in found:
+            return found[digest]
+        vector = self.underlying.embed_query(text)
+        self.cache.put_many(self.model_name, [(digest, vector)])
+        return vector
+
+
+# One shared cache per file per process
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+    key = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = EmbeddingCache(path, max_bytes)
+        return cache
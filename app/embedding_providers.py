@@ -0,0 +1,112 @@
+# app/embedding_providers.py
+import re
+import zlib
+
+from langchain_core.embeddings import Embeddings
+
+# Defaults (overridable through app config)
+DEFAULT_PROVIDER = 'openai'
+DEFAULT_LOCAL_DIM = 384
+
+# EMBEDDING_PROVIDER name -> (factory(config) -> Embeddings, whether to wrap it in the embedding cache)
+_providers = {}
+
+
+# Register an embedding backend under a name usable as EMBEDDING_PROVIDER.
+# cache=False for backends that compute vectors faster than the on-disk cache can return them.
+def register_provider(name, cache=True):
+    def decorator(factory):
+        _providers[name] = (factory, cache)
+        return factory
+    return decorator
+
+
+def provider_names():
+    return sorted(_providers)
+
+
+# Build the configured backend; returns (embeddings, cacheable)
+def create_embeddings(config):
+    name = (config.get('EMBEDDING_PROVIDER') or DEFAULT_PROVIDER).lower()
+    if name not in _providers:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER {name!r}; expected one of {', '.join(provider_names())}.")
+    factory, cache = _providers[name]
+    return factory(config), cache
+
+
+# EMBEDDING_DIMENSIONS asks text-embedding-3 models for shortened vectors (e.g. 512 instead of 1536)
+@register_provider('openai')
+def openai_embeddings(config):
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(
+        model=config.get('EMBEDDING_MODEL', 'text-embedding-ada-002'),
+        openai_api_key=config.get('OPENAI_API_KEY'),
+        base_url=config.get('OPENAI_BASE_URL') or None,
+        dimensions=config.get('EMBEDDING_DIMENSIONS') or None
+    )
+
+
+@register_provider('local', cache=False)
+def local_embeddings(config):
+    return HashingEmbeddings(dim=config.get('LOCAL_EMBEDDING_DIM', DEFAULT_LOCAL_DIM))
+
+
+_WORD_RE = re.compile(r'\w+')
+
+# Distinct tokens whose hashed slot is remembered between calls
+SLOT_CACHE_SIZE = 1 << 20
+
+
+# Offline CPU embeddings: signed feature hashing of words and word bigrams into `dim` buckets, with
+# sublinear term frequency and L2 normalisation. A whole batch becomes one NumPy matrix built by a
+# single bincount, so no network, model download or GPU is needed. Vectors are deterministic across
+# processes, which keeps stored collections valid between restarts.
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dim=DEFAULT_LOCAL_DIM):
+        self.dim = dim
+        self.model = self.model_name = f'local-hashing-{dim}'
+        # token -> signed slot (slot + 1, negated for a negative sign)
+        self._slots = {}
+
+    def _slot(self, token):
+        slot = self._slots.get(token)
+        if slot is None:
+            if len(self._slots) >= SLOT_CACHE_SIZE:
+                self._slots.clear()
+            digest = zlib.crc32(token.encode('utf-8'))
+            slot = (digest % self.dim) + 1
+            # The sign comes from bits the bucket index does not use, so collisions tend to cancel
+            if (digest >> 16) & 1:
+                slot = -slot
+            self._slots[token] = slot
+        return slot
+
+    def _features(self, text):
+        words = _WORD_RE.findall(text.casefold())
+        slots = [self._slot(w) for w in words]
+        slots.extend(self._slot(a + ' ' + b) for a, b in zip(words, words[1:]))
+        return slots
+
+    def _matrix(self, texts):
+        import numpy as np
+        rows, slots = [], []
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            slots.extend(features)
+            rows.extend([row] * len(features))
+        slots = np.asarray(slots, dtype=np.int64)
+        flat = np.asarray(rows, dtype=np.int64) * self.dim + (np.abs(slots) - 1)
+        counts = np.bincount(flat, weights=np.sign(slots), minlength=len(texts) * self.dim)
+        matrix = counts.reshape(len(texts), self.dim).astype(np.float32)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self._matrix(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._matrix([text])[0].tolist()
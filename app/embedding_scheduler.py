@@ -0,0 +1,155 @@
+# app/embedding_scheduler.py
+import re
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Defaults (overridable through app config)
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_TOKENS = 8000
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_RETRIES = 6
+
+
+# Cheap, slightly pessimistic token estimate (~3 characters per token for English text)
+def estimate_tokens(text):
+    return max(1, len(text) // 3)
+
+
+# Split texts into consecutive (start, end) ranges that respect a token budget and an item cap.
+# A single text larger than the budget still gets a batch of its own.
+def token_batches(texts, max_tokens=DEFAULT_BATCH_TOKENS, max_items=DEFAULT_BATCH_SIZE):
+    batches = []
+    start = 0
+    tokens = 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if i > start and (tokens + cost > max_tokens or i - start >= max_items):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += cost
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+# Parse OpenAI-style durations such as "20ms", "1.5s" or "6m0s" into seconds
+def _parse_duration(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r'([\d.]+)(ms|s|m|h)', value):
+        matched = True
+        total += float(amount) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+    return total if matched else None
+
+
+# If exc is a rate-limit error, return how long the server asked us to wait (or 0 if unknown)
+def rate_limit_delay(exc):
+    response = getattr(exc, 'response', None)
+    status = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+    if status != 429:
+        return None
+    headers = getattr(response, 'headers', None) or {}
+    if headers.get('retry-after-ms'):
+        return float(headers['retry-after-ms']) / 1000
+    for name in ('retry-after', 'x-ratelimit-reset-tokens', 'x-ratelimit-reset-requests'):
+        delay = _parse_duration(headers.get(name))
+        if delay is not None:
+            return delay
+    return 0.0
+
+
+# Embeds many texts with several token-budgeted batches in flight at once.
+# Concurrency adapts to throttling: a 429 halves it and pauses all workers for the requested
+# delay, and each successful batch lets it grow back by one (additive increase, multiplicative decrease).
+class EmbeddingScheduler:
+    def __init__(self, embeddings, max_concurrency=DEFAULT_CONCURRENCY, max_batch_tokens=DEFAULT_BATCH_TOKENS,
+                 max_batch_size=DEFAULT_BATCH_SIZE, max_retries=DEFAULT_MAX_RETRIES, base_delay=0.5):
+        self.embeddings = embeddings
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.concurrency = self.max_concurrency
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    # Yield (start, vectors) for each batch in input order, as soon as it and all earlier batches are done
+    def iter_batches(self, texts):
+        texts = list(texts)
+        batches = token_batches(texts, self.max_batch_tokens, self.max_batch_size)
+        if not batches:
+            return
+        if self.max_concurrency == 1 or len(batches) == 1:
+            for start, end in batches:
+                yield start, self._embed_with_retry(texts[start:end])
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='embed') as pool:
+            pending = {}
+            next_submit = 0
+            for next_yield, (start, _end) in enumerate(batches):
+                # Keep up to the current concurrency limit in flight ahead of the batch we yield next
+                while next_submit < len(batches) and len(pending) < max(1, self.concurrency):
+                    s, e = batches[next_submit]
+                    pending[next_submit] = pool.submit(self._embed_with_retry, texts[s:e])
+                    next_submit += 1
+                yield start, pending.pop(next_yield).result()
+
+    # Embed everything and return vectors in input order
+    def embed_documents(self, texts):
+        vectors = []
+        for _start, batch in self.iter_batches(texts):
+            vectors.extend(batch)
+        return vectors
+
+    def _embed_with_retry(self, batch):
+        attempt = 0
+        while True:
+            self._wait_if_paused()
+            try:
+                vectors = self.embeddings.embed_documents(batch)
+            except Exception as e:
+                delay = rate_limit_delay(e)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                # Exponential backoff with jitter, never shorter than what the server asked for
+                backoff = max(delay, self.base_delay * (2 ** (attempt - 1)) * (0.5 + random.random()))
+                self._throttle(backoff)
+                continue
+            self._recover()
+            return vectors
+
+    def _wait_if_paused(self):
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def _throttle(self, delay):
+        with self._lock:
+            self.throttled += 1
+            self.concurrency = max(1, self.concurrency // 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logger.warning('Embedding rate limited; pausing %.2fs, concurrency now %s.', delay, self.concurrency)
+
+    def _recover(self):
+        with self._lock:
+            if self.concurrency < self.max_concurrency:
+                self.concurrency += 1
@@ -0,0 +1,405 @@
+# app/ingestion.py
+import os
+import time
+import uuid
+import socket
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import IngestionJob, UploadedDocument
+from app.answer_cache import bump_corpus_version
+from app.chunking import DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP, create_chunker
+from app import utils
+from app.utils import (
+    index_document,
+    file_content_hash,
+    get_embeddings,
+    simple_filter_metadata,
+    setup_pandoc,
+    initialize_nltk_resources,
+)
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of each stage in a job's overall progress
+STAGE_WEIGHTS = {'fetch': 0.05, 'load': 0.2, 'split': 0.05, 'embed': 0.55, 'store': 0.15}
+
+# Minimum seconds between progress commits for the same job
+PROGRESS_INTERVAL = 0.5
+
+# Process-wide worker pool; its size caps the number of concurrent ingestions
+_executor = None
+_executor_lock = threading.Lock()
+
+# Heartbeat / recovery thread for jobs claimed by this process
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+# Character chunking of the default 'recursive' chunker (CHUNKER and CHUNK_* in config choose the chunking)
+CHUNK_SIZE = DEFAULT_CHUNK_SIZE
+CHUNK_OVERLAP = DEFAULT_CHUNK_OVERLAP
+
+
+# Identifies the parser that produced cached elements; a new loader or package version re-parses files
+def loader_version():
+    from importlib.util import find_spec
+    from importlib.metadata import version, PackageNotFoundError
+    if find_spec('langchain_unstructured') is not None:
+        parts = ['langchain_unstructured.UnstructuredLoader', 'langchain-unstructured']
+    else:
+        parts = ['langchain_community.UnstructuredFileLoader', 'langchain-community']
+    versions = []
+    for package in (parts[1], 'unstructured'):
+        try:
+            versions.append(f'{package}=={version(package)}')
+        except PackageNotFoundError:
+            versions.append(f'{package}==none')
+    return ' '.join([parts[0]] + versions)
+
+
+# Run the document loader on a file; returns (text, metadata) pairs
+def _parse_file(path):
+    # External tools are located on first use rather than at startup
+    setup_pandoc()
+    initialize_nltk_resources()
+    # Try to import UnstructuredLoader
+    try:
+        from langchain_unstructured import UnstructuredLoader as UnstructuredFileLoader
+    except ImportError:
+        from langchain_community.document_loaders import UnstructuredFileLoader
+    return [(getattr(el, 'page_content', str(el)), simple_filter_metadata(getattr(el, 'metadata', {}) or {}))
+            for el in UnstructuredFileLoader(path).load()]
+
+
+# Parsed text and chunks for one version of a file, from the parse cache when possible.
+# Anything that needs a document's text or chunks should go through here instead of a loader.
+# cache_dir defaults to PARSE_CACHE_DIR from the app config (pass it explicitly outside an app context).
+def parsed_document(path, content_hash=None, cache_dir=None):
+    from app.parse_cache import get_parse_cache, DEFAULT_CACHE_DIR
+    cache = get_parse_cache(cache_dir or current_app.config.get('PARSE_CACHE_DIR', DEFAULT_CACHE_DIR))
+    return cache.get_or_parse(content_hash or file_content_hash(path), loader_version(),
+                              lambda: _parse_file(path))
+
+
+# Load, split and index a saved file into the owner's vector store.
+# progress(stage, done, total) is called as each stage advances.
+# Returns False when the file content was already indexed and nothing had to be embedded.
+def index_uploaded_document(doc, path, progress=None):
+    report = progress or (lambda stage, done, total: None)
+
+    # Skip parsing entirely when this exact content is already in the index
+    content_hash = file_content_hash(path)
+    if doc.indexed_at is not None and doc.content_hash == content_hash:
+        logger.info('Document %s already indexed; nothing to do.', doc.id)
+        return False
+
+    # The loader only runs the first time this file version is seen
+    report('load', 0, 1)
+    parsed = parsed_document(path, content_hash)
+    report('load', 1, 1)
+
+    report('split', 0, 1)
+    processed = parsed.chunks(chunker=create_chunker(current_app.config, doc.filename))
+    report('split', 1, 1)
+
+    # Import vectorstore classes
+    from langchain_chroma import Chroma
+    from chromadb.config import Settings
+    # Cached embeddings: only chunks never embedded before reach the OpenAI API
+    emb = get_embeddings(current_app.config)
+    embedded = index_document(doc, path, processed, emb, Chroma, Settings,
+                              content_hash=content_hash, progress=report)
+    if embedded:
+        # New content can change answers, so stop serving cached ones
+        bump_corpus_version(doc.user_id)
+    db.session.commit()
+    return embedded
+
+
+# Overall completion between 0 and 1, weighting each stage by its typical cost
+def job_progress(job):
+    if job.status == 'succeeded':
+        return 1.0
+    stages = job.stage_progress or {}
+    weights = {k: w for k, w in STAGE_WEIGHTS.items() if job.source_url or k != 'fetch'}
+    done = 0.0
+    for stage, weight in weights.items():
+        info = stages.get(stage)
+        if info and info.get('total'):
+            done += weight * min(info['done'] / info['total'], 1.0)
+    return round(done / sum(weights.values()), 3)
+
+
+# JSON-serialisable job status for the polling endpoint
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'document_id': job.document_id,
+        'filename': job.document.filename if job.document else None,
+        'source_url': job.source_url,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': job_progress(job),
+        'stages': job.stage_progress or {},
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# Write the fetched page text to the user's uploads folder as a new document
+def _save_scraped_text(job):
+    text, error = utils.scrape_website(job.source_url)
+    if error:
+        raise RuntimeError(error)
+    user_dir = os.path.join('uploads', str(job.user_id))
+    os.makedirs(user_dir, exist_ok=True)
+    fname = f"scraped_{datetime.datetime.utcnow():%Y%m%d%H%M%S}_{job.id}.txt"
+    path = os.path.join(user_dir, fname)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    doc = UploadedDocument(filename=fname, file_type='txt', user_id=job.user_id)
+    db.session.add(doc)
+    db.session.flush()
+    job.document_id = doc.id
+    db.session.commit()
+    return doc
+
+
+# Identifies this process as the owner of the jobs it claims: host, pid and a token drawn once per
+# process, so a restarted process that gets the same pid is still a different owner
+_worker = (None, None)
+
+def worker_id():
+    global _worker
+    pid = os.getpid()
+    if _worker[0] != pid:
+        _worker = (pid, f'{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:12]}')
+    return _worker[1]
+
+
+# Column values that mark a job as claimed by this process
+def claim_values(now=None):
+    now = now or datetime.datetime.utcnow()
+    return {'status': 'running', 'started_at': now, 'worker_id': worker_id(), 'heartbeat_at': now}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+
+# True when the process that claimed a job is known to be gone: an earlier process on this host,
+# either with a pid that no longer exists or with this process's pid but another token (a restart)
+def owner_gone(owner):
+    try:
+        host, pid, _token = (owner or '').rsplit(':', 2)
+        pid = int(pid)
+    except ValueError:
+        return False
+    if host != socket.gethostname() or owner == worker_id():
+        return False
+    return pid == os.getpid() or not _pid_alive(pid)
+
+
+# Refresh heartbeat_at on every running job owned by this process
+def heartbeat_jobs():
+    touched = IngestionJob.query.filter_by(status='running', worker_id=worker_id()).update(
+        {'heartbeat_at': datetime.datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+    return touched
+
+
+# Requeue running jobs whose owner is gone: known dead on this host, or silent (no heartbeat, or for
+# jobs claimed before heartbeats existed, no start) for INGESTION_STALE_SECONDS. Each job is requeued by a
+# conditional update, so when several processes sweep at once only one takes it. Returns the requeued ids.
+def recover_interrupted_jobs(app):
+    stale = datetime.datetime.utcnow() - datetime.timedelta(seconds=app.config.get('INGESTION_STALE_SECONDS', 300))
+    silent = db.or_(IngestionJob.heartbeat_at < stale,
+                    db.and_(IngestionJob.heartbeat_at.is_(None), IngestionJob.started_at < stale))
+    rows = (IngestionJob.query.filter(IngestionJob.status == 'running',
+                                      db.or_(IngestionJob.worker_id != worker_id(), IngestionJob.worker_id.is_(None)))
+            .with_entities(IngestionJob.id, IngestionJob.worker_id, IngestionJob.heartbeat_at).all())
+    requeued = []
+    for job_id, owner, beat in rows:
+        condition = [IngestionJob.id == job_id, IngestionJob.status == 'running']
+        if owner_gone(owner):
+            condition.append(IngestionJob.worker_id == owner)
+        else:
+            condition.append(silent)
+        if IngestionJob.query.filter(*condition).update({'status': 'queued', 'worker_id': None},
+                                                        synchronize_session=False):
+            requeued.append(job_id)
+    db.session.commit()
+    if requeued:
+        logger.warning('Requeued %s interrupted ingestion job(s): %s', len(requeued), requeued)
+    return requeued
+
+
+# Every INGESTION_HEARTBEAT_SECONDS: heartbeat this process's jobs and, if it has a worker pool,
+# requeue interrupted jobs onto it
+def _monitor_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                heartbeat_jobs()
+                if _executor is not None:
+                    for job_id in recover_interrupted_jobs(app):
+                        _executor.submit(run_ingestion_job, app, job_id)
+        except Exception as e:
+            logger.error('Ingestion job monitor failed: %s', e)
+
+
+# Start the monitor once per process (not for inline INGESTION_EAGER runs, or with a heartbeat of 0)
+def ensure_job_monitor(app):
+    global _monitor
+    interval = app.config.get('INGESTION_HEARTBEAT_SECONDS', 30)
+    if app.config.get('INGESTION_EAGER') or interval <= 0:
+        return
+    with _monitor_lock:
+        if _monitor is None or not _monitor.is_alive():
+            _monitor = threading.Thread(target=_monitor_loop, args=(app, interval), name='ingestion-monitor',
+                                        daemon=True)
+            _monitor.start()
+
+
+# Execute one job's stages inside an application context
+def run_ingestion_job(app, job_id):
+    with app.app_context():
+        # Claim the job atomically so two workers (or processes) never run it twice
+        claimed = IngestionJob.query.filter_by(id=job_id, status='queued').update(
+            dict(claim_values(), stage_progress={}), synchronize_session=False
+        )
+        db.session.commit()
+        if not claimed:
+            return
+        ensure_job_monitor(app)
+        job = db.session.get(IngestionJob, job_id)
+
+        last_commit = [0.0]
+        # Record stage progress, committing at most every PROGRESS_INTERVAL seconds
+        def progress(stage, done, total):
+            stages = dict(job.stage_progress or {})
+            stages[stage] = {'done': done, 'total': total}
+            job.stage_progress = stages
+            job.stage = stage
+            now = time.monotonic()
+            if done >= total or now - last_commit[0] >= PROGRESS_INTERVAL:
+                last_commit[0] = now
+                db.session.commit()
+
+        try:
+            if job.source_url and job.document_id is None:
+                progress('fetch', 0, 1)
+                _save_scraped_text(job)
+                progress('fetch', 1, 1)
+            doc = db.session.get(UploadedDocument, job.document_id) if job.document_id else None
+            if doc is None:
+                raise RuntimeError('Document no longer exists.')
+            path = os.path.join('uploads', str(doc.user_id), doc.filename)
+            index_uploaded_document(doc, path, progress=progress)
+            job.status = 'succeeded'
+            job.stage = 'done'
+        except Exception as e:
+            db.session.rollback()
+            logger.error('Ingestion job %s failed: %s', job_id, e)
+            job = db.session.get(IngestionJob, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = datetime.datetime.utcnow()
+        db.session.commit()
+
+
+# Lazily create the worker pool and pick up jobs left behind by processes that are gone; the job
+# monitor then keeps sweeping for interrupted jobs while this process runs
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('INGESTION_MAX_WORKERS', 2),
+                thread_name_prefix='ingestion'
+            )
+            recover_interrupted_jobs(app)
+            ensure_job_monitor(app)
+            pending = IngestionJob.query.filter_by(status='queued').order_by(IngestionJob.id).all()
+            for job in pending:
+                _executor.submit(run_ingestion_job, app, job.id)
+            if pending:
+                logger.info('Resumed %s pending ingestion job(s).', len(pending))
+        return _executor
+
+
+# Start the worker pool (and with it the recovery sweep) when a serving process handles its first
+# request, so interrupted jobs resume after a restart without waiting for a new upload
+def start_ingestion_workers(app):
+    if not app.config.get('INGESTION_EAGER') and _executor is None:
+        _get_executor(app)
+
+
+# Persist a job for a saved document (or a URL to scrape) and hand it to the worker pool.
+# With INGESTION_EAGER set (tests, CLI) the job runs inline before returning.
+def enqueue_ingestion(user_id, document=None, source_url=None):
+    app = current_app._get_current_object()
+    executor = None if app.config.get('INGESTION_EAGER') else _get_executor(app)
+
+    job = IngestionJob(
+        user_id=user_id,
+        document_id=document.id if document is not None else None,
+        source_url=source_url,
+        stage_progress={}
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    if executor is None:
+        run_ingestion_job(app, job.id)
+        db.session.refresh(job)
+    else:
+        executor.submit(run_ingestion_job, app, job.id)
+    return job
+
+
+# Register saved files (see bulk_ingestion.save_entries) and process them in one bulk run on the
+# worker pool: parsing is spread over processes and writes are serialised. Returns the queued jobs.
+def enqueue_bulk_ingestion(user_id, filenames):
+    from app.bulk_ingestion import register_documents, run_bulk_ingestion
+    app = current_app._get_current_object()
+    # Created first, so its pass over leftover queued jobs does not pick up this batch one by one
+    executor = None if app.config.get('INGESTION_EAGER') else _get_executor(app)
+
+    jobs = register_documents(user_id, filenames)
+    job_ids = [job.id for job in jobs]
+    if executor is None:
+        run_bulk_ingestion(app, job_ids)
+        for job in jobs:
+            db.session.refresh(job)
+    else:
+        executor.submit(run_bulk_ingestion, app, job_ids)
+    return jobs
+
+
+# Crawl a site for a user on the worker pool (inline with INGESTION_EAGER, returning the crawl's counts).
+# Only pages that changed since the previous crawl of the same seed are re-indexed.
+def enqueue_crawl(user_id, url, max_pages=None, max_depth=None):
+    from app.crawler import run_crawl
+    app = current_app._get_current_object()
+    if app.config.get('INGESTION_EAGER'):
+        return run_crawl(app, user_id, url, max_pages, max_depth)
+    _get_executor(app).submit(run_crawl, app, user_id, url, max_pages, max_depth)
+    return None
@@ -0,0 +1,177 @@
+# app/lexical_index.py
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Identifier-like tokens (part numbers, versions, paths) are kept whole as well as split into pieces
+_TOKEN_RE = re.compile(r'\w+(?:[-./:]\w+)*')
+
+
+# Lower-cased terms for indexing and querying, e.g. "XR-200b v2.1" -> xr-200b, xr, 200b, v2.1, v2, 1
+def tokenize(text):
+    terms = []
+    for token in _TOKEN_RE.findall(text.casefold()):
+        terms.append(token)
+        parts = re.split(r'[-./:]', token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p)
+    return terms
+
+
+# Per-user BM25 inverted index in a SQLite file kept next to the user's Chroma collection.
+# Chunks use the same ids as their vectors, so both indexes are updated and deleted together.
+# The connection is closed when the handle pool evicts the index and reopened if it is used again.
+class LexicalIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = self._connect()
+
+    # Open connection to the index file (used under self._lock)
+    @property
+    def _conn(self):
+        if self._db is None:
+            self._db = self._connect()
+        return self._db
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(
+            'CREATE TABLE IF NOT EXISTS chunk ('
+            ' id TEXT PRIMARY KEY,'
+            ' document_id INTEGER,'
+            ' length INTEGER NOT NULL,'
+            ' text TEXT NOT NULL,'
+            ' metadata TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS ix_chunk_document_id ON chunk (document_id);'
+            'CREATE TABLE IF NOT EXISTS posting ('
+            ' term TEXT NOT NULL,'
+            ' chunk_id TEXT NOT NULL,'
+            ' tf INTEGER NOT NULL,'
+            ' PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS ix_posting_chunk_id ON posting (chunk_id);'
+        )
+        conn.commit()
+        return conn
+
+    # Insert or replace chunks; metadatas may carry document_id so a document can be removed later
+    def add(self, ids, texts, metadatas=None):
+        metadatas = metadatas or [{}] * len(ids)
+        with self._lock, self._conn:
+            self._delete_ids(ids)
+            for chunk_id, text, md in zip(ids, texts, metadatas):
+                md = md or {}
+                terms = Counter(tokenize(text))
+                self._conn.execute(
+                    'INSERT INTO chunk (id, document_id, length, text, metadata) VALUES (?, ?, ?, ?, ?)',
+                    (chunk_id, md.get('document_id'), sum(terms.values()), text, json.dumps(md))
+                )
+                self._conn.executemany(
+                    'INSERT INTO posting (term, chunk_id, tf) VALUES (?, ?, ?)',
+                    [(term, chunk_id, tf) for term, tf in terms.items()]
+                )
+
+    def _delete_ids(self, ids):
+        for i in range(0, len(ids), 500):
+            part = list(ids[i:i + 500])
+            marks = ','.join('?' * len(part))
+            self._conn.execute(f'DELETE FROM posting WHERE chunk_id IN ({marks})', part)
+            self._conn.execute(f'DELETE FROM chunk WHERE id IN ({marks})', part)
+
+    def delete_document(self, document_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM posting WHERE chunk_id IN (SELECT id FROM chunk WHERE document_id = ?)', (document_id,)
+            )
+            self._conn.execute('DELETE FROM chunk WHERE document_id = ?', (document_id,))
+
+    # Merge changes into the stored metadata of every chunk of a document (rename, folder move)
+    def update_document_metadata(self, document_id, changes):
+        with self._lock, self._conn:
+            rows = self._conn.execute('SELECT id, metadata FROM chunk WHERE document_id = ?', (document_id,)).fetchall()
+            self._conn.executemany(
+                'UPDATE chunk SET metadata = ? WHERE id = ?',
+                [(json.dumps({**json.loads(md), **changes}), chunk_id) for chunk_id, md in rows]
+            )
+            return len(rows)
+
+    def document_ids(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                'SELECT DISTINCT document_id FROM chunk WHERE document_id IS NOT NULL')}
+
+    # Rewrite the file without free pages left by deleted chunks
+    def vacuum(self):
+        with self._lock:
+            self._conn.execute('VACUUM')
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM posting')
+            self._conn.execute('DELETE FROM chunk')
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM chunk').fetchone()[0]
+
+    # Top k (chunk_id, text, metadata, score) by BM25 for the query's terms.
+    # document_ids restricts scoring to those documents' chunks (an empty list matches nothing).
+    def search(self, query, k=4, document_ids=None):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or (document_ids is not None and not document_ids):
+            return []
+        sql = ('SELECT p.chunk_id, p.tf, c.length FROM posting p JOIN chunk c ON c.id = p.chunk_id'
+               ' WHERE p.term = ?')
+        scope_args = ()
+        if document_ids is not None:
+            # Start from the scoped documents' chunks (CROSS JOIN fixes the join order) and probe each
+            # chunk's posting by primary key, so the work grows with the scope rather than the collection.
+            # The ids travel as one JSON parameter however many documents are in scope.
+            sql = ('SELECT p.chunk_id, p.tf, c.length FROM chunk c CROSS JOIN posting p'
+                   ' ON p.term = ? AND p.chunk_id = c.id'
+                   ' WHERE c.document_id IN (SELECT value FROM json_each(?))')
+            scope_args = (json.dumps([int(d) for d in document_ids]),)
+        with self._lock:
+            n, total_length = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunk').fetchone()
+            if not n:
+                return []
+            avgdl = total_length / n
+            scores = {}
+            for term in terms:
+                rows = self._conn.execute(sql, (term,) + scope_args).fetchall()
+                if not rows:
+                    continue
+                df = len(rows)
+                if document_ids is not None:
+                    # Scores stay comparable with unscoped searches: idf uses collection-wide frequencies
+                    df = self._conn.execute('SELECT COUNT(*) FROM posting WHERE term = ?', (term,)).fetchone()[0]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = tf + K1 * (1 - B + B * length / avgdl)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (K1 + 1) / norm
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            results = []
+            for chunk_id, score in best:
+                text, metadata = self._conn.execute(
+                    'SELECT text, metadata FROM chunk WHERE id = ?', (chunk_id,)
+                ).fetchone()
+                results.append((chunk_id, text, json.loads(metadata), score))
+            return results
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
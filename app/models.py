@@ -5,6 +5,10 @@ from app.extensions import db
 
 # User model
 class User(UserMixin, db.Model):
+    # Date-range scans for the admin time series
+    __table_args__ = (
+        db.Index('ix_user_date_joined', 'date_joined'),
+    )
     # Atttributes/columns of the User table
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), unique=True, nullable=False)
@@ -25,6 +29,8 @@ class User(UserMixin, db.Model):
         default=datetime.datetime.utcnow,
         nullable=False
     )
+    # Bumped whenever the user's indexed document set changes; cached answers are tied to a version
+    corpus_version = db.Column(db.Integer, default=0, nullable=False)
 
     # Relationships to other models
     documents = db.relationship(
@@ -39,6 +45,9 @@ class User(UserMixin, db.Model):
 
 # Folder model for organising user-uploaded documents
 class Folder(db.Model):
+    __table_args__ = (
+        db.Index('ix_folder_user_id', 'user_id'),
+    )
     # Attributes/columns of the Folder table
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -50,6 +59,11 @@ class Folder(db.Model):
 
 # Uploaded documents model for storing metadata about user-uploaded documents
 class UploadedDocument(db.Model):
+    # Serves the dashboard's newest-first keyset pagination per user
+    __table_args__ = (
+        db.Index('ix_uploaded_document_user_upload_date', 'user_id', 'upload_date', 'id'),
+        db.Index('ix_uploaded_document_upload_date', 'upload_date'),
+    )
     # Attributes/columns of the uploaded document table
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
@@ -70,8 +84,20 @@ class UploadedDocument(db.Model):
     )
     folder = db.relationship('Folder', backref='documents', lazy=True)
 
+    # Incremental indexing state: SHA-256 of the file contents the vectors were built from
+    content_hash = db.Column(db.String(64), nullable=True)
+    chunk_count = db.Column(db.Integer, default=0, nullable=False)
+    indexed_at = db.Column(db.DateTime, nullable=True)
+    # Bytes on disk, counted against the owner's upload quota (NULL for files uploaded before quotas)
+    file_size = db.Column(db.BigInteger, nullable=True)
+
 # Query history model for storing user queries, responses, and timestamps
 class QueryHistory(db.Model):
+    __table_args__ = (
+        db.Index('ix_query_history_user_question_hash', 'user_id', 'question_hash'),
+        db.Index('ix_query_history_user_timestamp', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_query_history_timestamp', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     question = db.Column(db.Text, nullable=False)
     answer = db.Column(db.Text, nullable=False)
@@ -83,4 +109,111 @@ class QueryHistory(db.Model):
         db.Integer,
         db.ForeignKey('user.id'),
         nullable=False
-    )
\ No newline at end of file
+    )
+    # Answer cache: SHA-256 of the normalised question and the corpus version it was answered against
+    question_hash = db.Column(db.String(64), nullable=True)
+    corpus_version = db.Column(db.Integer, nullable=True)
+    from_cache = db.Column(db.Boolean, default=False, nullable=False)
+    # Tokens sent to and generated by the LLM for this answer (None for cached answers and older rows)
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
+
+# Background ingestion job for an uploaded file or scraped URL
+class IngestionJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('user.id'),
+        nullable=False
+    )
+    # Set when the job is created for an upload, or after the fetch stage for a scrape
+    document_id = db.Column(
+        db.Integer,
+        db.ForeignKey('uploaded_document.id', ondelete='SET NULL'),
+        nullable=True
+    )
+    source_url = db.Column(db.String(2048), nullable=True)
+    # queued -> running -> succeeded | failed
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)
+    # Current stage: fetch, load, split, embed, store, done
+    stage = db.Column(db.String(20), default='queued', nullable=False)
+    # Per-stage progress, e.g. {"embed": {"done": 64, "total": 200}}
+    stage_progress = db.Column(db.JSON, default=dict, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(
+        db.DateTime,
+        default=datetime.datetime.utcnow,
+        nullable=False
+    )
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Process running the job (host:pid:token, see ingestion.worker_id) and its last sign of life
+    worker_id = db.Column(db.String(128), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    document = db.relationship('UploadedDocument', lazy=True)
+
+# Resumable chunked upload in progress: bytes are appended to a partial file until it reaches size
+class UploadSession(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('user.id'),
+        nullable=False,
+        index=True
+    )
+    filename = db.Column(db.String(200), nullable=False)
+    # Declared total size (reserved against the quota) and bytes received so far
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, default=0, nullable=False)
+    # active -> completed | aborted
+    status = db.Column(db.String(20), default='active', nullable=False)
+    created_at = db.Column(
+        db.DateTime,
+        default=datetime.datetime.utcnow,
+        nullable=False
+    )
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.datetime.utcnow,
+        nullable=False
+    )
+
+# A crawled web page and the validators from its last fetch, so re-crawls can send conditional
+# requests and only re-index pages whose text changed
+class CrawledPage(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'url', name='uq_crawled_page_user_url'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('user.id'),
+        nullable=False
+    )
+    url = db.Column(db.String(2048), nullable=False)
+    # Page the crawl started from; a re-crawl of the same seed revisits every page found before
+    seed_url = db.Column(db.String(2048), nullable=False)
+    document_id = db.Column(
+        db.Integer,
+        db.ForeignKey('uploaded_document.id', ondelete='SET NULL'),
+        nullable=True
+    )
+    etag = db.Column(db.String(256), nullable=True)
+    last_modified = db.Column(db.String(64), nullable=True)
+    # SHA-256 of the extracted text, so pages re-served without validators are still skipped when unchanged
+    text_hash = db.Column(db.String(64), nullable=True)
+    status_code = db.Column(db.Integer, nullable=True)
+    fetched_at = db.Column(db.DateTime, nullable=True)
+    changed_at = db.Column(db.DateTime, nullable=True)
+
+    document = db.relationship('UploadedDocument', lazy=True)
+
+# Per-day activity totals for the admin dashboard, kept current as rows are written (see app/stats.py)
+class DailyStat(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    users_joined = db.Column(db.Integer, default=0, nullable=False)
+    documents_uploaded = db.Column(db.Integer, default=0, nullable=False)
+    queries_run = db.Column(db.Integer, default=0, nullable=False)
+    # Distinct users who ran at least one query that day
+    active_users = db.Column(db.Integer, default=0, nullable=False)
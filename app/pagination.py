@@ -0,0 +1,62 @@
+# app/pagination.py
+import json
+import base64
+import datetime
+
+from sqlalchemy import tuple_, DateTime
+from sqlalchemy.engine import Row
+
+# Default and maximum page sizes (overridable through app config)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# Opaque cursor for the last row of a page: its sort value and id
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+# Returns (value, id), or None for a missing or malformed cursor
+def decode_cursor(cursor, datetimes=True):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        if datetimes and value is not None:
+            value = datetime.datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+# Page size from a request argument, clamped to [1, MAX_PAGE_SIZE]
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+# One page of query ordered by (sort_column, id_column), newest first unless descending=False,
+# starting after cursor. Seeks on the composite index instead of counting past OFFSET rows,
+# so every page costs the same. Returns (rows, next_cursor); next_cursor is None on the last page.
+def keyset_page(query, sort_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=True):
+    position = decode_cursor(cursor, datetimes=isinstance(sort_column.type, DateTime))
+    if position is not None:
+        key = tuple_(sort_column, id_column)
+        query = query.filter(key < tuple_(*position) if descending else key > tuple_(*position))
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    # Queries selecting extra columns return rows whose first element is the entity
+    last = rows[-1][0] if isinstance(rows[-1], Row) else rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
@@ -0,0 +1,171 @@
+# app/parse_cache.py
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+import threading
+
+from app.chunking import RecursiveChunker
+
+# Default cache location (overridable through app config)
+DEFAULT_CACHE_DIR = os.path.join('instance', 'parse_cache')
+
+# Bump when the on-disk layout changes so old entries are ignored
+FORMAT_VERSION = 1
+
+
+# One cached parse of a file version: the extracted elements and, per chunker setting,
+# the chunk boundaries within them. The file is only read when elements are first needed.
+class ParsedDocument:
+    def __init__(self, path, data=None):
+        self.path = path
+        self._data = data
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._data is None:
+                with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            return self._data
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    # [{'text': ..., 'metadata': {...}}, ...] as returned by the loader
+    @property
+    def elements(self):
+        return self._load()['elements']
+
+    @property
+    def text(self):
+        return '\n\n'.join(e['text'] for e in self.elements)
+
+    # Chunks as LangChain documents, from chunker (see app.chunking) or else a character splitter of
+    # chunk_size / chunk_overlap. Boundaries are computed once per chunker setting and stored alongside
+    # the elements, so later calls only slice the cached text.
+    def chunks(self, chunk_size=1000, chunk_overlap=200, chunker=None):
+        from langchain.schema import Document
+        chunker = chunker or RecursiveChunker(chunk_size, chunk_overlap)
+        data = self._load()
+        key = chunker.key
+        bounds = data['chunks'].get(key)
+        if bounds is None:
+            bounds = _chunk_boundaries(data['elements'], chunker)
+            # Written under the lock: another thread adding a chunker setting would change the dict mid-dump
+            with self._lock:
+                data['chunks'][key] = bounds
+                _write(self.path, data)
+
+        chunks = []
+        for bound in bounds:
+            element = data['elements'][bound[0]]
+            if len(bound) == 3:
+                start, end = bound[1], bound[2]
+                text = element['text'][start:end]
+                metadata = dict(element['metadata'], start_index=start)
+            else:
+                # The splitter could not place this chunk in its element; the text is stored verbatim
+                text = bound[1]
+                metadata = dict(element['metadata'])
+            chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+
+# Split each element and record where every chunk sits: [element, start, end], or [element, text]
+# when the chunk is not a verbatim slice of the element
+def _chunk_boundaries(elements, chunker):
+    bounds = []
+    for i, element in enumerate(elements):
+        for span in chunker.spans(element['text']):
+            bounds.append([i, *span] if isinstance(span, tuple) else [i, span])
+    return bounds
+
+
+# Atomically replace a cache entry so concurrent readers never see a partial file
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# Parsed-document store keyed by file content hash and loader version (gzip JSON files on disk)
+class ParseCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def entry_path(self, content_hash, loader_version):
+        loader_key = hashlib.sha256(f'{FORMAT_VERSION}:{loader_version}'.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.root, content_hash[:2], f'{content_hash}-{loader_key}.json.gz')
+
+    # Lazy handle for a cached parse, or None if this file version was never parsed by this loader
+    def get(self, content_hash, loader_version):
+        path = self.entry_path(content_hash, loader_version)
+        found = os.path.exists(path)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return ParsedDocument(path) if found else None
+
+    # Store loader output given as (text, metadata) pairs; metadata must be JSON-serialisable
+    def put(self, content_hash, loader_version, elements):
+        data = {
+            'format': FORMAT_VERSION,
+            'loader': loader_version,
+            'elements': [{'text': text, 'metadata': metadata} for text, metadata in elements],
+            'chunks': {},
+        }
+        path = self.entry_path(content_hash, loader_version)
+        _write(path, data)
+        return ParsedDocument(path, data)
+
+    # Return the cached parse, running parse() and storing its output only on a miss
+    def get_or_parse(self, content_hash, loader_version, parse):
+        parsed = self.get(content_hash, loader_version)
+        if parsed is not None:
+            return parsed
+        return self.put(content_hash, loader_version, parse())
+
+    def stats(self):
+        entries = size = 0
+        if os.path.isdir(self.root):
+            for dirpath, _dirs, files in os.walk(self.root):
+                for name in files:
+                    if name.endswith('.json.gz'):
+                        entries += 1
+                        size += os.path.getsize(os.path.join(dirpath, name))
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'entries': entries,
+                'bytes': size,
+            }
+
+
+# The shared parse cache for this process (created on first use)
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_parse_cache(root=DEFAULT_CACHE_DIR):
+    global _cache
+    with _cache_lock:
+        if _cache is None or _cache.root != root:
+            _cache = ParseCache(root)
+        return _cache
@@ -0,0 +1,156 @@
+# app/quantization.py
+import os
+
+import numpy as np
+
+# Defaults (overridable through app config)
+DEFAULT_RESCORE_FACTOR = 10
+DEFAULT_TRAIN_MIN = 1024
+DEFAULT_PQ_SUBVECTOR_DIMS = 16
+
+# Rows sampled to train a quantizer, k-means iterations and centroids per product-quantizer subspace
+TRAIN_SAMPLE = 8192
+PQ_ITERATIONS = 10
+PQ_CENTROIDS = 256
+
+
+# int8 scalar quantization: each dimension is scaled by its largest magnitude in the training sample
+# and rounded to [-127, 127]. A quarter of the float32 size; inner products stay within ~1% of exact.
+class ScalarQuantizer:
+    kind = 'int8'
+    code_dtype = np.int8
+
+    def __init__(self, dim, scale=None):
+        self.dim = dim
+        self.scale = scale
+        self.code_size = dim
+
+    @property
+    def trained(self):
+        return self.scale is not None
+
+    def train(self, sample):
+        scale = np.abs(sample).max(axis=0).astype(np.float32)
+        scale[scale == 0] = 1.0
+        self.scale = scale
+
+    def encode(self, vectors):
+        return np.clip(np.rint(vectors / self.scale * 127), -127, 127).astype(np.int8)
+
+    # Fold the per-dimension scale into the query once, so scoring is one matrix-vector product
+    def prepare(self, query):
+        return (query * self.scale / 127).astype(np.float32)
+
+    def scores(self, codes, prepared):
+        return codes.astype(np.float32) @ prepared
+
+    def state(self):
+        return {'scale': self.scale}
+
+    @classmethod
+    def from_state(cls, dim, state):
+        return cls(dim, scale=state['scale'])
+
+
+# Product quantization: vectors are split into subvectors of sub_dims dimensions, and each is replaced
+# by the index of its nearest of 256 k-means centroids, one byte per subvector (1536 float32 dimensions
+# become 96 bytes). Queries are scored against a per-subspace lookup table of query·centroid.
+class ProductQuantizer:
+    kind = 'pq'
+    code_dtype = np.uint8
+
+    def __init__(self, dim, sub_dims=DEFAULT_PQ_SUBVECTOR_DIMS, centroids=None):
+        self.dim = dim
+        self.sub_dims = sub_dims
+        self.code_size = -(-dim // sub_dims)
+        # (subspaces, 256, sub_dims)
+        self.centroids = centroids
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    # Zero-pad to a whole number of subvectors and split: (n, dim) -> (subspaces, n, sub_dims)
+    def _split(self, vectors):
+        padded = np.zeros((len(vectors), self.code_size * self.sub_dims), dtype=np.float32)
+        padded[:, :self.dim] = vectors
+        return padded.reshape(len(vectors), self.code_size, self.sub_dims).transpose(1, 0, 2)
+
+    def train(self, sample, seed=0):
+        rng = np.random.default_rng(seed)
+        parts = self._split(sample)
+        count = min(PQ_CENTROIDS, len(sample))
+        centroids = np.zeros((self.code_size, PQ_CENTROIDS, self.sub_dims), dtype=np.float32)
+        for m, part in enumerate(parts):
+            centres = part[rng.choice(len(part), count, replace=False)]
+            for _ in range(PQ_ITERATIONS):
+                labels = self._nearest(part, centres)
+                sums = np.zeros_like(centres)
+                np.add.at(sums, labels, part)
+                sizes = np.bincount(labels, minlength=count)[:, None]
+                # Empty clusters keep their previous centre
+                centres = np.where(sizes > 0, sums / np.maximum(sizes, 1), centres)
+            centroids[m, :count] = centres
+            # Unused codes (tiny samples) point at a real centre rather than at zero
+            centroids[m, count:] = centres[0]
+        self.centroids = centroids
+
+    @staticmethod
+    def _nearest(part, centres):
+        distances = (centres ** 2).sum(axis=1) - 2 * part @ centres.T
+        return distances.argmin(axis=1)
+
+    def encode(self, vectors):
+        parts = self._split(vectors)
+        codes = np.empty((len(vectors), self.code_size), dtype=np.uint8)
+        for m, part in enumerate(parts):
+            codes[:, m] = self._nearest(part, self.centroids[m])
+        return codes
+
+    # (subspaces, 256) table of partial inner products, flattened for one gather per code
+    def prepare(self, query):
+        parts = self._split(query[None, :])[:, 0, :]
+        return np.einsum('md,mcd->mc', parts, self.centroids).ravel()
+
+    def scores(self, codes, prepared):
+        offsets = np.arange(self.code_size, dtype=np.intp) * PQ_CENTROIDS
+        return prepared[codes.astype(np.intp) + offsets].sum(axis=1)
+
+    def state(self):
+        return {'centroids': self.centroids, 'sub_dims': np.array(self.sub_dims)}
+
+    @classmethod
+    def from_state(cls, dim, state):
+        return cls(dim, sub_dims=int(state['sub_dims']), centroids=state['centroids'])
+
+
+QUANTIZERS = {q.kind: q for q in (ScalarQuantizer, ProductQuantizer)}
+
+
+def quantization_names():
+    return ['none', *sorted(QUANTIZERS)]
+
+
+# An untrained quantizer for kind ('none' or empty gives None); raises ValueError for unknown kinds
+def create_quantizer(kind, dim, pq_sub_dims=DEFAULT_PQ_SUBVECTOR_DIMS):
+    kind = (kind or 'none').lower()
+    if kind == 'none':
+        return None
+    if kind not in QUANTIZERS:
+        raise ValueError(f"Unknown vector quantization {kind!r}; expected one of {', '.join(quantization_names())}.")
+    if kind == 'pq':
+        return ProductQuantizer(dim, sub_dims=pq_sub_dims)
+    return QUANTIZERS[kind](dim)
+
+
+def save_quantizer(quantizer, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, kind=np.array(quantizer.kind), **quantizer.state())
+    os.replace(tmp_path, path)
+
+
+def load_quantizer(path, dim):
+    with np.load(path) as data:
+        state = {key: data[key] for key in data.files}
+    return QUANTIZERS[str(state.pop('kind'))].from_state(dim, state)
@@ -1,7 +1,9 @@
 # app/queries/routes.py
-import os
+import json
 import logging
 import warnings
+import functools
+from time import perf_counter
 
 from flask import (
     request,
@@ -9,26 +11,23 @@ from flask import (
     url_for,
     flash,
     current_app,
+    jsonify,
+    Response,
+    stream_with_context,
+    render_template,
 )
 from flask_login import login_required, current_user
-from pydantic import PydanticDeprecatedSince211
-
-from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain.schema import Document as LC_Document
-from langchain_openai import ChatOpenAI
-# PDF loader
-from langchain_community.document_loaders import PyPDFLoader
 
 from app.extensions import db
 from app.models import QueryHistory, UploadedDocument
-from app.utils import update_user_vectorstore
+from app.utils import get_embeddings, get_user_vectorstore, get_user_lexical_index
+from app.answer_cache import get_answer_cache, question_hash
+from app.pagination import keyset_page, page_size
 from . import query_bp
 
-# Suppress the ChromaDB / Pydantic deprecation warning
+# Suppress the ChromaDB / Pydantic deprecation warning (matched by message so pydantic is not imported at startup)
 warnings.filterwarnings(
     "ignore",
-    category=PydanticDeprecatedSince211,
     message="Accessing this attribute on the instance is deprecated.*"
 )
 
@@ -52,10 +51,133 @@ Question:
 
 Answer:"""
 
-QA_PROMPT = PromptTemplate(
-    template=QA_TEMPLATE,
-    input_variables=["context", "question"]
-)
+# Built on first use so LangChain is only imported once a question is asked
+@functools.lru_cache(maxsize=None)
+def qa_prompt():
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate(
+        template=QA_TEMPLATE,
+        input_variables=["context", "question"]
+    )
+
+# Initialise ChatOpenAI for gpt-4o-mini (this can be replaced with other OpenAI models)
+# OPENAI_BASE_URL lets the app (and tests) point at any OpenAI-compatible server.
+# Streamed answers ask for the token usage, which the server sends after the last token.
+def build_llm(streaming=False):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model_name=current_app.config.get("QA_MODEL", "gpt-4o-mini"),
+        temperature=0,
+        openai_api_key=current_app.config["OPENAI_API_KEY"],
+        base_url=current_app.config.get("OPENAI_BASE_URL") or None,
+        streaming=streaming,
+        stream_usage=streaming
+    )
+
+# Retriever over the user's existing collection and BM25 index; documents are indexed once at ingestion time.
+# document_ids restricts retrieval to those documents (see requested_scope).
+def build_retriever(user_id, document_ids=None):
+    from langchain_chroma import Chroma
+    from chromadb.config import Settings
+    from app.retrieval import HybridRetriever
+    from app.reranking import create_reranker
+    from app.context_budget import create_context_budget
+
+    embeddings = get_embeddings(current_app.config)
+    vectorstore = get_user_vectorstore(
+        user_id,
+        embeddings,
+        Chroma,
+        Settings
+    )
+    # Fuse vector and keyword rankings, optionally rerank, keep the top RETRIEVAL_K chunks and fit them
+    # into the CONTEXT_MAX_TOKENS prompt budget
+    return HybridRetriever(
+        vectorstore=vectorstore,
+        lexical=get_user_lexical_index(user_id),
+        k=current_app.config.get("RETRIEVAL_K", 3),
+        fetch_k=current_app.config.get("RETRIEVAL_FETCH_K", 20),
+        rrf_k=current_app.config.get("RETRIEVAL_RRF_K", 60),
+        mode=current_app.config.get("RETRIEVAL_MODE", "hybrid"),
+        document_ids=document_ids,
+        reranker=create_reranker(current_app.config),
+        rerank_candidates=current_app.config.get("RERANK_CANDIDATES", 10),
+        context_budget=create_context_budget(current_app.config)
+    )
+
+# Per-stage seconds for the client and logs
+def _rounded(timings):
+    return {stage: round(seconds, 4) for stage, seconds in timings.items()}
+
+# Token usage of an answer served from the cache: no model was called
+CACHED_USAGE = {"prompt_tokens": 0, "completion_tokens": 0}
+
+# Prompt and completion token counts: the provider's when it reports them (usage metadata), otherwise
+# counted locally with CONTEXT_TOKENIZER
+def token_usage(prompt, answer, reported=None):
+    if reported:
+        return {"prompt_tokens": reported["input_tokens"], "completion_tokens": reported["output_tokens"]}
+    from app.context_budget import create_token_counter
+    count = create_token_counter(current_app.config)
+    return {"prompt_tokens": count(prompt), "completion_tokens": count(answer)}
+
+# The "stuff" prompt for a question: the context passages joined by blank lines, as RetrievalQA does
+def build_prompt(question, docs):
+    return qa_prompt().format(context="\n\n".join(d.page_content for d in docs), question=question)
+
+def _int_list(values):
+    if not isinstance(values, (list, tuple)):
+        values = [values]
+    return [int(v) for v in values if str(v).strip().isdigit()]
+
+# Documents a question is limited to, from folder_id / document_id form fields (or folder_ids /
+# document_ids JSON lists). Returns None to search everything; ids the user does not own are ignored.
+# Folders are resolved here rather than by chunk metadata, so moving a document takes effect at once.
+def requested_scope(user_id):
+    data = request.get_json(silent=True) or {}
+    folder_ids = _int_list(request.form.getlist("folder_id") or data.get("folder_ids") or [])
+    document_ids = _int_list(request.form.getlist("document_id") or data.get("document_ids") or [])
+    if not folder_ids and not document_ids:
+        return None
+    conditions = []
+    if folder_ids:
+        conditions.append(UploadedDocument.folder_id.in_(folder_ids))
+    if document_ids:
+        conditions.append(UploadedDocument.id.in_(document_ids))
+    rows = db.session.query(UploadedDocument.id).filter(
+        UploadedDocument.user_id == user_id, db.or_(*conditions)
+    )
+    return sorted(row.id for row in rows)
+
+# Look for a cached answer to this question; returns (answer, match) or (None, None).
+# The embedding backend is only built when there are near-duplicate candidates, and a failure
+# there (no API key, provider down) is a cache miss, not a failed query.
+def lookup_cached_answer(user_id, corpus_version, question):
+    if not current_app.config.get("ANSWER_CACHE_ENABLED", True):
+        return None, None
+    config = current_app.config
+    embeddings = []
+
+    def embed_query(text):
+        if not embeddings:
+            embeddings.append(get_embeddings(config))
+        return embeddings[0].embed_query(text)
+    return get_answer_cache().lookup(user_id, corpus_version, question, embed_query)
+
+# Build a history row tagged for the answer cache (answers from a scoped search are left untagged,
+# so they are never served for the same question asked of the whole library), with its token usage
+def history_record(user_id, corpus_version, question, answer, from_cache=False, scoped=False, usage=None):
+    usage = usage or {}
+    return QueryHistory(
+        question=question,
+        answer=answer,
+        user_id=user_id,
+        question_hash=None if scoped else question_hash(question),
+        corpus_version=corpus_version,
+        from_cache=from_cache,
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens")
+    )
 
 @query_bp.route("/query", methods=["POST"])
 @login_required
@@ -66,89 +188,63 @@ def process_query():
         flash("No question provided.")
         return redirect(url_for("dashboard"))
 
-    # Re-load all of the user's documents from disk, handling PDFs separately
-    docs = []
-    user_docs = UploadedDocument.query.filter_by(user_id=current_user.id).all()
-    for doc in user_docs:
-        path = os.path.join("uploads", str(current_user.id), doc.filename)
-        if not os.path.exists(path):
-            continue
+    scope = requested_scope(current_user.id)
+    if scope == []:
+        flash("No documents in the selected scope.")
+        return redirect(url_for("dashboard"))
+
+    # Serve repeated and near-duplicate questions from earlier answers (cached answers cover the whole library)
+    corpus_version = current_user.corpus_version
+    cached, match = lookup_cached_answer(current_user.id, corpus_version, question) if scope is None else (None, None)
+    if cached is not None:
         try:
-            if doc.filename.lower().endswith('.pdf'):
-                # Use PyPDFLoader for PDFs
-                loader = PyPDFLoader(path)
-                pages = loader.load()
-                for page in pages:
-                    docs.append(
-                        LC_Document(
-                            page_content=page.page_content,
-                            metadata={**page.metadata, "filename": doc.filename}
-                        )
-                    )
-            else:
-                # Read plain text or scraped .txt files
-                with open(path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                if text:
-                    docs.append(
-                        LC_Document(
-                            page_content=text,
-                            metadata={"filename": doc.filename}
-                        )
-                    )
+            db.session.add(history_record(current_user.id, corpus_version, question, cached, from_cache=True,
+                                          usage=CACHED_USAGE))
+            db.session.commit()
         except Exception as e:
-            logger.error("Error reading %s: %s", path, e)
-
-    # Rebuild the vector store for this user
-    from langchain_openai import OpenAIEmbeddings
-    from langchain_chroma import Chroma
-    from chromadb.config import Settings
-
-    embeddings = OpenAIEmbeddings(
-        openai_api_key=current_app.config.get("OPENAI_API_KEY")
-    )
-    vectorstore = update_user_vectorstore(
-        current_user.id,
-        docs,
-        embeddings,
-        Chroma,
-        Settings
-    )
-
-    # Initialise ChatOpenAI for gpt-4o-mini (this can be replaced with other OpenAI models)
-    llm = ChatOpenAI(
-        model_name="gpt-4o-mini",
-        temperature=0,
-        openai_api_key=current_app.config["OPENAI_API_KEY"]
-    )
+            db.session.rollback()
+            logger.error("Error saving query: %s", e)
+            flash("Error saving your query.")
+            return redirect(url_for("dashboard"))
+        flash("Query answered from cache ({} match).".format(match))
+        return redirect(url_for("dashboard"))
 
-    # Configure the retriever to fetch top 3 most relevant chunks
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+    llm = build_llm()
+    retriever = build_retriever(current_user.id, scope)
 
     # Build the RetrievalQA chain using our custom prompt
+    from langchain.chains import RetrievalQA
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
         retriever=retriever,
-        chain_type_kwargs={"prompt": QA_PROMPT},
+        chain_type_kwargs={"prompt": qa_prompt()},
+        return_source_documents=True,
     )
 
+    # Collects the usage the provider reports for the LLM call, as the stream path reads it from the last chunk
+    from langchain_core.callbacks import UsageMetadataCallbackHandler
+    usage_callback = UsageMetadataCallbackHandler()
+
     try:
         # Use the new invoke() interface instead of deprecated run()
-        result = qa_chain.invoke({"query": question})
+        result = qa_chain.invoke({"query": question}, config={"callbacks": [usage_callback]})
         # Extraction: if result is a dict, pull out the "result" key; else assume it's a string
         answer = result.get("result") if isinstance(result, dict) else result
+        docs = result.get("source_documents", []) if isinstance(result, dict) else []
     except Exception as e:
         logger.error("Error during QA: %s", e)
         flash("Error processing your query. Please try again.")
         return redirect(url_for("dashboard"))
 
-    # Save the Q&A to user history
-    record = QueryHistory(
-        question=question,
-        answer=answer,
-        user_id=current_user.id
-    )
+    reported = next(iter(usage_callback.usage_metadata.values()), None)
+    usage = token_usage(build_prompt(question, docs), answer or "", reported)
+    logger.info("Query stages: %s, context: %s, tokens: %s", _rounded(getattr(retriever, "timings", {})),
+                getattr(retriever, "context", {}), usage)
+
+    # Save the Q&A and its token usage to user history
+    record = history_record(current_user.id, corpus_version, question, answer, scoped=scope is not None,
+                            usage=usage)
     try:
         db.session.add(record)
         db.session.commit()
@@ -157,10 +253,151 @@ def process_query():
         logger.error("Error saving query: %s", e)
         flash("Error saving your query.")
         return redirect(url_for("dashboard"))
+    if scope is None:
+        get_answer_cache().remember(current_user.id, corpus_version, question, answer)
 
     flash("Query processed!")
     return redirect(url_for("dashboard"))
 
+# Format one Server-Sent Event
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Short description of a retrieved chunk for the client
+def _source_summary(doc):
+    md = doc.metadata or {}
+    return {
+        "document_id": md.get("document_id"),
+        "filename": md.get("filename"),
+        "snippet": doc.page_content[:200],
+    }
+
+@query_bp.route("/query/stream", methods=["POST"])
+@login_required
+def stream_query():
+    # Same input as /query, but the answer is streamed back as Server-Sent Events:
+    #   retrieval -> the chunks used as context, token -> answer text as it is generated,
+    #   done -> the saved history id, token usage and timings, error -> a failure message
+    question = (request.form.get("question") or (request.get_json(silent=True) or {}).get("question") or "").strip()
+    if not question:
+        return jsonify(error="No question provided."), 400
+    user_id = current_user.id
+    corpus_version = current_user.corpus_version
+    scope = requested_scope(user_id)
+    if scope == []:
+        return jsonify(error="No documents in the selected scope."), 400
+
+    def generate():
+        start = perf_counter()
+        try:
+            # A cached answer is sent as a single token with no retrieval
+            cached, match = lookup_cached_answer(user_id, corpus_version, question) if scope is None else (None, None)
+            if cached is not None:
+                record = history_record(user_id, corpus_version, question, cached, from_cache=True,
+                                        usage=CACHED_USAGE)
+                db.session.add(record)
+                db.session.commit()
+                yield _sse("retrieval", {"sources": [], "cached": True, "elapsed": round(perf_counter() - start, 3)})
+                yield _sse("token", {"text": cached})
+                yield _sse("done", {
+                    "query_id": record.id,
+                    "answer": cached,
+                    "cached": True,
+                    "cache_match": match,
+                    "usage": CACHED_USAGE,
+                    "time_to_first_token": round(perf_counter() - start, 3),
+                    "elapsed": round(perf_counter() - start, 3),
+                })
+                return
+
+            retriever = build_retriever(user_id, scope)
+            docs = retriever.invoke(question)
+            timings = dict(getattr(retriever, "timings", {}))
+            yield _sse("retrieval", {
+                "sources": [_source_summary(d) for d in docs],
+                "scope": scope,
+                "context": getattr(retriever, "context", {}),
+                "timings": _rounded(timings),
+                "elapsed": round(perf_counter() - start, 3),
+            })
+            generate_start = perf_counter()
+
+            # "stuff" the retrieved chunks into the prompt exactly as RetrievalQA does
+            prompt = build_prompt(question, docs)
+            parts = []
+            first_token = None
+            reported = None
+            for chunk in build_llm(streaming=True).stream(prompt):
+                reported = getattr(chunk, "usage_metadata", None) or reported
+                if not chunk.content:
+                    continue
+                if first_token is None:
+                    first_token = perf_counter() - start
+                parts.append(chunk.content)
+                yield _sse("token", {"text": chunk.content})
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error during streamed QA: %s", e)
+            yield _sse("error", {"message": "Error processing your query. Please try again."})
+            return
+
+        # Save the Q&A to user history once the full answer is known
+        answer = "".join(parts)
+        timings["generate"] = perf_counter() - generate_start
+        usage = token_usage(prompt, answer, reported)
+        record = history_record(user_id, corpus_version, question, answer, scoped=scope is not None, usage=usage)
+        try:
+            db.session.add(record)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error saving query: %s", e)
+            yield _sse("error", {"message": "Error saving your query."})
+            return
+        if scope is None:
+            get_answer_cache().remember(user_id, corpus_version, question, answer)
+        total = perf_counter() - start
+        logger.info("Streamed query %s: first token %.3fs, total %.3fs, stages %s, tokens %s", record.id,
+                    first_token if first_token is not None else total, total, _rounded(timings), usage)
+        yield _sse("done", {
+            "query_id": record.id,
+            "answer": answer,
+            "cached": False,
+            "chunks": len(docs),
+            "usage": usage,
+            "timings": _rounded(timings),
+            "time_to_first_token": round(first_token, 3) if first_token is not None else None,
+            "elapsed": round(total, 3),
+        })
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    # Stop proxies from buffering the stream
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# One page of the user's question history, newest first, for lazy loading on the dashboard
+@query_bp.route("/history")
+@login_required
+def list_history():
+    records, next_cursor = keyset_page(
+        QueryHistory.query.filter_by(user_id=current_user.id),
+        QueryHistory.timestamp, QueryHistory.id,
+        cursor=request.args.get("cursor"),
+        limit=page_size(request.args.get("limit"), current_app.config.get("DASHBOARD_PAGE_SIZE", 50))
+    )
+    items = [{
+        "id": q.id,
+        "question": q.question,
+        "answer": q.answer,
+        "timestamp": q.timestamp.isoformat(),
+        "from_cache": q.from_cache,
+        "prompt_tokens": q.prompt_tokens,
+        "completion_tokens": q.completion_tokens,
+        "html": render_template("_query_item.html", q=q),
+    } for q in records]
+    return jsonify(items=items, next_cursor=next_cursor)
+
 @query_bp.route("/delete_query/<int:query_id>", methods=["POST"])
 @login_required
 def delete_query(query_id):
@@ -0,0 +1,117 @@
+# app/reranking.py
+import re
+
+# Defaults (overridable through app config)
+DEFAULT_RERANKER = 'none'
+DEFAULT_CANDIDATES = 10
+DEFAULT_MMR_LAMBDA = 0.7
+DEFAULT_PRIOR_WEIGHT = 0.3
+
+# RERANKER name -> factory(config) -> reranker
+_rerankers = {}
+
+
+# Register a reranker under a name usable as RERANKER. A reranker has rerank(query, docs, k, vectors)
+# returning the k documents to keep, best first, and a needs_vectors flag; when it is set, vectors() returns
+# (query vector, candidate matrix in docs order) from the store, or None if they are unavailable.
+def register_reranker(name):
+    def decorator(factory):
+        _rerankers[name] = factory
+        return factory
+    return decorator
+
+
+def reranker_names():
+    return sorted(['none', *_rerankers])
+
+
+# The configured reranker, or None for 'none'; raises ValueError for unknown names
+def create_reranker(config):
+    name = (config.get('RERANKER') or DEFAULT_RERANKER).lower()
+    if name == 'none':
+        return None
+    if name not in _rerankers:
+        raise ValueError(f"Unknown RERANKER {name!r}; expected one of {', '.join(reranker_names())}.")
+    return _rerankers[name](config)
+
+
+# Maximal marginal relevance over unit vectors: repeatedly pick the candidate maximising
+# lambda_mult * relevance - (1 - lambda_mult) * (highest similarity to anything already picked).
+# One matrix product gives every pairwise similarity, so each step is a vectorised max/argmax.
+# Returns candidate indices in selection order.
+def mmr_select(query_vector, candidates, k, lambda_mult=DEFAULT_MMR_LAMBDA):
+    import numpy as np
+    matrix = np.asarray(candidates, dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = matrix @ query
+    similarity = matrix @ matrix.T
+    redundancy = np.zeros(len(matrix), dtype=np.float32)
+    available = np.ones(len(matrix), dtype=bool)
+    selected = []
+    for _ in range(min(k, len(matrix))):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+# Diversifies the context: near-duplicate chunks (the same passage from overlapping splits, repeated
+# boilerplate) give way to chunks that add information, so fewer chunks cover the answer.
+@register_reranker('mmr')
+class MMRReranker:
+    needs_vectors = True
+
+    def __init__(self, config=None):
+        self.lambda_mult = (config or {}).get('RERANK_MMR_LAMBDA', DEFAULT_MMR_LAMBDA)
+
+    def rerank(self, query, docs, k, vectors=None):
+        if len(docs) <= 1 or vectors is None:
+            return docs[:k]
+        found = vectors()
+        if found is None:
+            return docs[:k]
+        query_vector, matrix = found
+        return [docs[i] for i in mmr_select(query_vector, matrix, k, self.lambda_mult)]
+
+
+_WORD_RE = re.compile(r'\w+')
+STOPWORDS = frozenset(
+    'a an and are as at be by can do does for from how i in is it of on or should the this to was what '
+    'when where which who why will with'.split()
+)
+
+
+def _words(text):
+    return _WORD_RE.findall(text.casefold())
+
+
+# Local CPU cross-scorer: scores each (question, chunk) pair jointly, with no model download. A chunk
+# scores for the share of the question's content words it contains, more for containing them as the
+# same adjacent pairs (phrases), plus a prior from its first-stage rank so ties keep the fused order.
+@register_reranker('overlap')
+class TermOverlapReranker:
+    needs_vectors = False
+
+    def __init__(self, config=None):
+        self.prior_weight = (config or {}).get('RERANK_PRIOR_WEIGHT', DEFAULT_PRIOR_WEIGHT)
+
+    def score(self, query_words, query_pairs, text, rank):
+        words = _words(text)
+        present = set(words)
+        coverage = sum(1 for w in query_words if w in present) / len(query_words) if query_words else 0.0
+        pairs = set(zip(words, words[1:]))
+        phrases = sum(1 for p in query_pairs if p in pairs) / len(query_pairs) if query_pairs else 0.0
+        return coverage + 0.5 * phrases + self.prior_weight / (1 + rank)
+
+    def rerank(self, query, docs, k, vectors=None):
+        words = _words(query)
+        query_words = {w for w in words if w not in STOPWORDS}
+        query_pairs = {p for p in zip(words, words[1:]) if not (p[0] in STOPWORDS and p[1] in STOPWORDS)}
+        scores = [self.score(query_words, query_pairs, d.page_content, rank) for rank, d in enumerate(docs)]
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[:k]]
@@ -0,0 +1,164 @@
+# app/retrieval.py
+import re
+import logging
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+from app.reranking import DEFAULT_CANDIDATES
+
+logger = logging.getLogger(__name__)
+
+# Defaults (overridable through app config)
+DEFAULT_MODE = 'hybrid'
+DEFAULT_K = 3
+DEFAULT_FETCH_K = 20
+DEFAULT_RRF_K = 60
+
+# A token that looks like an identifier: contains a digit, joins parts with - _ . / or is an acronym
+_IDENTIFIER_RE = re.compile(r'^(?=.*\d)[\w\-./:#]+$|^\w+(?:[-_./:#]\w+)+$|^[A-Z][A-Z0-9]{1,}$')
+
+
+# True for short lookups of exact terms (part numbers, error codes, quoted phrases), which lexical
+# search answers on its own, so the query does not need to be embedded
+def is_keyword_query(query, max_terms=3):
+    query = query.strip()
+    if len(query) > 2 and query[0] == query[-1] == '"':
+        return True
+    tokens = query.rstrip('?!.').split()
+    return 0 < len(tokens) <= max_terms and all(_IDENTIFIER_RE.match(t) for t in tokens)
+
+
+# Merge ranked lists of ids: each id scores sum(1 / (rrf_k + rank)) over the lists it appears in
+def reciprocal_rank_fusion(rankings, rrf_k=DEFAULT_RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# Vector store `where` filter matching chunks of the given documents
+def document_filter(document_ids):
+    ids = sorted({int(d) for d in document_ids})
+    if len(ids) == 1:
+        return {'document_id': ids[0]}
+    return {'document_id': {'$in': ids}}
+
+
+# Combines the user's vector store and BM25 index with reciprocal rank fusion.
+# mode is 'hybrid', 'vector' or 'lexical'; hybrid keyword-only queries skip the vector search.
+# document_ids, if set, limits both searches to those documents' chunks.
+# reranker, if set (see app.reranking), reorders the top rerank_candidates fused chunks and keeps k of them.
+# context_budget, if set (see app.context_budget), turns the final chunks into the prompt context: overlapping
+# chunks merged, near-duplicates dropped, and passages kept within a token budget; context holds its figures.
+# timings holds the seconds spent in each stage of the last query.
+class HybridRetriever(BaseRetriever):
+    vectorstore: Any = None
+    lexical: Any = None
+    k: int = DEFAULT_K
+    fetch_k: int = DEFAULT_FETCH_K
+    rrf_k: int = DEFAULT_RRF_K
+    mode: str = DEFAULT_MODE
+    document_ids: Optional[List[int]] = None
+    reranker: Any = None
+    rerank_candidates: int = DEFAULT_CANDIDATES
+    context_budget: Any = None
+    context: Dict[str, Any] = Field(default_factory=dict)
+    timings: Dict[str, float] = Field(default_factory=dict)
+
+    def _timed(self, stage, fn, *args):
+        start = perf_counter()
+        result = fn(*args)
+        self.timings[stage] = self.timings.get(stage, 0.0) + perf_counter() - start
+        return result
+
+    def _lexical_documents(self, query, k):
+        if self.lexical is None:
+            return []
+        return [Document(page_content=text, metadata=metadata, id=chunk_id)
+                for chunk_id, text, metadata, _score in self.lexical.search(query, k, self.document_ids)]
+
+    # Returns (documents, query embedding). The query is embedded here, rather than inside the store,
+    # only when the reranker needs its vector, so it is still embedded once per question.
+    def _vector_documents(self, query, k):
+        if self.vectorstore is None or self.document_ids == []:
+            return [], None
+        # The filter is applied inside the store, so only the scoped chunks are scored
+        search = {} if self.document_ids is None else {'filter': document_filter(self.document_ids)}
+        if not getattr(self.reranker, 'needs_vectors', False):
+            return self.vectorstore.similarity_search(query, k=k, **search), None
+        embedding = self.vectorstore.embeddings.embed_query(query)
+        return self.vectorstore.similarity_search_by_vector(embedding, k=k, **search), embedding
+
+    # (query vector, candidate vectors in docs order) read back from the store, so candidates are never
+    # re-embedded; None when a candidate has no stored vector
+    def _candidate_vectors(self, query, docs, embedding):
+        if self.vectorstore is None or any(d.id is None for d in docs):
+            return None
+        if embedding is None:
+            embedding = self._timed('embed', self.vectorstore.embeddings.embed_query, query)
+        found = self.vectorstore._collection.get(ids=[d.id for d in docs], include=['embeddings'])
+        by_id = dict(zip(found['ids'], found['embeddings']))
+        if len(by_id) < len({d.id for d in docs}):
+            return None
+        return embedding, [by_id[d.id] for d in docs]
+
+    def _rerank(self, query, docs, embedding=None):
+        if self.reranker is None or len(docs) <= 1:
+            return docs[:self.k]
+        return self._timed('rerank', self.reranker.rerank, query, docs, self.k,
+                           lambda: self._candidate_vectors(query, docs, embedding))
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        self.timings = {}
+        docs = self._ranked_documents(query)
+        if self.context_budget is None:
+            return docs
+        docs = self._timed('context', self.context_budget.assemble, docs)
+        self.context = dict(self.context_budget.stats)
+        return docs
+
+    # The final k chunks, best first
+    def _ranked_documents(self, query):
+        # Without a reranker the first stage returns the final k chunks directly
+        candidates = self.k if self.reranker is None else max(self.k, self.rerank_candidates)
+        if self.mode == 'lexical':
+            return self._rerank(query, self._timed('lexical', self._lexical_documents, query, candidates))
+        if self.mode == 'vector' or self.lexical is None:
+            docs, embedding = self._timed('vector', self._vector_documents, query, candidates)
+            return self._rerank(query, docs, embedding)
+
+        # A failing index degrades hybrid search to the other one; only when both fail is the error raised
+        try:
+            lexical = self._timed('lexical', self._lexical_documents, query, self.fetch_k)
+        except Exception as e:
+            logger.warning('Lexical search failed, using vector results only: %s', e)
+            lexical = []
+        if lexical and is_keyword_query(query):
+            return lexical[:self.k]
+        try:
+            vector, embedding = self._timed('vector', self._vector_documents, query, self.fetch_k)
+        except Exception as e:
+            if not lexical:
+                raise
+            logger.warning('Vector search failed, using lexical results only: %s', e)
+            vector, embedding = [], None
+
+        start = perf_counter()
+        # Chunks share ids across both indexes; fall back to the text for stores without ids
+        by_key = {}
+        rankings = []
+        for docs in (vector, lexical):
+            ranking = []
+            for d in docs:
+                key = d.id or d.page_content
+                by_key.setdefault(key, d)
+                ranking.append(key)
+            rankings.append(ranking)
+        fused = [by_key[key] for key in reciprocal_rank_fusion(rankings, self.rrf_k)[:candidates]]
+        self.timings['fusion'] = perf_counter() - start
+        return self._rerank(query, fused, embedding)
@@ -0,0 +1,229 @@
+# app/stats.py
+import logging
+import calendar
+import datetime
+
+from sqlalchemy import event, func, inspect
+
+from app.extensions import db
+from app.models import User, UploadedDocument, QueryHistory, DailyStat
+
+logger = logging.getLogger(__name__)
+
+# Model -> (timestamp attribute, DailyStat counter it feeds)
+TRACKED = {
+    User: ('date_joined', 'users_joined'),
+    UploadedDocument: ('upload_date', 'documents_uploaded'),
+    QueryHistory: ('timestamp', 'queries_run'),
+}
+COUNTERS = ('users_joined', 'documents_uploaded', 'queries_run', 'active_users')
+
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    return value
+
+
+def _day_bounds(day):
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return start, start + datetime.timedelta(days=1)
+
+
+# Add deltas to one day's counters, creating the row if needed (runs on the flushing connection)
+def _bump(connection, day, **deltas):
+    table = DailyStat.__table__
+    initial = {name: max(deltas.get(name, 0), 0) for name in COUNTERS}
+    changes = {name: table.c[name] + delta for name, delta in deltas.items()}
+    if connection.dialect.name in ('sqlite', 'postgresql'):
+        if connection.dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        connection.execute(
+            insert(table).values(day=day, **initial).on_conflict_do_update(index_elements=['day'], set_=changes)
+        )
+        return
+    if connection.execute(table.update().where(table.c.day == day).values(**changes)).rowcount == 0:
+        connection.execute(table.insert().values(day=day, **initial))
+
+
+# True if the user has a query that day with a smaller id (an index seek on user_id, timestamp).
+# Only a user's first query of the day counts them as active, even when a flush inserts several at once.
+def _queried_earlier(connection, user_id, day, query_id):
+    start, end = _day_bounds(day)
+    table = QueryHistory.__table__
+    row = connection.execute(
+        table.select().with_only_columns(table.c.id).where(
+            table.c.user_id == user_id,
+            table.c.timestamp >= start,
+            table.c.timestamp < end,
+            table.c.id < query_id
+        ).limit(1)
+    ).first()
+    return row is not None
+
+
+# Recount a day's distinct active users (a range scan over that day's queries only)
+def _recount_active(connection, day):
+    start, end = _day_bounds(day)
+    queries = QueryHistory.__table__
+    active = connection.execute(
+        queries.select().with_only_columns(func.count(func.distinct(queries.c.user_id))).where(
+            queries.c.timestamp >= start,
+            queries.c.timestamp < end
+        )
+    ).scalar()
+    table = DailyStat.__table__
+    connection.execute(table.update().where(table.c.day == day).values(active_users=active))
+
+
+def _after_insert(mapper, connection, target):
+    attr, counter = TRACKED[mapper.class_]
+    day = _as_date(getattr(target, attr))
+    if day is None:
+        return
+    deltas = {counter: 1}
+    if isinstance(target, QueryHistory) and not _queried_earlier(connection, target.user_id, day, target.id):
+        deltas['active_users'] = 1
+    _bump(connection, day, **deltas)
+
+
+# Deletes are rare, so the day's active users are simply recounted
+def _after_delete(mapper, connection, target):
+    attr, counter = TRACKED[mapper.class_]
+    day = _as_date(getattr(target, attr))
+    if day is None:
+        return
+    _bump(connection, day, **{counter: -1})
+    if isinstance(target, QueryHistory):
+        _recount_active(connection, day)
+
+
+# A re-uploaded document moves to the day of its new upload_date
+def _after_update(mapper, connection, target):
+    attr, counter = TRACKED[mapper.class_]
+    history = inspect(target).attrs[attr].history
+    if not history.has_changes():
+        return
+    old = _as_date(history.deleted[0]) if history.deleted else None
+    new = _as_date(getattr(target, attr))
+    if old == new:
+        return
+    if old is not None:
+        _bump(connection, old, **{counter: -1})
+    if new is not None:
+        _bump(connection, new, **{counter: 1})
+
+
+# Keep DailyStat current from ORM writes; safe to call more than once.
+# Bulk query.update()/delete() bypass these events; run `flask rebuild-daily-stats` after those.
+def register_rollup_listeners():
+    for model in TRACKED:
+        for name, listener in (('after_insert', _after_insert), ('after_delete', _after_delete)):
+            if not event.contains(model, name, listener):
+                event.listen(model, name, listener)
+    if not event.contains(UploadedDocument, 'after_update', _after_update):
+        event.listen(UploadedDocument, 'after_update', _after_update)
+
+
+# Per-day counts of rows in [start, end) with one grouped query, using the index on column
+def daily_counts(column, start=None, end=None, distinct=None):
+    day = func.date(column)
+    count = func.count(func.distinct(distinct)) if distinct is not None else func.count()
+    query = db.session.query(day, count).filter(column.isnot(None))
+    if start is not None:
+        query = query.filter(column >= start)
+    if end is not None:
+        query = query.filter(column < end)
+    return {_as_date(d): n for d, n in query.group_by(day)}
+
+
+# Recompute DailyStat for whole days from the source tables (all days when no range is given).
+# Returns the number of day rows written.
+def rebuild_daily_stats(start_day=None, end_day=None):
+    start = _day_bounds(start_day)[0] if start_day else None
+    end = _day_bounds(end_day)[0] if end_day else None
+    counts = {
+        'users_joined': daily_counts(User.date_joined, start, end),
+        'documents_uploaded': daily_counts(UploadedDocument.upload_date, start, end),
+        'queries_run': daily_counts(QueryHistory.timestamp, start, end),
+        'active_users': daily_counts(QueryHistory.timestamp, start, end, distinct=QueryHistory.user_id),
+    }
+    stale = DailyStat.query
+    if start_day:
+        stale = stale.filter(DailyStat.day >= start_day)
+    if end_day:
+        stale = stale.filter(DailyStat.day < end_day)
+    stale.delete(synchronize_session=False)
+    days = sorted(set().union(*counts.values()))
+    db.session.bulk_insert_mappings(DailyStat, [
+        dict(day=day, **{name: counts[name].get(day, 0) for name in COUNTERS}) for day in days
+    ])
+    db.session.commit()
+    return len(days)
+
+
+# Populate the rollup once for databases that had data before it existed
+def ensure_daily_stats():
+    if DailyStat.query.first() is None and User.query.first() is not None:
+        logger.info('Daily stats rollup is empty; rebuilding from source tables.')
+        rebuild_daily_stats()
+
+
+# (start, end, label) day ranges for the admin dashboard's timeframes
+def timeframe_buckets(timeframe, today):
+    if timeframe == 'month':
+        # Each month of the current year so far
+        buckets = []
+        for m in range(1, today.month + 1):
+            first = datetime.date(today.year, m, 1)
+            last = first + datetime.timedelta(days=calendar.monthrange(today.year, m)[1])
+            buckets.append((first, last, calendar.month_abbr[m]))
+        return buckets
+    if timeframe == 'week':
+        # Last 4 weeks, ending today
+        size, count = 7, 4
+    else:
+        # Last 7 days, ending today
+        size, count = 1, 7
+    start = today - datetime.timedelta(days=size * count - 1)
+    return [(start + datetime.timedelta(days=size * i),
+             start + datetime.timedelta(days=size * (i + 1)),
+             (start + datetime.timedelta(days=size * i)).strftime('%Y-%m-%d'))
+            for i in range(count)]
+
+
+# Chart series for a timeframe, read from O(days) rollup rows regardless of table sizes
+def activity_series(timeframe, now=None):
+    today = (now or datetime.datetime.utcnow()).date()
+    buckets = timeframe_buckets(timeframe, today)
+    rows = DailyStat.query.filter(DailyStat.day >= buckets[0][0], DailyStat.day < buckets[-1][1]).all()
+    labels = [label for _s, _e, label in buckets]
+    series = {name: [0] * len(buckets) for name in COUNTERS}
+    for row in rows:
+        for i, (start, end, _label) in enumerate(buckets):
+            if start <= row.day < end:
+                for name in ('users_joined', 'documents_uploaded', 'queries_run'):
+                    series[name][i] += getattr(row, name)
+                # Distinct users do not add up across days, so longer buckets show the busiest day
+                series['active_users'][i] = max(series['active_users'][i], row.active_users)
+                break
+    return {
+        'user_growth': {'labels': labels, 'values': series['users_joined']},
+        'doc_uploads': {'labels': labels, 'values': series['documents_uploaded']},
+        'query_counts': {'labels': labels, 'values': series['queries_run']},
+        'active_users': {'labels': labels, 'values': series['active_users']},
+    }
+
+
+# Global totals summed from the rollup
+def totals():
+    users, documents, queries = db.session.query(
+        func.coalesce(func.sum(DailyStat.users_joined), 0),
+        func.coalesce(func.sum(DailyStat.documents_uploaded), 0),
+        func.coalesce(func.sum(DailyStat.queries_run), 0),
+    ).one()
+    return {'users': users, 'documents': documents, 'queries': queries}
@@ -0,0 +1,92 @@
+# app/user_search.py
+import logging
+import threading
+
+from sqlalchemy import text, func, select, or_
+from sqlalchemy.exc import OperationalError
+
+from app.extensions import db
+from app.models import User, UploadedDocument, QueryHistory
+from app.pagination import keyset_page
+
+logger = logging.getLogger(__name__)
+
+# Trigram indexes can only answer substrings of at least three characters
+MIN_INDEXED_LENGTH = 3
+
+# SQLite: external-content FTS5 table over user(username, email) with the trigram tokenizer,
+# kept in sync by triggers. Also created by the user_search migration.
+SQLITE_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5("
+    "username, email, content='user', content_rowid='id', tokenize='trigram')",
+    'CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON "user" BEGIN '
+    "INSERT INTO user_search(rowid, username, email) VALUES (new.id, new.username, new.email); END",
+    'CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON "user" BEGIN '
+    "INSERT INTO user_search(user_search, rowid, username, email) "
+    "VALUES ('delete', old.id, old.username, old.email); END",
+    'CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF username, email ON "user" BEGIN '
+    "INSERT INTO user_search(user_search, rowid, username, email) "
+    "VALUES ('delete', old.id, old.username, old.email); "
+    "INSERT INTO user_search(rowid, username, email) VALUES (new.id, new.username, new.email); END",
+)
+
+# Databases (by URL) whose SQLite build lacks FTS5 trigram support
+_unsupported = set()
+_lock = threading.Lock()
+
+
+# Create the SQLite trigram index on first use (databases made with create_all have none, and
+# dropping the user table drops its triggers). The check is a single sqlite_master lookup.
+# Returns False when the index cannot be used, so callers fall back to LIKE.
+def ensure_search_index():
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    key = str(engine.url)
+    if key in _unsupported:
+        return False
+    check = "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'user_search_ai'"
+    if db.session.execute(text(check)).first():
+        return True
+    with _lock:
+        try:
+            with engine.begin() as conn:
+                if conn.execute(text(check)).first():
+                    return True
+                conn.execute(text('DROP TABLE IF EXISTS user_search'))
+                for statement in SQLITE_SEARCH_DDL:
+                    conn.execute(text(statement))
+                conn.execute(text("INSERT INTO user_search(user_search) VALUES ('rebuild')"))
+            return True
+        except OperationalError as e:
+            logger.warning('SQLite FTS5 trigram search unavailable, using LIKE: %s', e)
+            _unsupported.add(key)
+            return False
+
+
+# Filter matching username or email substrings, answered from the trigram index where possible.
+# On PostgreSQL ILIKE is served by the pg_trgm GIN indexes from the migration.
+def _match_filter(term):
+    if len(term) >= MIN_INDEXED_LENGTH and ensure_search_index():
+        phrase = '"' + term.replace('"', '""') + '"'
+        matches = (select(text('rowid')).select_from(text('user_search'))
+                   .where(text('user_search MATCH :phrase').bindparams(phrase=phrase)))
+        return User.id.in_(matches)
+    pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return or_(User.username.ilike(pattern, escape='\\'), User.email.ilike(pattern, escape='\\'))
+
+
+# One page of users whose username or email contains term, ordered by username.
+# Document and query counts come from correlated subqueries on the (user_id, ...) indexes,
+# so a page costs one statement however many users match.
+# Returns ([(user, doc_count, query_count)], next_cursor).
+def search_users(term, cursor=None, limit=25):
+    doc_count = (select(func.count(UploadedDocument.id))
+                 .where(UploadedDocument.user_id == User.id)
+                 .correlate(User).scalar_subquery())
+    query_count = (select(func.count(QueryHistory.id))
+                   .where(QueryHistory.user_id == User.id)
+                   .correlate(User).scalar_subquery())
+    query = db.session.query(User, doc_count.label('doc_count'), query_count.label('query_count')) \
+                      .filter(_match_filter(term))
+    return keyset_page(query, User.username, User.id, cursor=cursor, limit=limit, descending=False)
@@ -1,28 +1,39 @@
 # app/utils.py
 import os
+import uuid
+import hashlib
 import logging
+import datetime
 import warnings
-import pypandoc
-import nltk
-from langchain.schema import Document
+import functools
+import shutil
 
 # Logging config
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Ensure pandoc executable is discoverable for pypandoc
+# Where pandoc is looked for when it is not on PATH (Homebrew on Apple Silicon and Intel Macs)
+PANDOC_CANDIDATES = ('/opt/homebrew/bin/pandoc', '/usr/local/bin/pandoc')
+
+# Make pandoc discoverable for pypandoc: PYPANDOC_PANDOC if set, then PATH, then PANDOC_CANDIDATES.
+# Runs once per process, the first time a document is parsed; returns the path or None.
+@functools.lru_cache(maxsize=None)
 def setup_pandoc():
-    os.environ['PATH'] = '/opt/homebrew/bin:' + os.environ.get('PATH', '')
-    os.environ['PYPANDOC_PANDOC'] = '/opt/homebrew/bin/pandoc'
-    try:
-        version = pypandoc.get_pandoc_version()
-        logger.info('Pandoc version: %s', version)
-    except Exception as e:
-        logger.error('Error getting pandoc version: %s', e)
+    path = os.environ.get('PYPANDOC_PANDOC') or shutil.which('pandoc')
+    if not path:
+        path = next((p for p in PANDOC_CANDIDATES if os.access(p, os.X_OK)), None)
+    if path is None:
+        logger.warning('Pandoc not found; documents that need it will fail to parse.')
+        return None
+    os.environ['PYPANDOC_PANDOC'] = path
+    logger.info('Using pandoc at %s', path)
+    return path
 
 
-# Download NLTK resources if not already present
+# Download NLTK resources if not already present (once per process, the first time a document is parsed)
+@functools.lru_cache(maxsize=None)
 def initialize_nltk_resources():
+    import nltk
     # Mapping of NLTK packages to their resource paths
     resource_map = {
         'punkt': 'tokenizers/punkt',
@@ -42,6 +53,30 @@ def initialize_nltk_resources():
 def simple_filter_metadata(metadata: dict) -> dict:
     return {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
 
+# Current app config when called inside an app context, otherwise an empty mapping
+def _app_config():
+    from flask import current_app, has_app_context
+    return current_app.config if has_app_context() else {}
+
+# Wrap an embedding model in the shared on-disk embedding cache (no-op if already wrapped)
+def with_embedding_cache(embeddings, config=None):
+    from .embedding_cache import CachedEmbeddings, get_embedding_cache, DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES
+    if embeddings is None or isinstance(embeddings, CachedEmbeddings):
+        return embeddings
+    if config is None:
+        config = _app_config()
+    cache = get_embedding_cache(
+        config.get('EMBEDDING_CACHE_PATH', DEFAULT_CACHE_PATH),
+        config.get('EMBEDDING_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    )
+    return CachedEmbeddings(embeddings, cache)
+
+# Build the configured embedding backend (EMBEDDING_PROVIDER), behind the embedding cache where it helps
+def get_embeddings(config):
+    from .embedding_providers import create_embeddings
+    embeddings, cacheable = create_embeddings(config)
+    return with_embedding_cache(embeddings, config) if cacheable else embeddings
+
 # Return Chroma client settings for a user's persistent vector DB
 def get_client_settings_for_user(user_id, Settings):
     # Create a directory for the user's vector store if it doesn't exist
@@ -53,11 +88,124 @@ def get_client_settings_for_user(user_id, Settings):
         anonymized_telemetry=False
     )
 
-# Create or update a Chroma vector store for the given user and documents
-def update_user_vectorstore(user_id, docs, embeddings, Chroma, Settings):
-    # Get or create the vector store settings
-    settings = get_client_settings_for_user(user_id, Settings)
+# Stream a file through SHA-256 so large uploads are never read into memory at once
+def file_content_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Stable vector ids for a document's chunks, so re-indexing overwrites instead of duplicating
+def chunk_ids_for_document(document_id, count):
+    return [f'doc{document_id}-{i}' for i in range(count)]
+
+# The process-wide pool of open per-user vector store handles
+def vectorstore_pool():
+    from .vectorstore_pool import get_vectorstore_pool, DEFAULT_MAX_HANDLES, DEFAULT_MAX_BYTES
+    config = _app_config()
+    return get_vectorstore_pool(
+        config.get('VECTORSTORE_POOL_MAX_HANDLES', DEFAULT_MAX_HANDLES),
+        config.get('VECTORSTORE_POOL_MAX_BYTES', DEFAULT_MAX_BYTES)
+    )
+
+# The configured VECTOR_ENGINE: "chroma" or "mmap" (memory-mapped vectors, see app/vector_engine.py)
+def vector_engine_name(config=None):
+    config = _app_config() if config is None else config
+    return (config.get('VECTOR_ENGINE') or 'chroma').lower()
+
+# Directory holding a user's vector store for the configured engine (or the one named)
+def vectorstore_dir(user_id, config=None, engine=None):
+    suffix = 'mmap' if (engine or vector_engine_name(config)) == 'mmap' else 'db'
+    return os.path.join('chroma_db', f'user_{user_id}_{suffix}')
+
+# MmapCollection settings from app config. The quantization only applies to collections created from now
+# on; existing ones keep theirs until changed with `flask migrate-vectorstores --quantization`.
+def mmap_collection_options(config=None):
+    from .vector_engine import DEFAULT_DTYPE, DEFAULT_HNSW_THRESHOLD
+    from .quantization import DEFAULT_RESCORE_FACTOR, DEFAULT_TRAIN_MIN, DEFAULT_PQ_SUBVECTOR_DIMS
+    config = _app_config() if config is None else config
+    return {
+        'dtype': config.get('VECTOR_ENGINE_DTYPE', DEFAULT_DTYPE),
+        'hnsw_threshold': config.get('VECTOR_ENGINE_HNSW_THRESHOLD', DEFAULT_HNSW_THRESHOLD),
+        'quantization': config.get('VECTOR_QUANTIZATION') or 'none',
+        'rescore_factor': config.get('VECTOR_RESCORE_FACTOR', DEFAULT_RESCORE_FACTOR),
+        'train_min': config.get('VECTOR_QUANTIZATION_TRAIN_MIN', DEFAULT_TRAIN_MIN),
+        'pq_sub_dims': config.get('VECTOR_PQ_SUBVECTOR_DIMS', DEFAULT_PQ_SUBVECTOR_DIMS),
+    }
+
+# Pool key for a user's store opened with a given embedding model
+def _vectorstore_key(user_id, embeddings):
+    return (user_id, getattr(embeddings, 'model_name', None) or type(embeddings).__name__, vector_engine_name())
+
+# Open the user's existing collection (Chroma or memory-mapped, per VECTOR_ENGINE) without adding anything.
+# Handles are pooled per process, so warm calls skip reopening SQLite and reloading the index.
+def get_user_vectorstore(user_id, embeddings, Chroma, Settings):
+    config = _app_config()
+
+    def open_store():
+        if vector_engine_name(config) == 'mmap':
+            from .vector_engine import MmapVectorStore
+            return MmapVectorStore(
+                vectorstore_dir(user_id, config),
+                embeddings,
+                collection_name=f'user_{user_id}',
+                **mmap_collection_options(config)
+            )
+        settings = get_client_settings_for_user(user_id, Settings)
+        return Chroma(
+            persist_directory=settings.persist_directory,
+            embedding_function=embeddings,
+            client_settings=settings,
+            collection_name=f'user_{user_id}'
+        )
+    return vectorstore_pool().get(_vectorstore_key(user_id, embeddings), open_store)
+
+# Drop pooled handles for a user after their store was replaced or removed outside the handle
+def invalidate_user_vectorstore(user_id):
+    vectorstore_pool().invalidate(user_id)
+
+# The user's BM25 index, stored next to their vector store
+def lexical_index_path(user_id):
+    return os.path.join('chroma_db', f'user_{user_id}_lexical.sqlite3')
+
+# Open indexes share the vector store pool, so they are bounded and closed on eviction like the stores
+def get_user_lexical_index(user_id):
+    from .lexical_index import LexicalIndex
+    path = os.path.abspath(lexical_index_path(user_id))
+    return vectorstore_pool().get((user_id, 'lexical', path), lambda: LexicalIndex(path))
+
+# Rebuild the user's lexical index from the chunks already in their vector store (no embedding calls).
+# Used for stores indexed before lexical search existed; returns the number of chunks indexed.
+def sync_lexical_index(user_id, vs):
+    lexical = get_user_lexical_index(user_id)
+    stored = vs._collection.get(include=['documents', 'metadatas'])
+    if lexical.count() == len(stored['ids']):
+        return 0
+    lexical.clear()
+    lexical.add(stored['ids'], stored['documents'], stored['metadatas'])
+    return len(stored['ids'])
+
+# Concurrent, rate-limit-aware batch embedder configured from app config
+def embedding_scheduler(embeddings):
+    from .embedding_scheduler import (
+        EmbeddingScheduler, DEFAULT_CONCURRENCY, DEFAULT_BATCH_TOKENS, DEFAULT_BATCH_SIZE, DEFAULT_MAX_RETRIES
+    )
+    config = _app_config()
+    return EmbeddingScheduler(
+        embeddings,
+        max_concurrency=config.get('EMBEDDING_CONCURRENCY', DEFAULT_CONCURRENCY),
+        max_batch_tokens=config.get('EMBEDDING_BATCH_TOKENS', DEFAULT_BATCH_TOKENS),
+        max_batch_size=config.get('EMBEDDING_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        max_retries=config.get('EMBEDDING_MAX_RETRIES', DEFAULT_MAX_RETRIES)
+    )
+
+# Create or update the vector store for the given user and documents.
+# embeddings come from get_embeddings, which already puts providers that benefit behind the embedding cache.
+# progress, if given, is called as progress(stage, done, total) for the 'embed' and 'store' stages.
+def update_user_vectorstore(user_id, docs, embeddings, Chroma, Settings, ids=None, progress=None):
     collection_name = f'user_{user_id}'
+    from langchain.schema import Document
     # Convert documents to a list of Document objects
     filtered = []
     for doc in docs:
@@ -66,28 +214,40 @@ def update_user_vectorstore(user_id, docs, embeddings, Chroma, Settings):
         filtered.append(Document(page_content=content, metadata=simple_filter_metadata(md)))
 
     # create or open the collection
-    vs = Chroma(
-        persist_directory=settings.persist_directory,
-        embedding_function=embeddings,
-        client_settings=settings,
-        collection_name=collection_name
-    )
+    vs = get_user_vectorstore(user_id, embeddings, Chroma, Settings)
 
     if filtered:
+        texts = [d.page_content for d in filtered]
+        metadatas = [d.metadata or None for d in filtered]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in filtered]
+        report = progress or (lambda stage, done, total: None)
         try:
-            # Add new texts to the vectorstore
-            vs.add_texts(
-                [d.page_content for d in filtered],
-                metadatas=[d.metadata for d in filtered]
-            )
+            # Several token-budgeted batches are embedded concurrently; each is written to the
+            # store in order as soon as it is ready (same ids overwrite rather than duplicate)
+            for start, vectors in embedding_scheduler(embeddings).iter_batches(texts):
+                end = start + len(vectors)
+                report('embed', end, len(texts))
+                vs._collection.upsert(
+                    ids=ids[start:end],
+                    embeddings=vectors,
+                    documents=texts[start:end],
+                    metadatas=metadatas[start:end]
+                )
+                report('store', end, len(texts))
             logger.info('Vectorstore updated for user %s with %s chunks.', user_id, len(filtered))
+            vectorstore_pool().refresh_size(_vectorstore_key(user_id, embeddings))
         except Exception as e:
-            # If add_texts fails, we need to rebuild the vectorstore from scratch
-            logger.error('Chroma add_texts failed, rebuilding from scratch: %s', e)
+            # The memory-mapped engine commits each batch atomically, so there is nothing to rebuild
+            if vector_engine_name() == 'mmap':
+                raise
+            # If the write fails, we need to rebuild the vectorstore from scratch
+            logger.error('Chroma upsert failed, rebuilding from scratch: %s', e)
+            invalidate_user_vectorstore(user_id)
             vs = Chroma.from_documents(
                 filtered,
                 embeddings,
-                client_settings=settings,
+                ids=ids,
+                client_settings=get_client_settings_for_user(user_id, Settings),
                 collection_name=collection_name
             )
     else:
@@ -96,6 +256,56 @@ def update_user_vectorstore(user_id, docs, embeddings, Chroma, Settings):
 
     return vs
 
+# Chunk metadata that follows the document when it is renamed or moved (folder_id 0 means no folder,
+# since stores cannot hold nulls)
+def chunk_location_metadata(doc):
+    return {'filename': doc.filename, 'folder_id': doc.folder_id or 0}
+
+# Remove every vector belonging to one uploaded document from the user's collection
+def delete_document_vectors(vs, document_id):
+    vs._collection.delete(where={'document_id': document_id})
+
+# Index an UploadedDocument's chunks exactly once per content version.
+# Returns True when chunks were embedded, False when the stored vectors were already current.
+# The caller is responsible for committing the updated document row.
+def index_document(doc, path, chunks, embeddings, Chroma, Settings, content_hash=None, progress=None):
+    content_hash = content_hash or file_content_hash(path)
+    if doc.indexed_at is not None and doc.content_hash == content_hash:
+        logger.info('Document %s unchanged (sha256 %s); skipping embedding.', doc.id, content_hash[:12])
+        return False
+
+    # Tag every chunk with its document so it can be replaced or removed later
+    from langchain.schema import Document
+    tagged = []
+    for chunk in chunks:
+        md = dict(getattr(chunk, 'metadata', {}) or {})
+        md.update(document_id=doc.id, content_hash=content_hash, **chunk_location_metadata(doc))
+        tagged.append(Document(page_content=chunk.page_content, metadata=md))
+
+    # Drop vectors from a previous version of this document before adding the new ones
+    lexical = get_user_lexical_index(doc.user_id)
+    if doc.indexed_at is not None:
+        vs = get_user_vectorstore(doc.user_id, embeddings, Chroma, Settings)
+        delete_document_vectors(vs, doc.id)
+        lexical.delete_document(doc.id)
+
+    ids = chunk_ids_for_document(doc.id, len(tagged))
+    update_user_vectorstore(
+        doc.user_id,
+        tagged,
+        embeddings,
+        Chroma,
+        Settings,
+        ids=ids,
+        progress=progress
+    )
+    # Keep the BM25 index in step with the vectors (same chunk ids)
+    lexical.add(ids, [d.page_content for d in tagged], [simple_filter_metadata(d.metadata) for d in tagged])
+    doc.content_hash = content_hash
+    doc.chunk_count = len(tagged)
+    doc.indexed_at = datetime.datetime.utcnow()
+    return True
+
 # Scrape page text via requests + BeautifulSoup, returning concatenated <p> tags.
 def scrape_website(url):
     import requests
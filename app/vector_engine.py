@@ -0,0 +1,692 @@
+# app/vector_engine.py
+import os
+import re
+import json
+import uuid
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from app.quantization import (
+    DEFAULT_RESCORE_FACTOR, DEFAULT_TRAIN_MIN, DEFAULT_PQ_SUBVECTOR_DIMS, TRAIN_SAMPLE,
+    create_quantizer, save_quantizer, load_quantizer
+)
+
+logger = logging.getLogger(__name__)
+
+# Defaults (overridable through app config)
+DEFAULT_DTYPE = 'float32'
+DEFAULT_HNSW_THRESHOLD = 20000
+
+# Rows reserved when the vector file is created; the file doubles whenever it fills up
+INITIAL_CAPACITY = 1024
+# Rows scored per block by a scan; small enough that a block widened to float32 stays in CPU cache
+SCAN_BLOCK = 2048
+# Rows per block when copying, encoding or indexing vectors in bulk
+COPY_BLOCK = 65536
+# HNSW graph parameters (inner product over unit vectors, i.e. cosine)
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Ids or slots per IN (...) lookup
+LOOKUP_BATCH = 500
+
+_KEY_RE = re.compile(r'^\w+$')
+
+
+# Translate a Chroma-style `where` filter into SQL over the chunk table. Supports equality, $eq, $ne,
+# $in and $nin on metadata keys, combined with $and / $or, which is everything the app uses.
+def where_sql(where):
+    if not where:
+        return '1', []
+    clauses, args = [], []
+    for key, value in where.items():
+        if key in ('$and', '$or'):
+            parts = [where_sql(part) for part in value]
+            joiner = ' AND ' if key == '$and' else ' OR '
+            clauses.append('(' + joiner.join(sql for sql, _ in parts) + ')')
+            for _, part_args in parts:
+                args.extend(part_args)
+            continue
+        if not _KEY_RE.match(key):
+            raise ValueError(f'Unsupported metadata key {key!r}.')
+        column = 'document_id' if key == 'document_id' else f"json_extract(metadata, '$.{key}')"
+        op, operand = next(iter(value.items())) if isinstance(value, dict) else ('$eq', value)
+        if op in ('$eq', '$ne'):
+            clauses.append(f"{column} {'=' if op == '$eq' else '!='} ?")
+            args.append(operand)
+        elif op in ('$in', '$nin'):
+            clauses.append(f"{column} {'IN' if op == '$in' else 'NOT IN'} (SELECT value FROM json_each(?))")
+            args.append(json.dumps(list(operand)))
+        else:
+            raise ValueError(f'Unsupported filter operator {op!r}.')
+    return ' AND '.join(clauses), args
+
+
+# The k best (slot, score) pairs of candidates, best first
+def _top(candidates, scores, k):
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return candidates[top], scores[top]
+
+
+def _unit_rows(vectors):
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+# One collection on disk: unit-length vectors in a memory-mapped float32/float16 file indexed by slot,
+# and ids, texts and metadata in SQLite. Slots are append-only (an update writes a new slot and retires
+# the old one), so a reader never sees a half-written row; compact() reclaims retired slots.
+# Up to hnsw_threshold candidate chunks are searched exactly with blocked matrix-vector products;
+# larger collections build an HNSW graph over the same slots, saved next to the vectors.
+# With quantization ('int8' or 'pq', recorded per collection once it has vectors) a compact code per
+# slot is trained once train_min chunks exist; searches then scan the codes instead of the vectors (and
+# skip HNSW, which would hold float32 copies in memory) and re-score the best k * rescore_factor
+# candidates with the full-precision rows. A rescore_factor of 0 ranks by the codes alone.
+# A generation counter bumped by every write lets other processes sharing the directory notice changes.
+# Mirrors the subset of the Chroma collection API the app uses (get/upsert/update/delete/count).
+class MmapCollection:
+    def __init__(self, path, name='default', dtype=DEFAULT_DTYPE, hnsw_threshold=DEFAULT_HNSW_THRESHOLD,
+                 quantization='none', rescore_factor=DEFAULT_RESCORE_FACTOR, train_min=DEFAULT_TRAIN_MIN,
+                 pq_sub_dims=DEFAULT_PQ_SUBVECTOR_DIMS):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.name = name
+        self.metadata = {'hnsw:space': 'cosine'}
+        self.hnsw_threshold = hnsw_threshold
+        self.rescore_factor = rescore_factor
+        self.train_min = train_min
+        self.pq_sub_dims = pq_sub_dims
+        # Validate early; an unknown kind should fail when the store is opened, not on the first write
+        create_quantizer(quantization, 1)
+        self._default_quantization = (quantization or 'none').lower()
+        self._lock = threading.RLock()
+        # Autocommit; writes take BEGIN IMMEDIATE explicitly so slot allocation is serialised across processes
+        self._db = sqlite3.connect(os.path.join(path, 'chunks.sqlite3'), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS chunk ('
+            ' id TEXT PRIMARY KEY,'
+            ' slot INTEGER NOT NULL UNIQUE,'
+            ' document_id INTEGER,'
+            ' document TEXT,'
+            ' metadata TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS ix_chunk_document_id ON chunk (document_id);'
+        )
+        self._default_dtype = np.dtype(dtype)
+        self._generation = None
+        self._vectors = None
+        self._codes = None
+        self._quantizer = None
+        self._hnsw = None
+        self._hnsw_dirty = False
+        self._refresh()
+
+    # Reload slot bookkeeping if the store changed since we last looked (another process wrote to it)
+    def _refresh(self):
+        info = dict(self._db.execute('SELECT key, value FROM info'))
+        generation = int(info.get('generation', 0))
+        if generation == self._generation:
+            return
+        self.dim = int(info['dim']) if 'dim' in info else None
+        self.dtype = np.dtype(info.get('dtype', self._default_dtype))
+        self.slots = int(info.get('slots', 0))
+        self._hnsw_slots = int(info.get('hnsw_slots', 0))
+        self.quantization = info.get('quantization', self._default_quantization)
+        self._live = np.zeros(self.slots, dtype=bool)
+        live = np.fromiter((slot for (slot,) in self._db.execute('SELECT slot FROM chunk')), dtype=np.int64)
+        self._live[live] = True
+        self._vectors = None
+        self._codes = None
+        self._quantizer = None
+        self._hnsw = None
+        self._hnsw_dirty = False
+        if 'quantizer' in info:
+            self._quantizer = load_quantizer(self._quantizer_path(), self.dim)
+        if self.dim is not None:
+            self._map(self._capacity_on_disk())
+        self._generation = generation
+
+    # Run a write in one IMMEDIATE transaction, bumping the generation unless bump is False
+    @contextmanager
+    def _write(self, bump=True):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._refresh()
+                yield
+                if bump:
+                    self._generation += 1
+                    self._set_info(generation=self._generation)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                # In-memory state may be ahead of what was rolled back
+                self._generation = None
+                self._refresh()
+                raise
+
+    def _vector_path(self):
+        return os.path.join(self.path, f'vectors.{self.dtype.name}')
+
+    def _hnsw_path(self):
+        return os.path.join(self.path, 'hnsw.bin')
+
+    def _codes_path(self):
+        return os.path.join(self.path, f'codes.{self._quantizer.kind}')
+
+    def _quantizer_path(self):
+        return os.path.join(self.path, 'quantizer.npz')
+
+    def _row_bytes(self):
+        return self.dim * self.dtype.itemsize
+
+    def _capacity_on_disk(self):
+        try:
+            return os.path.getsize(self._vector_path()) // self._row_bytes()
+        except OSError:
+            return 0
+
+    # Map the vector file (and the code file, once a quantizer is trained) with room for at least
+    # capacity rows, growing the files if needed
+    def _map(self, capacity):
+        capacity = max(capacity, INITIAL_CAPACITY)
+        for rows in (self._vectors, self._codes):
+            if rows is not None:
+                rows.flush()
+        self._vectors = _map_rows(self._vector_path(), self.dtype, self.dim, capacity)
+        self._codes = None
+        if self._quantizer is not None:
+            self._codes = _map_rows(self._codes_path(), self._quantizer.code_dtype, self._quantizer.code_size, capacity)
+
+    def _set_info(self, **values):
+        self._db.executemany('INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)',
+                             [(k, str(v)) for k, v in values.items()])
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return int(self._live.sum())
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        ids = list(ids)
+        if not ids:
+            return
+        vectors = _unit_rows(embeddings)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = [md or {} for md in metadatas] if metadatas is not None else [{}] * len(ids)
+        # A repeated id within one call keeps its last occurrence
+        last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        if len(last) < len(ids):
+            keep = sorted(last.values())
+            ids = [ids[i] for i in keep]
+            vectors = vectors[keep]
+            documents = [documents[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+
+        with self._write():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_info(dim=self.dim, dtype=self.dtype.name, quantization=self.quantization)
+                self._map(INITIAL_CAPACITY)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f'Embedding dimension {vectors.shape[1]} does not match collection dimensionality {self.dim}.'
+                )
+            retired = np.array([slot for _id, slot in self._lookup(ids)], dtype=np.int64)
+            start = self.slots
+            end = start + len(ids)
+            if end > self._vectors.shape[0]:
+                self._map(max(end, self._vectors.shape[0] * 2))
+            # Vectors land in fresh slots before the rows pointing at them are committed
+            self._vectors[start:end] = vectors
+            self._vectors.flush()
+            if self._quantizer is not None:
+                self._codes[start:end] = self._quantizer.encode(vectors)
+                self._codes.flush()
+            self._db.executemany(
+                'INSERT OR REPLACE INTO chunk (id, slot, document_id, document, metadata) VALUES (?, ?, ?, ?, ?)',
+                [(chunk_id, start + i, md.get('document_id'), doc, json.dumps(md))
+                 for i, (chunk_id, doc, md) in enumerate(zip(ids, documents, metadatas))]
+            )
+            self._set_info(slots=end)
+            self.slots = end
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            self._live[retired] = False
+            if self._hnsw is not None:
+                self._hnsw_mark_deleted(retired)
+                self._hnsw_add(vectors, np.arange(start, end))
+            if self._quantizer is None and self.quantization != 'none' and self._live.sum() >= self.train_min:
+                self._train_quantizer()
+
+    add = upsert
+
+    # Train the collection's quantizer on a sample of its vectors and encode every slot.
+    # Runs inside a write; afterwards searches scan the codes and the HNSW graph is no longer used.
+    def _train_quantizer(self):
+        quantizer = create_quantizer(self.quantization, self.dim, self.pq_sub_dims)
+        live = np.flatnonzero(self._live)
+        if len(live) > TRAIN_SAMPLE:
+            live = np.sort(np.random.default_rng(0).choice(live, TRAIN_SAMPLE, replace=False))
+        quantizer.train(np.asarray(self._vectors[live], dtype=np.float32))
+        save_quantizer(quantizer, self._quantizer_path())
+        self._quantizer = quantizer
+        self._drop_hnsw()
+        self._map(self._vectors.shape[0])
+        for start in range(0, self.slots, COPY_BLOCK):
+            end = min(start + COPY_BLOCK, self.slots)
+            self._codes[start:end] = quantizer.encode(np.asarray(self._vectors[start:end], dtype=np.float32))
+        self._codes.flush()
+        self._set_info(quantizer=quantizer.kind)
+        logger.info('Trained %s quantizer for %s on %s vectors', quantizer.kind, self.path, len(live))
+
+    # Switch the collection to another quantization ('none', 'int8' or 'pq'), or retrain the current one.
+    # Codes are rebuilt from the full-precision vectors now if there are enough of them, else later.
+    def set_quantization(self, kind):
+        kind = (kind or 'none').lower()
+        create_quantizer(kind, 1)
+        with self._write():
+            if self._quantizer is not None:
+                codes_path = self._codes_path()
+                self._quantizer = None
+                self._codes = None
+                for path in (codes_path, self._quantizer_path()):
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._db.execute("DELETE FROM info WHERE key = 'quantizer'")
+            self.quantization = kind
+            self._set_info(quantization=kind)
+            if kind != 'none' and self.dim is not None and self._live.sum() >= self.train_min:
+                self._train_quantizer()
+
+    # Sizes of what is stored per collection, for reports and benchmarks
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {
+                'chunks': int(self._live.sum()),
+                'dim': self.dim,
+                'dtype': self.dtype.name,
+                'quantization': self.quantization,
+                'quantized': self._quantizer is not None,
+                'vector_bytes': self.slots * self._row_bytes() if self.dim else 0,
+                'code_bytes': self.slots * self._quantizer.code_size if self._quantizer is not None else 0,
+            }
+
+    # Merge metadata into existing chunks (and optionally replace texts or vectors), like Chroma's update
+    def update(self, ids, metadatas=None, documents=None, embeddings=None):
+        ids = list(ids)
+        with self._lock:
+            current = self.get(ids=ids, include=['documents', 'metadatas'])
+            stored = dict(zip(current['ids'], zip(current['documents'], current['metadatas'])))
+            rows = []
+            for i, chunk_id in enumerate(ids):
+                if chunk_id not in stored:
+                    continue
+                document, md = stored[chunk_id]
+                if metadatas is not None:
+                    md.update(metadatas[i] or {})
+                if documents is not None:
+                    document = documents[i]
+                rows.append((i, chunk_id, document, md))
+            if embeddings is not None:
+                self.upsert([r[1] for r in rows], [embeddings[r[0]] for r in rows],
+                            [r[2] for r in rows], [r[3] for r in rows])
+                return
+            with self._write():
+                self._db.executemany(
+                    'UPDATE chunk SET document = ?, document_id = ?, metadata = ? WHERE id = ?',
+                    [(document, md.get('document_id'), json.dumps(md), chunk_id) for _i, chunk_id, document, md in rows]
+                )
+
+    # Like Chroma, a delete needs ids or a filter; an empty call is refused rather than clearing everything
+    def delete(self, ids=None, where=None):
+        if ids is None and not where:
+            raise ValueError('delete() needs ids or where')
+        with self._write():
+            if ids is not None:
+                slots = [slot for _id, slot in self._lookup(list(ids))]
+            else:
+                sql, args = where_sql(where)
+                slots = [slot for (slot,) in self._db.execute(f'SELECT slot FROM chunk WHERE {sql}', args)]
+            for start in range(0, len(slots), LOOKUP_BATCH):
+                part = slots[start:start + LOOKUP_BATCH]
+                self._db.execute(f"DELETE FROM chunk WHERE slot IN ({','.join('?' * len(part))})", part)
+            self._live[slots] = False
+            if self._hnsw is not None:
+                self._hnsw_mark_deleted(slots)
+
+    def _lookup(self, ids):
+        found = []
+        for start in range(0, len(ids), LOOKUP_BATCH):
+            part = ids[start:start + LOOKUP_BATCH]
+            marks = ','.join('?' * len(part))
+            found.extend(self._db.execute(f'SELECT id, slot FROM chunk WHERE id IN ({marks})', part))
+        return found
+
+    # Rows come back in the order of ids when given (missing ids are skipped), else in storage order
+    def get(self, ids=None, where=None, limit=None, offset=None, include=('documents', 'metadatas')):
+        sql, args = where_sql(where)
+        if ids is not None:
+            query = (f'SELECT id, slot, document, metadata FROM chunk '
+                     f'JOIN (SELECT value, MIN(key) AS position FROM json_each(?) GROUP BY value) AS wanted '
+                     f'ON chunk.id = wanted.value WHERE {sql} ORDER BY wanted.position')
+            args.insert(0, json.dumps(list(ids)))
+        else:
+            query = f'SELECT id, slot, document, metadata FROM chunk WHERE {sql} ORDER BY slot'
+        if limit is not None or offset:
+            query += ' LIMIT ? OFFSET ?'
+            args.extend([-1 if limit is None else limit, offset or 0])
+        with self._lock:
+            self._refresh()
+            rows = self._db.execute(query, args).fetchall()
+            embeddings = None
+            if 'embeddings' in include:
+                if rows:
+                    embeddings = np.asarray(self._vectors[[r[1] for r in rows]], dtype=np.float32)
+                else:
+                    embeddings = np.zeros((0, self.dim or 0), dtype=np.float32)
+        return {
+            'ids': [r[0] for r in rows],
+            'embeddings': embeddings,
+            'documents': [r[2] for r in rows] if 'documents' in include else None,
+            'metadatas': [json.loads(r[3]) for r in rows] if 'metadatas' in include else None,
+            'included': list(include),
+        }
+
+    # Top k (id, text, metadata, cosine distance) for a query vector, optionally filtered like get()
+    def search(self, vector, k=4, where=None):
+        with self._lock:
+            self._refresh()
+            if self.dim is None or k <= 0:
+                return []
+            query = _unit_rows(vector)[0]
+            allowed = None
+            if where:
+                sql, args = where_sql(where)
+                allowed = np.fromiter((s for (s,) in self._db.execute(f'SELECT slot FROM chunk WHERE {sql}', args)),
+                                      dtype=np.int64)
+            candidates = int(self._live.sum()) if allowed is None else len(allowed)
+            if not candidates:
+                return []
+            k = min(k, candidates)
+            slots = scores = None
+            if self._quantizer is not None:
+                slots, scores = self._quantized_search(query, k, allowed)
+            # A small (possibly filtered) candidate set is cheaper to scan than to reach through the graph
+            elif candidates >= self.hnsw_threshold:
+                slots, scores = self._hnsw_search(query, k, allowed)
+            if slots is None:
+                slots, scores = self._exact_search(query, k, allowed)
+            return self._rows_for(slots, scores)
+
+    # Score every candidate slot (all live slots, or allowed) with score(block) over blocks of matrix rows
+    def _scan(self, matrix, score, allowed):
+        if allowed is None:
+            candidates = np.flatnonzero(self._live)
+            scores = np.empty(self.slots, dtype=np.float32)
+            for start in range(0, self.slots, SCAN_BLOCK):
+                block = matrix[start:min(start + SCAN_BLOCK, self.slots)]
+                scores[start:start + len(block)] = score(np.asarray(block))
+            return candidates, scores[candidates]
+        candidates = np.sort(allowed)
+        scores = np.empty(len(candidates), dtype=np.float32)
+        for start in range(0, len(candidates), SCAN_BLOCK):
+            part = candidates[start:start + SCAN_BLOCK]
+            scores[start:start + len(part)] = score(matrix[part])
+        return candidates, scores
+
+    def _exact_search(self, query, k, allowed):
+        candidates, scores = self._scan(self._vectors, lambda block: np.asarray(block, dtype=np.float32) @ query, allowed)
+        return _top(candidates, scores, k)
+
+    def _quantized_search(self, query, k, allowed):
+        prepared = self._quantizer.prepare(query)
+        candidates, approx = self._scan(self._codes, lambda block: self._quantizer.scores(block, prepared), allowed)
+        if not self.rescore_factor:
+            return _top(candidates, approx, k)
+        shortlist, _ = _top(candidates, approx, min(len(candidates), k * self.rescore_factor))
+        shortlist = np.sort(shortlist)
+        return _top(shortlist, np.asarray(self._vectors[shortlist], dtype=np.float32) @ query, k)
+
+    def _hnsw_search(self, query, k, allowed):
+        index = self._ensure_hnsw()
+        index.set_ef(max(HNSW_EF_SEARCH, k))
+        allowed_set = set(allowed.tolist()) if allowed is not None else None
+        try:
+            labels, distances = index.knn_query(
+                query, k=k, filter=(lambda label: label in allowed_set) if allowed_set is not None else None
+            )
+        except RuntimeError:
+            # Too few reachable neighbours (heavy filtering or deletions); the exact scan always answers
+            return None, None
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def _rows_for(self, slots, scores):
+        marks = ','.join('?' * len(slots))
+        rows = {r[0]: r[1:] for r in self._db.execute(
+            f'SELECT slot, id, document, metadata FROM chunk WHERE slot IN ({marks})', [int(s) for s in slots])}
+        results = []
+        for slot, score in zip(slots, scores):
+            row = rows.get(int(slot))
+            if row is not None:
+                chunk_id, document, metadata = row
+                results.append((chunk_id, document, json.loads(metadata), float(1.0 - score)))
+        return results
+
+    # Load the saved graph and catch up with slots written or retired since it was saved, or build it
+    def _ensure_hnsw(self):
+        if self._hnsw is not None:
+            return self._hnsw
+        import hnswlib
+        index = hnswlib.Index(space='ip', dim=self.dim)
+        capacity = self._vectors.shape[0]
+        if os.path.exists(self._hnsw_path()) and 0 < self._hnsw_slots <= self.slots:
+            index.load_index(self._hnsw_path(), max_elements=capacity)
+            saved = self._hnsw_slots
+            self._hnsw = index
+            self._hnsw_mark_deleted(np.flatnonzero(~self._live[:saved]))
+            fresh = np.flatnonzero(self._live[saved:]) + saved
+        else:
+            index.init_index(max_elements=capacity, ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            self._hnsw = index
+            fresh = np.flatnonzero(self._live)
+        logger.info('Adding %s vectors to the HNSW index in %s', len(fresh), self.path)
+        for start in range(0, len(fresh), COPY_BLOCK):
+            part = fresh[start:start + COPY_BLOCK]
+            self._hnsw_add(np.asarray(self._vectors[part], dtype=np.float32), part)
+        self.persist()
+        return index
+
+    def _hnsw_add(self, vectors, slots):
+        if not len(slots):
+            return
+        needed = int(slots.max()) + 1
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(needed, self._hnsw.get_max_elements() * 2))
+        self._hnsw.add_items(vectors, slots)
+        self._hnsw_dirty = True
+
+    # Forget the graph (in memory, on disk and in info) so it is rebuilt from the current slots if needed
+    def _drop_hnsw(self):
+        self._hnsw = None
+        self._hnsw_dirty = False
+        self._hnsw_slots = 0
+        if os.path.exists(self._hnsw_path()):
+            os.remove(self._hnsw_path())
+        self._db.execute("DELETE FROM info WHERE key = 'hnsw_slots'")
+
+    def _hnsw_mark_deleted(self, slots):
+        for slot in slots:
+            try:
+                self._hnsw.mark_deleted(int(slot))
+            except RuntimeError:
+                # Never added, or already marked
+                pass
+        if len(slots):
+            self._hnsw_dirty = True
+
+    # Save the HNSW graph (if one was built) so the next open only catches up instead of rebuilding
+    def persist(self):
+        with self._write(bump=False):
+            if self._hnsw is None or not self._hnsw_dirty:
+                return
+            self._hnsw.save_index(self._hnsw_path())
+            self._set_info(hnsw_slots=self.slots)
+            self._hnsw_slots = self.slots
+            self._hnsw_dirty = False
+
+    # Rewrite the vector file with live rows only (and, if keep_documents is given, only chunks of those
+    # documents), renumbering slots from zero. The HNSW graph is dropped and rebuilt on demand.
+    # Returns (chunks kept, chunks dropped because their document was not in keep_documents).
+    def compact(self, keep_documents=None):
+        with self._write():
+            dropped = 0
+            if keep_documents is not None:
+                dropped = self._db.execute(
+                    'DELETE FROM chunk WHERE document_id IS NULL OR document_id NOT IN (SELECT value FROM json_each(?))',
+                    (json.dumps(sorted(keep_documents)),)
+                ).rowcount
+            rows = self._db.execute('SELECT id, slot FROM chunk ORDER BY slot').fetchall()
+            self._drop_hnsw()
+            if self.dim is not None:
+                old_slots = np.array([slot for _id, slot in rows], dtype=np.int64)
+                files = [(self._vector_path(), self._vectors)]
+                if self._quantizer is not None:
+                    files.append((self._codes_path(), self._codes))
+                for path, source in files:
+                    tmp_path = path + '.compact'
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    target = _map_rows(tmp_path, source.dtype, source.shape[1], max(len(rows), INITIAL_CAPACITY))
+                    for start in range(0, len(rows), COPY_BLOCK):
+                        part = old_slots[start:start + COPY_BLOCK]
+                        target[start:start + len(part)] = source[part]
+                    target.flush()
+                    del target
+                    os.replace(tmp_path, path)
+                self._vectors = self._codes = None
+            # Slots only move down and keep their order, so renumbering in order never collides
+            self._db.executemany('UPDATE chunk SET slot = ? WHERE id = ?',
+                                 [(i, chunk_id) for i, (chunk_id, _slot) in enumerate(rows)])
+            self._set_info(slots=len(rows))
+            self.slots = len(rows)
+            self._live = np.ones(len(rows), dtype=bool)
+            if self.dim is not None:
+                self._map(self._capacity_on_disk())
+        with self._lock:
+            self._db.execute('VACUUM')
+        return len(rows), dropped
+
+    def close(self):
+        with self._lock:
+            if self._db is None:
+                return
+            self.persist()
+            self._vectors = self._codes = None
+            self._hnsw = None
+            self._db.close()
+            self._db = None
+
+
+# Map a file of fixed-width rows, growing it to hold at least capacity rows
+def _map_rows(path, dtype, width, capacity):
+    row_bytes = np.dtype(dtype).itemsize * width
+    with open(path, 'ab') as f:
+        if f.tell() < capacity * row_bytes:
+            f.truncate(capacity * row_bytes)
+    return np.memmap(path, dtype=dtype, mode='r+', shape=(capacity, width))
+
+
+# path -> open MmapCollection, so every handle on a directory in this process shares one collection
+_collections = {}
+_collections_lock = threading.Lock()
+
+
+def open_collection(path, name='default', **options):
+    key = os.path.abspath(path)
+    with _collections_lock:
+        collection = _collections.get(key)
+        if collection is None:
+            collection = _collections[key] = MmapCollection(path, name, **options)
+        return collection
+
+
+# Close the shared collection for a directory (saving its HNSW graph); the next access reopens it
+def release_collection(path):
+    with _collections_lock:
+        collection = _collections.pop(os.path.abspath(path), None)
+    if collection is not None:
+        try:
+            collection.close()
+        except Exception as e:
+            logger.warning('Error closing vector store %s: %s', path, e)
+
+
+# LangChain vector store over a memory-mapped collection, usable wherever the app uses its Chroma store
+class MmapVectorStore(VectorStore):
+    # collection_options are MmapCollection's keyword arguments (dtype, hnsw_threshold, quantization, ...)
+    def __init__(self, path, embedding_function=None, collection_name='default', **collection_options):
+        self._persist_directory = path
+        self._embedding_function = embedding_function
+        self._collection_name = collection_name
+        self._collection_options = collection_options
+
+    @property
+    def _collection(self):
+        return open_collection(self._persist_directory, self._collection_name, **self._collection_options)
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        self._collection.upsert(ids, self._embedding_function.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None):
+        return [(Document(page_content=text or '', metadata=metadata, id=chunk_id), distance)
+                for chunk_id, text, metadata, distance in self._collection.search(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+    def delete(self, ids=None, **kwargs):
+        self._collection.delete(ids=ids, where=kwargs.get('where'))
+
+    # Remove the collection and its files; the next write starts an empty one
+    def delete_collection(self):
+        release_collection(self._persist_directory)
+        shutil.rmtree(self._persist_directory, ignore_errors=True)
+
+    def close(self):
+        release_collection(self._persist_directory)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_directory=None, **kwargs):
+        store = cls(persist_directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,172 @@
+# app/vectorstore_pool.py
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Default bounds (overridable through app config)
+DEFAULT_MAX_HANDLES = 32
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+# Approximate resident size of a persisted store: its on-disk segments are loaded into memory
+def directory_size(path):
+    total = 0
+    if not path or not os.path.isdir(path):
+        return 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# Free what a handle holds open: engines with close() (the memory-mapped store) close themselves, and the
+# Chroma system behind a Chroma handle is stopped so its SQLite connection and HNSW index are freed
+def release_chroma_handle(vs):
+    if callable(getattr(vs, 'close', None)):
+        vs.close()
+        return
+    persist_dir = getattr(vs, '_persist_directory', None)
+    if persist_dir:
+        release_chroma_system(persist_dir)
+
+
+# Stop the shared Chroma system for a persist directory (every client opened on that path)
+def release_chroma_system(persist_dir):
+    try:
+        from chromadb.api.client import SharedSystemClient
+        system = SharedSystemClient._identifier_to_system.pop(persist_dir, None)
+        if system is not None:
+            system.stop()
+    except Exception as e:
+        logger.warning('Error releasing vector store %s: %s', persist_dir, e)
+
+
+# Process-wide LRU registry of open vector store handles, bounded by count and by estimated memory
+class VectorStorePool:
+    def __init__(self, max_handles=DEFAULT_MAX_HANDLES, max_bytes=DEFAULT_MAX_BYTES, release=release_chroma_handle):
+        self.max_handles = max_handles
+        self.max_bytes = max_bytes
+        self.release = release
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (handle, estimated bytes, persist directory); most recently used last
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        # One lock per key so a slow cold open never blocks warm lookups for other users
+        self._open_locks = {}
+
+    # Return the open handle for key, calling opener() at most once even under concurrent requests
+    def get(self, key, opener):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            open_lock = self._open_locks.setdefault(key, threading.Lock())
+
+        with open_lock:
+            # Another thread may have opened it while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self.misses += 1
+            handle = opener()
+            persist_dir = getattr(handle, '_persist_directory', None)
+            size = directory_size(persist_dir)
+            with self._lock:
+                self._entries[key] = (handle, size, persist_dir)
+                self._open_locks.pop(key, None)
+                self._evict(keep=key)
+            return handle
+
+    # Re-measure a handle's footprint after writes have grown its index
+    def refresh_size(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            handle, _old, persist_dir = entry
+            self._entries[key] = (handle, directory_size(persist_dir), persist_dir)
+            self._evict(keep=key)
+
+    # Drop handles whose underlying store was replaced or removed (rebuild, delete, compaction).
+    # Matches a single key, or every key whose first element equals owner when a user id is passed.
+    def invalidate(self, owner):
+        with self._lock:
+            keys = [k for k in self._entries if k == owner or (isinstance(k, tuple) and k[0] == owner)]
+            entries = [self._entries.pop(k) for k in keys]
+            releasable = self._releasable(entries)
+        for handle in releasable:
+            self.release(handle)
+        return len(entries)
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for handle, _size, _dir in entries:
+            self.release(handle)
+
+    # Evict least recently used handles until both bounds hold (never the one just opened)
+    def _evict(self, keep=None):
+        evicted = []
+        while self._entries and (len(self._entries) > self.max_handles or self._total_bytes() > self.max_bytes):
+            key = next(iter(self._entries))
+            if key == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(key)
+                key = next(iter(self._entries))
+            evicted.append(self._entries.pop(key))
+            self.evictions += 1
+        for _handle, _size, persist_dir in evicted:
+            logger.info('Evicting vector store handle for %s.', persist_dir)
+        for handle in self._releasable(evicted):
+            self.release(handle)
+
+    # Handles of removed entries that can be released: the Chroma system or memory-mapped collection
+    # behind a handle is shared by every handle on its directory, so it stays open while a pooled entry
+    # (another embedding model or engine for the same user) still uses that directory
+    def _releasable(self, removed):
+        in_use = {persist_dir for _h, _size, persist_dir in self._entries.values() if persist_dir}
+        return [handle for handle, _size, persist_dir in removed if not persist_dir or persist_dir not in in_use]
+
+    def _total_bytes(self):
+        return sum(size for _h, size, _d in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'handles': len(self._entries),
+                'bytes': self._total_bytes(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'max_handles': self.max_handles,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# The shared pool for this process (created on first use)
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_vectorstore_pool(max_handles=DEFAULT_MAX_HANDLES, max_bytes=DEFAULT_MAX_BYTES):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = VectorStorePool(max_handles, max_bytes)
+        return _pool
@@ -26,6 +26,15 @@ import app.models  # registers User, UploadedDocument, Folder, QueryHistory, etc
 target_metadata = db.metadata
 
 
+# Tables created by raw SQL in migrations rather than from models: the user_search FTS5 virtual table
+# and its shadow tables (user_search_data, _idx, _docsize, _config). Autogenerate would otherwise
+# report them as removed and emit drops.
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'table' and reflected and compare_to is None and name.startswith('user_search'):
+        return False
+    return True
+
+
 def get_engine():
     """
     Return the SQLAlchemy Engine from Flask-Migrate’s extension.
@@ -42,6 +51,7 @@ def run_migrations_offline():
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
     )
 
@@ -67,6 +77,7 @@ def run_migrations_online():
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
+            include_object=include_object,
             process_revision_directives=process_revision_directives,
             **current_app.extensions['migrate'].configure_args
         )
@@ -0,0 +1,30 @@
+"""Track per-document indexing state
+
+Revision ID: 3f1c2a7b8e4d
+Revises: 9d792c21b57a
+Create Date: 2025-06-02 10:14:51.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7b8e4d'
+down_revision = '9d792c21b57a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('uploaded_document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('chunk_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('indexed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('uploaded_document', schema=None) as batch_op:
+        batch_op.drop_column('indexed_at')
+        batch_op.drop_column('chunk_count')
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,50 @@
+"""Daily stats rollup and date indexes
+
+Revision ID: 8b2e4f6a0c13
+Revises: e5b1f3c8d907
+Create Date: 2025-06-20 11:32:08.443901
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4f6a0c13'
+down_revision = 'e5b1f3c8d907'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_stat',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('users_joined', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('documents_uploaded', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('queries_run', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('active_users', sa.Integer(), nullable=False, server_default='0'),
+    sa.PrimaryKeyConstraint('day')
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_date_joined', ['date_joined'], unique=False)
+
+    with op.batch_alter_table('uploaded_document', schema=None) as batch_op:
+        batch_op.create_index('ix_uploaded_document_upload_date', ['upload_date'], unique=False)
+
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.create_index('ix_query_history_timestamp', ['timestamp'], unique=False)
+
+    # Existing rows are rolled up with `flask rebuild-daily-stats`
+
+
+def downgrade():
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_query_history_timestamp')
+
+    with op.batch_alter_table('uploaded_document', schema=None) as batch_op:
+        batch_op.drop_index('ix_uploaded_document_upload_date')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_date_joined')
+
+    op.drop_table('daily_stat')
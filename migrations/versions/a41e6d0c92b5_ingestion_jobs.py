@@ -0,0 +1,43 @@
+"""Add ingestion job table
+
+Revision ID: a41e6d0c92b5
+Revises: 3f1c2a7b8e4d
+Create Date: 2025-06-09 15:31:07.552940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41e6d0c92b5'
+down_revision = '3f1c2a7b8e4d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ingestion_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=True),
+    sa.Column('source_url', sa.String(length=2048), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('stage', sa.String(length=20), nullable=False),
+    sa.Column('stage_progress', sa.JSON(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['document_id'], ['uploaded_document.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ingestion_job', schema=None) as batch_op:
+        batch_op.create_index('ix_ingestion_job_status', ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ingestion_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_ingestion_job_status')
+    op.drop_table('ingestion_job')
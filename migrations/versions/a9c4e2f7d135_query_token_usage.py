@@ -0,0 +1,28 @@
+"""Prompt and completion token counts on query history
+
+Revision ID: a9c4e2f7d135
+Revises: b3d9e7f1a254
+Create Date: 2025-07-02 10:21:37.406512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4e2f7d135'
+down_revision = 'b3d9e7f1a254'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('prompt_tokens', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('completion_tokens', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.drop_column('completion_tokens')
+        batch_op.drop_column('prompt_tokens')
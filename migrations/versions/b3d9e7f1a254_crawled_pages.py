@@ -0,0 +1,40 @@
+"""Add crawled page table for conditional re-crawls
+
+Revision ID: b3d9e7f1a254
+Revises: f2c6b1d9a370
+Create Date: 2025-06-27 14:05:51.774310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d9e7f1a254'
+down_revision = 'f2c6b1d9a370'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('crawled_page',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('url', sa.String(length=2048), nullable=False),
+    sa.Column('seed_url', sa.String(length=2048), nullable=False),
+    sa.Column('document_id', sa.Integer(), nullable=True),
+    sa.Column('etag', sa.String(length=256), nullable=True),
+    sa.Column('last_modified', sa.String(length=64), nullable=True),
+    sa.Column('text_hash', sa.String(length=64), nullable=True),
+    sa.Column('status_code', sa.Integer(), nullable=True),
+    sa.Column('fetched_at', sa.DateTime(), nullable=True),
+    sa.Column('changed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['document_id'], ['uploaded_document.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'url', name='uq_crawled_page_user_url')
+    )
+
+
+def downgrade():
+    op.drop_table('crawled_page')
@@ -0,0 +1,38 @@
+"""Answer cache columns
+
+Revision ID: c7d83f5a1e62
+Revises: a41e6d0c92b5
+Create Date: 2025-06-16 09:47:22.018334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d83f5a1e62'
+down_revision = 'a41e6d0c92b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('corpus_version', sa.Integer(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('question_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('corpus_version', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('from_cache', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.create_index('ix_query_history_user_question_hash', ['user_id', 'question_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_query_history_user_question_hash')
+        batch_op.drop_column('from_cache')
+        batch_op.drop_column('corpus_version')
+        batch_op.drop_column('question_hash')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('corpus_version')
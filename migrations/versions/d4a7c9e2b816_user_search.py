@@ -0,0 +1,61 @@
+"""Substring search index for the admin user lookup
+
+Revision ID: d4a7c9e2b816
+Revises: 8b2e4f6a0c13
+Create Date: 2025-06-23 10:14:37.902115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7c9e2b816'
+down_revision = '8b2e4f6a0c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # FTS5 trigram index over username/email, kept in sync with the user table by triggers
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5("
+            "username, email, content='user', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON "user" BEGIN '
+            "INSERT INTO user_search(rowid, username, email) VALUES (new.id, new.username, new.email); END"
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON "user" BEGIN '
+            "INSERT INTO user_search(user_search, rowid, username, email) "
+            "VALUES ('delete', old.id, old.username, old.email); END"
+        )
+        op.execute(
+            'CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF username, email ON "user" BEGIN '
+            "INSERT INTO user_search(user_search, rowid, username, email) "
+            "VALUES ('delete', old.id, old.username, old.email); "
+            "INSERT INTO user_search(rowid, username, email) VALUES (new.id, new.username, new.email); END"
+        )
+        op.execute("INSERT INTO user_search(user_search) VALUES ('rebuild')")
+    elif bind.dialect.name == 'postgresql':
+        # pg_trgm GIN indexes let ILIKE '%term%' use an index
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_user_username_trgm', 'user', ['username'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'})
+        op.create_index('ix_user_email_trgm', 'user', ['email'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS user_search_au')
+        op.execute('DROP TRIGGER IF EXISTS user_search_ad')
+        op.execute('DROP TRIGGER IF EXISTS user_search_ai')
+        op.execute('DROP TABLE IF EXISTS user_search')
+    elif bind.dialect.name == 'postgresql':
+        op.drop_index('ix_user_email_trgm', table_name='user')
+        op.drop_index('ix_user_username_trgm', table_name='user')
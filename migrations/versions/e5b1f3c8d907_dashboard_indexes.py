@@ -0,0 +1,38 @@
+"""Dashboard pagination indexes
+
+Revision ID: e5b1f3c8d907
+Revises: c7d83f5a1e62
+Create Date: 2025-06-18 14:05:51.627190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1f3c8d907'
+down_revision = 'c7d83f5a1e62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('uploaded_document', schema=None) as batch_op:
+        batch_op.create_index('ix_uploaded_document_user_upload_date', ['user_id', 'upload_date', 'id'], unique=False)
+
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.create_index('ix_query_history_user_timestamp', ['user_id', 'timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('folder', schema=None) as batch_op:
+        batch_op.create_index('ix_folder_user_id', ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('folder', schema=None) as batch_op:
+        batch_op.drop_index('ix_folder_user_id')
+
+    with op.batch_alter_table('query_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_query_history_user_timestamp')
+
+    with op.batch_alter_table('uploaded_document', schema=None) as batch_op:
+        batch_op.drop_index('ix_uploaded_document_user_upload_date')
@@ -0,0 +1,28 @@
+"""Ingestion job owner and heartbeat
+
+Revision ID: e8f2a6c4b019
+Revises: a9c4e2f7d135
+Create Date: 2025-07-03 15:42:08.193027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f2a6c4b019'
+down_revision = 'a9c4e2f7d135'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ingestion_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('worker_id', sa.String(length=128), nullable=True))
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('ingestion_job', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('worker_id')
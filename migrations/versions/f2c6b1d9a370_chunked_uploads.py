@@ -0,0 +1,45 @@
+"""Resumable chunked uploads and per-document file sizes
+
+Revision ID: f2c6b1d9a370
+Revises: d4a7c9e2b816
+Create Date: 2025-06-25 09:42:18.310562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6b1d9a370'
+down_revision = 'd4a7c9e2b816'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload_session',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=200), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('received', sa.BigInteger(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.create_index('ix_upload_session_user_id', ['user_id'], unique=False)
+
+    with op.batch_alter_table('uploaded_document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_size', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('uploaded_document', schema=None) as batch_op:
+        batch_op.drop_column('file_size')
+
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.drop_index('ix_upload_session_user_id')
+    op.drop_table('upload_session')
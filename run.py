@@ -1,9 +1,16 @@
 # run.py - at the root of the project
-from app import create_app, create_admin_command
+from app import create_app, create_admin_command, create_reindex_command, create_stats_command, create_bulk_ingest_command, create_crawl_command, \
+    create_compact_command, create_migrate_vectorstores_command
 from app.extensions import db
 
 app = create_app()
 create_admin_command(app)
+create_reindex_command(app)
+create_stats_command(app)
+create_bulk_ingest_command(app)
+create_crawl_command(app)
+create_compact_command(app)
+create_migrate_vectorstores_command(app)
 
 if __name__ == "__main__":
     app.run(debug=True, port=5500)
\ No newline at end of file
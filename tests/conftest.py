@@ -10,17 +10,36 @@ from app.__init__ import create_app
 from app.extensions import db
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     app = create_app()
     app.config["TESTING"] = True
     # Disable CSRF in tests so tokens aren’t required
     app.config["WTF_CSRF_ENABLED"] = False
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"  # in-memory database
+    # Run ingestion jobs inline so tests can assert on their results
+    app.config["INGESTION_EAGER"] = True
+    # No background last_activity writer; tests flush the tracker explicitly
+    app.config["ACTIVITY_FLUSH_SECONDS"] = 0
+    # Embeddings are cached per test, never in the developer's instance/ cache
+    app.config["EMBEDDING_CACHE_PATH"] = str(tmp_path / "embedding_cache.sqlite3")
+    # Likewise parsed documents, so no test reads a parse left in instance/parse_cache by another run
+    app.config["PARSE_CACHE_DIR"] = str(tmp_path / "parse_cache")
     with app.app_context():
         db.create_all()
         yield app
         db.drop_all()
 
+# Run in a temporary folder (uploads/ and chroma_db/ are relative) with deterministic offline embeddings
+# for bulk and crawl ingestion, and no store handles left open by an earlier test
+@pytest.fixture
+def workspace(app, tmp_path, monkeypatch):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from app.utils import vectorstore_pool
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("app.bulk_ingestion.get_embeddings", lambda config: DeterministicFakeEmbedding(size=8))
+    vectorstore_pool().clear()
+    return tmp_path
+
 @pytest.fixture
 def client(app):
     return app.test_client()
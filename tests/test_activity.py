@@ -0,0 +1,105 @@
+# tests/test_activity.py
+import datetime
+import threading
+
+import pytest
+from sqlalchemy import event
+
+from app.activity import get_activity_tracker
+from app.models import User, db
+
+
+def register_and_login(client, name):
+    client.post("/register", data={"username": name, "email": f"{name}@example.com", "password": "secretpw"})
+    client.post("/login", data={"username": name, "password": "secretpw"})
+
+
+def count_user_writes(engine):
+    writes = []
+    def listener(_conn, _cursor, statement, *_args):
+        if statement.startswith("UPDATE user "):
+            writes.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    return writes, lambda: event.remove(engine, "before_cursor_execute", listener)
+
+
+def last_activity(username):
+    db.session.expire_all()
+    return User.query.filter_by(username=username).first().last_activity
+
+
+def test_requests_are_throttled_and_flushed_in_one_write(client, app):
+    register_and_login(client, "walker")
+    stale = datetime.datetime(2020, 1, 1)
+    User.query.filter_by(username="walker").update({"last_activity": stale})
+    db.session.commit()
+
+    writes, stop = count_user_writes(db.engine)
+    try:
+        for _ in range(5):
+            assert client.get("/dashboard").status_code == 200
+        client.get("/static/does-not-exist.css")
+        # Requests only touched memory
+        assert writes == [] and last_activity("walker") == stale
+
+        tracker = get_activity_tracker(app)
+        assert tracker.stats()["pending"] == 1
+        assert tracker.flush() == 1 and len(writes) == 1
+    finally:
+        stop()
+    assert last_activity("walker") > stale
+    # Within the touch interval further requests record nothing
+    client.get("/dashboard")
+    assert tracker.flush() == 0
+    stats = tracker.stats()
+    assert stats["recorded"] == 1 and stats["touches"] >= 6
+
+
+def test_admin_dashboard_flushes_pending_activity(client, app):
+    register_and_login(client, "chief")
+    chief = User.query.filter_by(username="chief").first()
+    chief.is_admin = True
+    chief.last_activity = datetime.datetime(2020, 1, 1)
+    db.session.commit()
+    page = client.get("/admin/dashboard", query_string={"q": "chief"}).data.decode()
+    assert "2020-01-01" not in page
+    assert last_activity("chief").date() == datetime.datetime.utcnow().date()
+
+
+@pytest.mark.benchmark(group="activity")
+def test_concurrent_requests_coalesce_activity_writes(benchmark, client, app):
+    users, requests_each = 8, 25
+    clients = []
+    for i in range(users):
+        c = app.test_client()
+        register_and_login(c, f"busy{i}")
+        clients.append(c)
+    tracker = get_activity_tracker(app)
+    tracker.flush()
+
+    def burst():
+        failures = []
+        def worker(c):
+            for _ in range(requests_each):
+                if c.get("/history").status_code != 200:
+                    failures.append(1)
+        threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not failures
+
+    writes, stop = count_user_writes(db.engine)
+    try:
+        benchmark.pedantic(burst, rounds=1, iterations=1)
+        during = len(writes)
+        tracker.flush()
+    finally:
+        stop()
+    total_requests = users * requests_each
+    benchmark.extra_info.update(requests=total_requests, user_writes=len(writes),
+                                rows_written=tracker.stats()["rows_written"])
+    # Previously every request committed its own UPDATE; now none do, and one executemany covers all users
+    assert during == 0
+    assert len(writes) <= 1
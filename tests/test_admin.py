@@ -0,0 +1,129 @@
+# tests/test_admin.py
+import datetime
+
+from sqlalchemy import event
+
+from app.models import User, UploadedDocument, QueryHistory, DailyStat, db
+from app.stats import rebuild_daily_stats, activity_series
+
+
+def snapshot():
+    return {row.day: (row.users_joined, row.documents_uploaded, row.queries_run, row.active_users)
+            for row in DailyStat.query.order_by(DailyStat.day)}
+
+
+def add_activity(users=3, days=5, per_day=4):
+    now = datetime.datetime.utcnow()
+    created = []
+    for u in range(users):
+        user = User(username=f"stats{len(created)}_{u}_{now.timestamp()}", email=f"s{u}_{now.timestamp()}@x.com",
+                    password_hash="x", date_joined=now - datetime.timedelta(days=u))
+        db.session.add(user)
+        db.session.flush()
+        created.append(user)
+        for d in range(days):
+            day = now - datetime.timedelta(days=d)
+            db.session.add(UploadedDocument(filename=f"f{u}{d}.txt", user_id=user.id, upload_date=day))
+            for i in range(per_day):
+                db.session.add(QueryHistory(question="q", answer="a", user_id=user.id,
+                                            timestamp=day - datetime.timedelta(minutes=i)))
+    db.session.commit()
+    return created
+
+
+def test_rollup_is_maintained_incrementally(app):
+    users = add_activity()
+    # Deleting a user's only query on a day removes them from that day's active users
+    for q in QueryHistory.query.filter_by(user_id=users[0].id):
+        db.session.delete(q)
+    db.session.commit()
+    only = QueryHistory(question="q", answer="a", user_id=users[0].id, timestamp=datetime.datetime.utcnow())
+    db.session.add(only)
+    db.session.commit()
+    db.session.delete(only)
+    # Re-uploading moves a document to a new day
+    doc = UploadedDocument.query.filter_by(user_id=users[1].id).order_by(UploadedDocument.upload_date).first()
+    doc.upload_date = datetime.datetime.utcnow()
+    db.session.commit()
+
+    incremental = snapshot()
+    rebuild_daily_stats()
+    assert snapshot() == incremental
+
+    today = datetime.datetime.utcnow().date()
+    assert incremental[today][2] == 2 * 4 and incremental[today][3] == 2
+    series = activity_series("day")
+    assert len(series["query_counts"]["values"]) == 7
+    assert series["query_counts"]["values"][-1] == 8
+    assert sum(activity_series("week")["doc_uploads"]["values"]) == 15
+
+
+def test_admin_dashboard_query_count_does_not_grow_with_data(client, app):
+    client.post("/register", data={"username": "boss", "email": "boss@example.com", "password": "bosspass"})
+    client.post("/login", data={"username": "boss", "password": "bosspass"})
+    boss = User.query.filter_by(username="boss").first()
+    boss.is_admin = True
+    db.session.commit()
+    # The first visit writes the admin's buffered last_activity; measure steady-state pages
+    client.get("/admin/dashboard")
+
+    statements = []
+    def count(*_args):
+        statements.append(1)
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for timeframe in ("day", "week", "month"):
+            add_activity(users=1, days=2, per_day=1)
+            statements.clear()
+            assert client.get(f"/admin/dashboard?timeframe={timeframe}").status_code == 200
+            small = len(statements)
+
+            add_activity(users=4, days=30, per_day=10)
+            statements.clear()
+            page = client.get(f"/admin/dashboard?timeframe={timeframe}")
+            assert page.status_code == 200
+            assert len(statements) == small
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert b"activeUsersChart" in page.data
+
+
+def test_user_lookup_is_indexed_paginated_and_counts_in_one_statement(client, app):
+    from app.user_search import search_users
+    client.post("/register", data={"username": "root", "email": "root@example.com", "password": "rootpass"})
+    client.post("/login", data={"username": "root", "password": "rootpass"})
+    User.query.filter_by(username="root").first().is_admin = True
+    for i in range(30):
+        user = User(username=f"findme_{i:02d}", email=f"u{i}@corp.example", password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all(UploadedDocument(filename=f"d{j}.txt", user_id=user.id) for j in range(i % 3))
+        db.session.add_all(QueryHistory(question="q", answer="a", user_id=user.id) for _ in range(i % 4))
+    db.session.commit()
+
+    statements = []
+    def count(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        page, cursor = search_users("DME_1", limit=5)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    assert [u.username for u, _d, _q in page] == [f"findme_1{i}" for i in range(5)]
+    assert [(d, q) for _u, d, q in page] == [(i % 3, i % 4) for i in range(10, 15)]
+    assert sum("user_search MATCH" in s for s in statements) == 1
+
+    rest, last = search_users("DME_1", cursor=cursor, limit=5)
+    assert [u.username for u, _d, _q in rest] == [f"findme_1{i}" for i in range(5, 10)] and last is None
+
+    # Renames reach the index through the triggers; short terms fall back to LIKE
+    User.query.filter_by(username="findme_00").first().email = "renamed@elsewhere.org"
+    db.session.commit()
+    assert [u.username for u, _d, _q in search_users("elsewhere")[0]] == ["findme_00"]
+    assert [u.username for u, _d, _q in search_users("u2@")[0]] == ["findme_02"]
+    assert len(search_users("u2")[0]) == 11
+    assert search_users("100%")[0] == []
+
+    page = client.get("/admin/dashboard", query_string={"q": "findme", "timeframe": "day"})
+    assert page.status_code == 200 and b"Next page" in page.data
@@ -0,0 +1,150 @@
+# tests/test_bulk_ingestion.py
+import io
+import os
+import hashlib
+import time
+import tarfile
+import zipfile
+from importlib.util import find_spec
+
+import pytest
+
+from app import create_bulk_ingest_command
+from app.bulk_ingestion import BulkUploadError, save_entries
+from app.models import User, UploadedDocument, IngestionJob, db
+from app.utils import get_user_lexical_index
+
+
+# Without Unstructured installed, parse texts into the cache up front so pool workers only split
+def seed_parse_cache(app, texts):
+    if find_spec("unstructured") is not None:
+        return
+    from app.ingestion import loader_version
+    from app.parse_cache import get_parse_cache
+    cache = get_parse_cache(os.path.abspath(app.config["PARSE_CACHE_DIR"]))
+    for text in texts:
+        cache.put(hashlib.sha256(text.encode()).hexdigest(), loader_version(), [(text, {})])
+
+
+def zip_bytes(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, text in entries.items():
+            archive.writestr(name, text)
+    return buffer.getvalue()
+
+
+def tar_bytes(entries):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, text in entries.items():
+            data = text.encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_bulk_upload_unpacks_archives_and_indexes_every_file(client, app, workspace):
+    client.post("/register", data={"username": "bulk", "email": "bulk@example.com", "password": "bulkpass"})
+    client.post("/login", data={"username": "bulk", "password": "bulkpass"})
+    user = User.query.filter_by(username="bulk").first()
+    app.config["BULK_PARSE_WORKERS"] = 1
+    reports = {"reports/q1.txt": "Quarterly revenue grew in the first quarter.",
+               "reports/q2.txt": "Second quarter churn fell.",
+               "__MACOSX/._q1.txt": "resource fork", ".hidden.txt": "skip me"}
+    notes = {"notes/alpha.txt": "Alpha notes about the ZX-42 widget."}
+    seed_parse_cache(app, [reports["reports/q1.txt"], reports["reports/q2.txt"], notes["notes/alpha.txt"],
+                           "A plain single file."])
+
+    data = {"documents": [
+        (io.BytesIO(zip_bytes(reports)), "reports.zip"),
+        (io.BytesIO(tar_bytes(notes)), "notes.tar.gz"),
+        (io.BytesIO(b"A plain single file."), "plain.txt"),
+    ]}
+    response = client.post("/upload/bulk", data=data, content_type="multipart/form-data",
+                           headers={"Accept": "application/json"})
+    assert response.status_code == 202 and response.get_json()["count"] == 4
+
+    names = sorted(d.filename for d in UploadedDocument.query.filter_by(user_id=user.id))
+    assert names == ["notes_alpha.txt", "plain.txt", "reports_q1.txt", "reports_q2.txt"]
+    assert {j.status for j in IngestionJob.query.filter_by(user_id=user.id)} == {"succeeded"}
+    hits = get_user_lexical_index(user.id).search("ZX-42", 3)
+    assert hits and hits[0][2]["filename"] == "notes_alpha.txt"
+
+    # Uploading the same archive again re-uses the documents and skips unchanged content
+    page = client.post("/upload/bulk", data={"documents": [(io.BytesIO(tar_bytes(notes)), "notes.tar.gz")]},
+                       content_type="multipart/form-data", follow_redirects=True)
+    assert b"1 documents uploaded and processed (0 failed)" in page.data
+    assert UploadedDocument.query.filter_by(user_id=user.id).count() == 4
+
+
+def test_bulk_upload_rejects_archives_that_expand_past_the_limit(client, app, workspace):
+    client.post("/register", data={"username": "bomb", "email": "bomb@example.com", "password": "bombpass"})
+    client.post("/login", data={"username": "bomb", "password": "bombpass"})
+    app.config["BULK_MAX_BYTES"] = 1024
+    data = {"documents": [(io.BytesIO(zip_bytes({"big.txt": "x" * 100000})), "big.zip")]}
+    page = client.post("/upload/bulk", data=data, content_type="multipart/form-data", follow_redirects=True)
+    assert b"once extracted" in page.data
+    assert UploadedDocument.query.count() == 0
+
+    # The user's remaining quota caps the extracted size as well
+    app.config["BULK_MAX_BYTES"] = 10 ** 6
+    app.config["UPLOAD_QUOTA_BYTES"] = 50000
+    data = {"documents": [(io.BytesIO(tar_bytes({"big.txt": "x" * 100000})), "big.tar.gz")]}
+    page = client.post("/upload/bulk", data=data, content_type="multipart/form-data", follow_redirects=True)
+    assert b"50000 bytes once extracted" in page.data
+    assert UploadedDocument.query.count() == 0
+
+
+def test_rejected_archive_leaves_existing_files_untouched(workspace):
+    user_dir = workspace / "uploads" / "7"
+    user_dir.mkdir(parents=True)
+    (user_dir / "report.txt").write_bytes(b"old report")
+    archive = tar_bytes({"notes.txt": "n" * 1000, "report.txt": "r" * 3000})
+    with pytest.raises(BulkUploadError):
+        save_entries(7, [("batch.tar.gz", io.BytesIO(archive))], max_bytes=2000)
+    # Neither the replaced file nor the entry copied before the limit was hit reached the folder
+    assert (user_dir / "report.txt").read_bytes() == b"old report"
+    assert sorted(os.listdir(user_dir)) == [".partial", "report.txt"]
+    assert os.listdir(user_dir / ".partial") == []
+
+    assert save_entries(7, [("batch.tar.gz", io.BytesIO(archive))], max_bytes=5000) == ["notes.txt", "report.txt"]
+    assert (user_dir / "report.txt").read_bytes() == b"r" * 3000
+
+
+@pytest.mark.benchmark(group="bulk_ingestion")
+def test_cli_parses_in_a_process_pool_and_writes_in_order(benchmark, app, workspace):
+    user = User(username="onboard", email="onboard@example.com", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+    source = workspace / "corpus"
+    source.mkdir()
+    for i in range(24):
+        words = " ".join(f"topic{i} sentence {j} about document {i}." for j in range(150))
+        (source / f"doc{i:03d}.txt").write_text(words)
+    seed_parse_cache(app, [path.read_text() for path in source.iterdir()])
+    create_bulk_ingest_command(app)
+    runner = app.test_cli_runner()
+
+    timings = {}
+    def ingest(workers):
+        start = time.perf_counter()
+        result = runner.invoke(args=["ingest-bulk", "--user-id", str(user.id), "--workers", str(workers), str(source)])
+        timings[workers] = time.perf_counter() - start
+        return result
+
+    result = benchmark.pedantic(ingest, args=(2,), rounds=1, iterations=1)
+    assert "24 indexed" in result.output, result.output
+    docs = UploadedDocument.query.filter_by(user_id=user.id).order_by(UploadedDocument.id).all()
+    assert [d.filename for d in docs] == [f"doc{i:03d}.txt" for i in range(24)]
+    # The single writer indexed documents in job order
+    indexed_at = [d.indexed_at for d in docs]
+    assert all(d.content_hash for d in docs) and indexed_at == sorted(indexed_at)
+    assert get_user_lexical_index(user.id).search("topic7", 1)[0][2]["filename"] == "doc007.txt"
+
+    # A second run finds every file unchanged without parsing anything
+    result = ingest(0)
+    assert "24 unchanged" in result.output
+    benchmark.extra_info.update(files=24, pool_seconds=round(timings[2], 3),
+                                unchanged_rerun_seconds=round(timings[0], 3), cpus=os.cpu_count())
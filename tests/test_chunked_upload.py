@@ -0,0 +1,122 @@
+# tests/test_chunked_upload.py
+import io
+import os
+import hashlib
+import tracemalloc
+
+import pytest
+
+from app.models import UploadedDocument, UploadSession
+
+JSON = {"Accept": "application/json"}
+
+
+@pytest.fixture
+def uploader(client, app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Processing is covered elsewhere; keep completed uploads queued
+    monkeypatch.setattr("app.documents.routes.enqueue_ingestion",
+                        lambda user_id, document=None: type("Job", (), {"id": 0})())
+    monkeypatch.setattr("app.documents.routes.job_to_dict", lambda job: {"id": job.id})
+    client.post("/register", data={"username": "big", "email": "big@example.com", "password": "bigfiles"})
+    client.post("/login", data={"username": "big", "password": "bigfiles"})
+    return client
+
+
+def start(client, name, size):
+    return client.post("/uploads", json={"filename": name, "size": size}, headers=JSON)
+
+
+def put(client, upload_id, offset, data, **kwargs):
+    return client.put(f"/uploads/{upload_id}", data=data, headers=dict(JSON, **{"Upload-Offset": str(offset)}),
+                      content_type="application/octet-stream", **kwargs)
+
+
+def test_chunked_upload_resumes_by_offset_and_hashes_while_streaming(uploader, app):
+    app.config["UPLOAD_CHUNK_BYTES"] = 1024
+    data = os.urandom(5000)
+    session = start(uploader, "../../report.pdf", len(data)).get_json()
+    assert session["filename"] == "report.pdf" and session["offset"] == 0
+    upload_id = session["id"]
+
+    assert put(uploader, upload_id, 0, data[:1024]).get_json()["offset"] == 1024
+    # Wrong offset: rejected without reading, and told where to resume
+    conflict = put(uploader, upload_id, 0, data[:1024])
+    assert conflict.status_code == 409 and conflict.get_json()["offset"] == 1024
+    # Oversized chunk is refused before any byte is read
+    assert put(uploader, upload_id, 1024, data[1024:3072]).status_code == 413
+
+    # The connection drops after 300 of 1024 promised bytes: what arrived is kept
+    uploader.put(f"/uploads/{upload_id}", input_stream=io.BytesIO(data[1024:1324]), content_length=1024,
+                 headers=dict(JSON, **{"Upload-Offset": "1024"}), content_type="application/octet-stream")
+    offset = uploader.get(f"/uploads/{upload_id}").get_json()["offset"]
+    assert offset == 1324
+
+    # Complete too early is refused
+    assert uploader.post(f"/uploads/{upload_id}/complete", headers=JSON).status_code == 409
+    while offset < len(data):
+        offset = put(uploader, upload_id, offset, data[offset:offset + 1024]).get_json()["offset"]
+
+    done = uploader.post(f"/uploads/{upload_id}/complete", headers=JSON)
+    assert done.status_code == 202
+    assert done.get_json()["content_hash"] == hashlib.sha256(data).hexdigest()
+    doc = UploadedDocument.query.filter_by(filename="report.pdf").one()
+    assert doc.file_size == len(data)
+    with open(os.path.join("uploads", str(doc.user_id), "report.pdf"), "rb") as f:
+        assert f.read() == data
+    assert not os.listdir(os.path.join("uploads", str(doc.user_id), ".partial"))
+
+
+def test_quota_is_enforced_before_bytes_are_accepted(uploader, app):
+    app.config["UPLOAD_QUOTA_BYTES"] = 2000
+    app.config["UPLOAD_MAX_FILE_BYTES"] = 1500
+    assert start(uploader, "huge.bin", 1600).status_code == 413
+    first = start(uploader, "a.bin", 1500).get_json()
+    # The first upload's declared size is reserved
+    assert start(uploader, "b.bin", 1000).status_code == 413
+    uploader.delete(f"/uploads/{first['id']}", headers=JSON)
+    assert UploadSession.query.get(first["id"]).status == "aborted"
+    assert start(uploader, "b.bin", 1000).status_code == 201
+
+    # The classic form upload is checked against the quota before Werkzeug parses the body
+    app.config["UPLOAD_MAX_FILE_BYTES"] = 5000
+    page = uploader.post("/upload", data={"document": (io.BytesIO(b"x" * 1500), "c.txt")},
+                         content_type="multipart/form-data", follow_redirects=True)
+    assert b"quota exceeded" in page.data
+    assert UploadedDocument.query.filter_by(filename="c.txt").first() is None
+
+
+def test_form_upload_replacing_a_document_only_counts_the_difference(uploader, app, monkeypatch):
+    monkeypatch.setattr("app.documents.routes.enqueue_ingestion",
+                        lambda user_id, document=None: type("Job", (), {"id": 0, "status": "queued"})())
+    app.config["UPLOAD_QUOTA_BYTES"] = 4000
+    form = {"content_type": "multipart/form-data", "follow_redirects": True}
+    uploader.post("/upload", data={"document": (io.BytesIO(b"x" * 2500), "notes.txt")}, **form)
+    assert UploadedDocument.query.filter_by(filename="notes.txt").one().file_size == 2500
+
+    # 3000 more bytes would not fit, but they replace the 2500 already stored
+    uploader.post("/upload", data={"document": (io.BytesIO(b"y" * 3000), "notes.txt")}, **form)
+    assert UploadedDocument.query.filter_by(filename="notes.txt").one().file_size == 3000
+    # Under another name nothing is freed
+    page = uploader.post("/upload", data={"document": (io.BytesIO(b"z" * 2000), "other.txt")}, **form)
+    assert b"quota exceeded" in page.data
+    assert UploadedDocument.query.filter_by(filename="other.txt").first() is None
+
+
+def test_memory_per_upload_is_bounded_by_the_chunk_size(uploader, app):
+    chunk = 256 * 1024
+    app.config["UPLOAD_CHUNK_BYTES"] = chunk
+    size = 40 * chunk
+    upload_id = start(uploader, "video.bin", size).get_json()["id"]
+    block = b"\x5a" * chunk
+    tracemalloc.start()
+    try:
+        offset = 0
+        while offset < size:
+            offset = put(uploader, upload_id, offset, block).get_json()["offset"]
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert uploader.post(f"/uploads/{upload_id}/complete", headers=JSON).status_code == 202
+    # A 10 MiB file never needed more than a few chunks' worth of memory
+    assert peak < 6 * chunk, peak
@@ -0,0 +1,146 @@
+# tests/test_chunking.py
+import time
+import random
+
+import pytest
+
+from app import chunking
+from app.bulk_ingestion import parse_and_split
+from app.chunking import (
+    LINE, MIN_CHUNK_TOKENS, PARAGRAPH, RecursiveChunker, TokenChunker, create_chunker, estimate_tokens, profile_name,
+)
+from app.ingestion import loader_version
+from app.parse_cache import ParseCache
+
+WORDS = ("the pump valve pressure sensor must be checked before every service interval and replaced "
+         "when worn seal bolt torque motor housing inlet outlet flow rate").split()
+
+
+def sentences(rng, n):
+    out = []
+    for _ in range(n):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(8, 25))]
+        out.append(words[0].capitalize() + " " + " ".join(words[1:]) + ".")
+    return " ".join(out)
+
+
+# Text as the loader extracts it from a long PDF: running headers, numbered section headings and
+# paragraphs of very different lengths, separated by blank lines
+def pdf_like(pages, seed=1):
+    rng = random.Random(seed)
+    blocks = []
+    for page in range(1, pages + 1):
+        blocks.append(f"Maintenance Manual - page {page}")
+        blocks.append(f"{page} Section Title {page}")
+        blocks.extend(sentences(rng, rng.randint(2, 14)) for _ in range(3))
+    return "\n\n".join(blocks)
+
+
+# Text as the crawler saves a page: one HTML block per line, navigation and footers included
+def scraped_like(pages, seed=2):
+    rng = random.Random(seed)
+    lines = []
+    for page in range(pages):
+        lines += ["Home", "Products", "Contact us", f"Article {page}"]
+        lines += [sentences(rng, rng.randint(2, 12)) for _ in range(6)]
+        lines.append("Copyright 2024 Example Inc. All rights reserved.")
+    return "\n".join(lines)
+
+
+def test_token_chunks_fit_the_budget_and_end_on_boundaries():
+    text = "# Installation\n\n" + sentences(random.Random(3), 40) + "\n\n2.1 Electrical Safety\n\n" + \
+        sentences(random.Random(4), 6)
+    chunker = TokenChunker(chunk_tokens=80, overlap_tokens=20)
+    spans = list(chunker.spans(text))
+    assert all(estimate_tokens(text, start, end) <= 80 for start, end in spans)
+    assert all(text[end - 1] == "." for _start, end in spans)
+    # Chunks overlap by whole sentences, and a heading starts a fresh chunk with no overlap
+    (first_start, first_end), (second_start, _end) = spans[:2]
+    assert first_start == 0 and second_start < first_end and text[second_start - 2:second_start] == ". "
+    heading = text.index("2.1 Electrical Safety")
+    assert heading in [start for start, _end in spans]
+    assert all(end <= heading for start, end in spans if start < heading)
+
+    # Text with no boundary at all is cut at spaces; leading and trailing whitespace is dropped
+    words = "  " + "word " * 300
+    spans = list(TokenChunker(chunk_tokens=50, overlap_tokens=0).spans(words))
+    assert spans[0][0] == 2 and words[spans[-1][1] - 1] == "d"
+    assert all(estimate_tokens(words, start, end) <= 50 for start, end in spans)
+    assert "".join(words[start:end] + " " for start, end in spans).split() == words.split()
+    assert list(TokenChunker().spans("")) == [] and list(TokenChunker().spans(" \n ")) == []
+    # A budget too small to hold a sentence is raised to the floor
+    assert TokenChunker(chunk_tokens=1, overlap_tokens=8).chunk_tokens == MIN_CHUNK_TOKENS
+
+
+def test_profiles_and_settings_come_from_config(monkeypatch):
+    assert profile_name("Manual.PDF") == "pdf"
+    assert profile_name("scraped_example_com_ab12.txt") == "web"
+    assert profile_name("prices.xlsx") == "table" and profile_name("notes") == "default"
+
+    config = {"CHUNKER": "token", "CHUNK_TOKENS": 300, "CHUNK_OVERLAP_TOKENS": 40,
+              "CHUNK_PROFILES": {"pdf": {"chunk_tokens": 500}}}
+    pdf = create_chunker(config, "manual.pdf")
+    assert (pdf.chunk_tokens, pdf.overlap_tokens, pdf.line_strength) == (500, 40, LINE)
+    table = create_chunker(config, "prices.csv")
+    assert (table.chunk_tokens, table.overlap_tokens, table.line_strength) == (300, 0, PARAGRAPH)
+    assert create_chunker(config, "scraped_x.txt").line_strength == PARAGRAPH
+    assert create_chunker({}).key == RecursiveChunker(1000, 200).key == "1000:200"
+    with pytest.raises(ValueError, match="token"):
+        create_chunker({"CHUNKER": "semantic"})
+
+    # An encoding that cannot be loaded (offline, unknown name) falls back to the estimate
+    monkeypatch.setattr(chunking, "_encoding", lambda name: (_ for _ in ()).throw(OSError("offline")))
+    assert create_chunker(dict(config, CHUNK_TOKENIZER="cl100k_base")).tokenizer == "estimate"
+
+
+def test_chunk_boundaries_are_cached_per_chunker(tmp_path):
+    text = pdf_like(3)
+    cache = ParseCache(str(tmp_path))
+    cache.put("cd" * 32, loader_version(), [(text, {"page_number": 1})])
+    chunker = TokenChunker(chunk_tokens=120, overlap_tokens=16)
+    chunks = cache.get("cd" * 32, loader_version()).chunks(chunker=chunker)
+    assert [(c.metadata["start_index"], c.metadata["start_index"] + len(c.page_content)) for c in chunks] == \
+        list(chunker.spans(text))
+    assert all(c.metadata["page_number"] == 1 for c in chunks)
+
+    # Both settings are kept side by side in the entry, and the process-pool task uses the one it is given
+    path = tmp_path / "manual.pdf"
+    path.write_text(text)
+    by_chars = parse_and_split(str(path), "cd" * 32, str(tmp_path), RecursiveChunker(300, 30))
+    by_tokens = parse_and_split(str(path), "cd" * 32, str(tmp_path), chunker)
+    assert [t for t, _md in by_tokens] == [c.page_content for c in chunks]
+    assert max(len(t) for t, _md in by_chars) <= 300 and len(by_chars) > len(by_tokens)
+    assert set(ParseCache(str(tmp_path)).get("cd" * 32, loader_version())._load()["chunks"]) == \
+        {"300:30", chunker.key}
+
+
+# Characters per second of the token chunker against the RecursiveCharacterTextSplitter it replaces,
+# on PDF-like and scraped-page text of a few MB, with chunks of about the same size (1000 characters
+# vs 256 tokens). The splitter falls back to word-level merging inside long paragraphs and lines;
+# the token chunker only looks at the end of each chunk-sized window.
+@pytest.mark.benchmark(group="chunking")
+def test_token_chunker_throughput_against_recursive_splitter(benchmark):
+    texts = {"pdf": (pdf_like(600), "manual.pdf"), "scraped": (scraped_like(400), "scraped_site.txt")}
+    token_config = {"CHUNKER": "token", "CHUNK_TOKENS": 256, "CHUNK_OVERLAP_TOKENS": 32}
+    list(RecursiveChunker().spans("warm up"))
+
+    def throughput(chunker, text):
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            spans = list(chunker.spans(text))
+            best = min(best, time.perf_counter() - start)
+        return {"mb_per_s": round(len(text) / best / 1e6, 1), "chunks": len(spans),
+                "max_tokens": max(estimate_tokens(text, s, e) for s, e in spans)}
+
+    results = {}
+    for name, (text, filename) in texts.items():
+        results[f"{name}_recursive"] = throughput(create_chunker({}, filename), text)
+        results[f"{name}_token"] = throughput(create_chunker(token_config, filename), text)
+    results["pdf_token_pedantic"] = benchmark.pedantic(
+        throughput, args=(create_chunker(token_config, "manual.pdf"), texts["pdf"][0]), rounds=1, iterations=1)
+    benchmark.extra_info.update(megabytes={k: round(len(t) / 1e6, 2) for k, (t, _f) in texts.items()}, **results)
+
+    for name in texts:
+        assert results[f"{name}_token"]["mb_per_s"] > results[f"{name}_recursive"]["mb_per_s"]
+        assert results[f"{name}_token"]["max_tokens"] <= 256
@@ -0,0 +1,124 @@
+# tests/test_context_budget.py
+import time
+import random
+
+import pytest
+from langchain.schema import Document
+
+from app.chunking import RecursiveChunker, estimate_tokens
+from app.context_budget import ContextBudget, create_context_budget, drop_near_duplicates, merge_overlapping
+from app.lexical_index import LexicalIndex
+from app.retrieval import HybridRetriever
+
+WORDS = ("pump valve pressure sensor seal bolt torque motor housing inlet outlet flow rate filter bearing "
+         "gasket switch interval service check replace tighten clean inspect").split()
+
+
+def chunk(text, start, end, document_id=1, **metadata):
+    return Document(page_content=text[start:end], id=f"doc{document_id}-{start}",
+                    metadata={"document_id": document_id, "filename": f"f{document_id}.txt",
+                              "start_index": start, **metadata})
+
+
+def test_overlapping_chunks_of_a_document_are_merged_at_their_best_rank():
+    text = "".join(f"Sentence number {i} about the pump. " for i in range(40))
+    a, b, c = chunk(text, 0, 300), chunk(text, 200, 500), chunk(text, 501, 700)
+    other = chunk(text, 100, 400, document_id=2)
+    # Same offsets on another page of the document are a different element
+    page = chunk(text, 250, 450, page_number=2)
+    merged = merge_overlapping([b, other, page, a, c])
+    assert [d.page_content for d in merged] == [text[0:500] + "\n" + text[501:700], other.page_content,
+                                                page.page_content]
+    assert merged[0].metadata["start_index"] == 0 and merged[0].id == a.id
+
+    # Chunks that are not verbatim slices, or lack offsets, are kept as they are
+    altered = Document(page_content="changed " + text[220:400], metadata=dict(b.metadata, start_index=220))
+    plain = Document(page_content=text[:100], metadata={"document_id": 1})
+    assert merge_overlapping([a, altered, plain]) == [a, altered, plain]
+
+    boilerplate = "Copyright 2024 Example Inc. All rights reserved. Contact support for help."
+    docs = [Document(page_content="The pump seal must be checked monthly. " + boilerplate),
+            Document(page_content=boilerplate), Document(page_content="Replace the gasket yearly.")]
+    assert drop_near_duplicates(docs) == [docs[0], docs[2]]
+
+
+def test_passages_fill_the_budget_in_ranked_order():
+    rng = random.Random(1)
+    docs = [Document(page_content=" ".join(rng.choice(WORDS) for _ in range(n)), metadata={"n": n})
+            for n in (60, 90, 20, 30, 300)]
+    budget = ContextBudget(max_tokens=200)
+    kept = budget.assemble(docs)
+    # 90 words do not fit after the first 60, but the shorter passages further down do
+    assert [d.metadata["n"] for d in kept] == [60, 20, 30]
+    tokens = sum(estimate_tokens(d.page_content) for d in kept) + 2
+    assert budget.stats == {"chunks": 5, "merged": 0, "duplicates": 0, "over_budget": 2, "passages": 3,
+                            "tokens": tokens} and tokens <= 200
+
+    # A passage that alone is over budget is cut to fit at a word boundary
+    kept = budget.assemble(docs[4:])
+    assert estimate_tokens(kept[0].page_content) <= 200 and docs[4].page_content.startswith(kept[0].page_content)
+    assert kept[0].page_content[-1] != " " and budget.stats["passages"] == 1
+
+    assert ContextBudget(max_tokens=0).assemble(docs) == docs
+    config = {"CONTEXT_MAX_TOKENS": 500, "CONTEXT_DUPLICATE_THRESHOLD": 0.5, "CONTEXT_TOKENIZER": "cl100k_base"}
+    budget = create_context_budget(config)
+    assert (budget.max_tokens, budget.duplicate_threshold) == (500, 0.5)
+    assert budget.tokenizer in ("estimate", "cl100k_base")
+
+
+# A manual whose sections each cover one part; a section is longer than a chunk, so a question about
+# a part matches several overlapping chunks of the same section
+def manual(parts, seed):
+    rng = random.Random(seed)
+    sections = []
+    for part in parts:
+        sentences = [f"The {part} {' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 16)))}."
+                     for _ in range(rng.randint(20, 30))]
+        sections.append(f"{part.upper()} MAINTENANCE\n\n" + " ".join(sentences))
+    return "\n\n".join(sections)
+
+
+# Prompt tokens for the "stuff" context of 6 chunks (1000 characters, 200 overlap) per question, as retrieved
+# vs after the budgeter, with every retrieved sentence still in the context (or in its near-duplicate from
+# the other edition)
+@pytest.mark.benchmark(group="context")
+def test_budgeter_cuts_prompt_tokens_without_losing_retrieved_text(benchmark, tmp_path):
+    lexical = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    parts = [f"{a}{b}" for a in ("hydro", "servo", "turbo", "micro") for b in ("pump", "valve", "relay", "fan")]
+    texts = {doc_id: manual(parts[doc_id::4], seed=doc_id) for doc_id in range(4)}
+    # A revised edition of the first manual is uploaded alongside it, with one sentence per section changed
+    texts[4] = texts[0].replace(" service", " scheduled service", len(parts) // 4)
+    ids, chunks, metadatas = [], [], []
+    for doc_id, text in texts.items():
+        for start, end in RecursiveChunker(1000, 200).spans(text):
+            ids.append(f"doc{doc_id}-{start}")
+            chunks.append(text[start:end])
+            metadatas.append({"document_id": doc_id, "filename": f"manual{doc_id}.pdf", "start_index": start})
+    lexical.add(ids, chunks, metadatas)
+    plain = HybridRetriever(lexical=lexical, mode="lexical", k=6)
+    budgeted = HybridRetriever(lexical=lexical, mode="lexical", k=6,
+                               context_budget=create_context_budget({"CONTEXT_MAX_TOKENS": 0}))
+    queries = [f"how do I {rng_word} the {part}" for part, rng_word in zip(parts, WORDS * 2)]
+
+    def measure(retriever):
+        tokens = 0
+        start = time.perf_counter()
+        for query in queries:
+            docs = retriever.invoke(query)
+            tokens += estimate_tokens("\n\n".join(d.page_content for d in docs))
+        return {"prompt_tokens": tokens // len(queries),
+                "query_ms": round(1000 * (time.perf_counter() - start) / len(queries), 3)}
+
+    before = measure(plain)
+    after = benchmark.pedantic(measure, args=(budgeted,), rounds=1, iterations=1)
+    benchmark.extra_info.update(retrieved=before, budgeted=after)
+
+    def edition(text):
+        return text.replace(" scheduled service", " service")
+
+    for query in queries:
+        context = edition("\n\n".join(d.page_content for d in budgeted.invoke(query)))
+        for doc in plain.invoke(query):
+            assert all(sentence in context for sentence in edition(doc.page_content).split(". "))
+    assert after["prompt_tokens"] < 0.9 * before["prompt_tokens"]
+    assert set(budgeted.timings) == {"lexical", "context"} and budgeted.context["chunks"] == 6
@@ -0,0 +1,186 @@
+# tests/test_crawler.py
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app import create_crawl_command
+from app.crawler import Crawler, extract_text, page_filename
+from app.models import User, UploadedDocument, CrawledPage, db
+from app.utils import get_user_lexical_index
+
+
+def html(body, links=()):
+    anchors = "".join(f'<a href="{href}">link</a>' for href in links)
+    return (f"<html><head><script>var tracking = 1;</script></head><body><nav>Menu</nav>"
+            f"<main><h1>Page</h1><p>{body}</p>{anchors}</main></body></html>")
+
+
+# Small site with robots.txt, a sitemap and ETags. Every response is delayed a little so concurrent
+# requests overlap, and the most requests in flight at once is recorded.
+class Site:
+    def __init__(self):
+        self.pages = {
+            "/": html("Welcome to the handbook.", ["/a", "/b#top", "/private/secret", "http://elsewhere.invalid/"]),
+            "/a": html("Alpha covers the ZX-42 widget.", ["/c", "/"]),
+            "/b": html("Bravo describes onboarding.", ["/"]),
+            "/c": html("Charlie lists the release notes."),
+            "/private/secret": html("Never index this."),
+        }
+        self.robots = "User-agent: *\nDisallow: /private/\n"
+        # path -> Location
+        self.redirects = {}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def sitemap(self, base):
+        locs = "".join(f"<url><loc>{base}{path}</loc></url>" for path in ("/a", "/b"))
+        return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{locs}</urlset>'
+
+
+@pytest.fixture
+def site():
+    site = Site()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with site.lock:
+                site.in_flight += 1
+                site.max_in_flight = max(site.max_in_flight, site.in_flight)
+            try:
+                time.sleep(0.05)
+                self.respond()
+            finally:
+                with site.lock:
+                    site.in_flight -= 1
+
+        def respond(self):
+            base = f"http://{self.headers['Host']}"
+            if self.path == "/robots.txt":
+                return self.send(200, site.robots, "text/plain")
+            if self.path == "/sitemap.xml":
+                return self.send(200, site.sitemap(base), "application/xml")
+            if self.path in site.redirects:
+                site.requests.append((self.path, 302))
+                self.send_response(302)
+                self.send_header("Location", site.redirects[self.path])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = site.pages.get(self.path)
+            if body is None:
+                return self.send(404, "missing", "text/plain")
+            etag = '"%s"' % hashlib.md5(body.encode()).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                site.requests.append((self.path, 304))
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            site.requests.append((self.path, 200))
+            self.send(200, body, "text/html; charset=utf-8", etag)
+
+        def send(self, status, body, content_type, etag=None):
+            data = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+# The shared workspace (see conftest.py), parsing crawled pages inline
+@pytest.fixture
+def workspace(workspace, app, monkeypatch):
+    app.config["BULK_PARSE_WORKERS"] = 0
+    # Without Unstructured installed, crawled .txt files are read directly
+    monkeypatch.setattr("app.ingestion._parse_file", lambda path: [(open(path, encoding="utf-8").read(), {})])
+    return workspace
+
+
+def test_extract_text_keeps_content_and_drops_chrome():
+    text = extract_text(html("Body text.", ["/x"]))
+    assert "Body text." in text and "Page" in text
+    assert "tracking" not in text and "Menu" not in text
+
+
+def test_recrawl_fetches_conditionally_and_reindexes_only_changed_pages(client, app, workspace, site):
+    client.post("/register", data={"username": "crawler", "email": "crawler@example.com", "password": "crawlpass"})
+    client.post("/login", data={"username": "crawler", "password": "crawlpass"})
+    user = User.query.filter_by(username="crawler").first()
+    app.config.update(CRAWL_CONCURRENCY=8, CRAWL_PER_HOST=2)
+
+    response = client.post("/scrape", data={"url": site.url + "/", "crawl": "1"},
+                           headers={"Accept": "application/json"})
+    counts = response.get_json()
+    assert counts["changed"] == 4 and counts["indexed"] == 4, counts
+    assert counts["blocked"] == 1
+    # robots.txt was honoured, other hosts were not followed and the pool never exceeded the per-host limit
+    assert "/private/secret" not in dict(site.requests)
+    assert 1 < site.max_in_flight <= 2
+    docs = {d.filename: d for d in UploadedDocument.query.filter_by(user_id=user.id)}
+    assert set(docs) == {page_filename(site.url + path) for path in ("/", "/a", "/b", "/c")}
+    hits = get_user_lexical_index(user.id).search("ZX-42", 1)
+    assert hits[0][2]["filename"] == page_filename(site.url + "/a")
+
+    site.pages["/b"] = html("Bravo now describes offboarding.", ["/"])
+    site.requests.clear()
+    indexed_before = {name: doc.indexed_at for name, doc in docs.items()}
+    page = client.post("/scrape", data={"url": site.url + "/", "crawl": "1"}, follow_redirects=True)
+    assert b"Crawl finished: 1 new or changed, 3 unchanged" in page.data
+    assert sorted(site.requests) == [("/", 304), ("/a", 304), ("/b", 200), ("/c", 304)]
+
+    db.session.expire_all()
+    docs = {d.filename: d for d in UploadedDocument.query.filter_by(user_id=user.id)}
+    assert len(docs) == 4
+    changed = page_filename(site.url + "/b")
+    assert [name for name, doc in docs.items() if doc.indexed_at != indexed_before[name]] == [changed]
+    assert get_user_lexical_index(user.id).search("offboarding", 1)[0][2]["filename"] == changed
+    assert CrawledPage.query.filter_by(user_id=user.id, url=site.url + "/b").one().document_id == docs[changed].id
+
+
+def test_cli_crawls_from_a_sitemap(app, workspace, site):
+    user = User(username="mapper", email="mapper@example.com", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+    create_crawl_command(app)
+    result = app.test_cli_runner().invoke(
+        args=["crawl", "--user-id", str(user.id), "--depth", "0", site.url + "/sitemap.xml"])
+    assert "2 changed" in result.output and "2 indexed" in result.output, result.output
+    assert sorted(path for path, _status in site.requests) == ["/a", "/b"]
+    assert {p.url for p in CrawledPage.query.filter_by(user_id=user.id)} == {site.url + "/a", site.url + "/b"}
+
+
+def test_crawl_follows_redirects_only_on_site_and_skips_oversized_pages(site):
+    port = site.url.rsplit(":", 1)[1]
+    site.pages["/"] = html("Home.", ["/moved", "/away", "/big"])
+    site.pages["/big"] = html("filler " * 2000)
+    site.redirects["/moved"] = "/c"
+    # Same server under another host name: following it would leave the site
+    site.redirects["/away"] = f"http://localhost:{port}/b"
+    results = {r.url: r for r in Crawler(max_depth=1, max_page_bytes=4000).run(site.url + "/")}
+
+    assert results[site.url + "/c"].status == "changed"
+    assert results[site.url + "/away"].status == "skipped"
+    assert results[site.url + "/big"].status == "skipped" and "4000 bytes" in results[site.url + "/big"].error
+    assert ("/b", 200) not in site.requests
@@ -50,3 +50,125 @@ def test_scrape_document(client, app, monkeypatch):
         response = client.post("/scrape", data={"url": "https://example.com"}, follow_redirects=True)
         # Verify that the resulting page is the dashboard.
         assert b"Dashboard" in response.data
+
+def test_index_document_is_incremental(app, tmp_path, monkeypatch):
+    from langchain.schema import Document
+    from langchain_chroma import Chroma
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from chromadb.config import Settings
+    from app.models import User
+    from app.utils import index_document, get_user_vectorstore, get_user_lexical_index, vectorstore_pool
+
+    # Keep the per-user Chroma directory inside the test's temporary folder
+    monkeypatch.chdir(tmp_path)
+    vectorstore_pool().clear()
+    user = User(username="indexuser", email="index@example.com", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+    path = tmp_path / "notes.txt"
+    path.write_text("first version")
+    doc = UploadedDocument(filename="notes.txt", file_type="txt", user_id=user.id)
+    db.session.add(doc)
+    db.session.commit()
+
+    emb = DeterministicFakeEmbedding(size=8)
+    chunks = [Document(page_content="alpha"), Document(page_content="beta")]
+    assert index_document(doc, str(path), chunks, emb, Chroma, Settings) is True
+    # Same content again: nothing is embedded and no duplicates are added
+    assert index_document(doc, str(path), chunks, emb, Chroma, Settings) is False
+    vs = get_user_vectorstore(user.id, emb, Chroma, Settings)
+    assert vs._collection.count() == 2
+    assert get_user_lexical_index(user.id).count() == 2
+
+    # Changed content replaces the document's previous vectors
+    path.write_text("second version")
+    assert index_document(doc, str(path), [Document(page_content="gamma")], emb, Chroma, Settings) is True
+    assert vs._collection.count() == 1
+    assert [r[1] for r in get_user_lexical_index(user.id).search("gamma alpha")] == ["gamma"]
+    assert vs._collection.get()["metadatas"][0]["document_id"] == doc.id
+    db.session.commit()
+
+def test_upload_returns_job_with_stage_progress(client, app, monkeypatch):
+    # Replace the parsing/embedding work with a fake that reports progress through every stage
+    def fake_index(doc, path, progress=None):
+        for stage, total in (("load", 1), ("split", 1), ("embed", 4), ("store", 4)):
+            progress(stage, total, total)
+        return True
+    monkeypatch.setattr("app.ingestion.index_uploaded_document", fake_index)
+
+    with client:
+        register(client, "jobuser", "job@example.com", "jobpass")
+        login(client, "jobuser", "jobpass")
+        response = client.post(
+            "/upload",
+            data={"document": (io.BytesIO(b"Queued content."), "queued.txt")},
+            content_type="multipart/form-data",
+            headers={"Accept": "application/json"},
+        )
+        assert response.status_code == 202
+        job = response.get_json()
+
+        status = client.get(f"/jobs/{job['id']}").get_json()
+        assert status["status"] == "succeeded"
+        assert status["filename"] == "queued.txt"
+        assert status["progress"] == 1.0
+        assert status["stages"]["embed"] == {"done": 4, "total": 4}
+        assert client.get("/jobs?active=1").get_json()["jobs"] == []
+
+        # Jobs are private to their owner
+        client.get("/logout")
+        register(client, "otheruser", "other@example.com", "otherpass")
+        login(client, "otheruser", "otherpass")
+        assert client.get(f"/jobs/{job['id']}").status_code == 404
+
+def test_only_jobs_whose_owner_is_gone_are_requeued(app):
+    import datetime
+    import os
+    import socket
+    import subprocess
+    import sys
+    from app.ingestion import heartbeat_jobs, recover_interrupted_jobs, worker_id
+    from app.models import IngestionJob, User
+
+    # A pid that has certainly exited
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    host, pid = socket.gethostname(), os.getpid()
+    now = datetime.datetime.utcnow()
+    old = now - datetime.timedelta(seconds=app.config["INGESTION_STALE_SECONDS"] + 60)
+    with app.app_context():
+        user = User(username="owner", email="owner@example.com", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        owners = {
+            "mine": (worker_id(), now, now),
+            "dead_pid": (f"{host}:{finished.pid}:aaaa", now, now),
+            "restarted": (f"{host}:{pid}:bbbb", now, now),
+            "other_host_fresh": ("elsewhere:1:cccc", old, now),
+            "other_host_silent": ("elsewhere:1:dddd", old, old),
+            "legacy_long_running": (None, old, None),
+            "legacy_recent": (None, now, None),
+        }
+        jobs = {}
+        for name, (owner, started, beat) in owners.items():
+            jobs[name] = IngestionJob(user_id=user.id, source_url=name, status="running", started_at=started,
+                                      worker_id=owner, heartbeat_at=beat)
+            db.session.add(jobs[name])
+        db.session.commit()
+
+        requeued = recover_interrupted_jobs(app)
+        assert sorted(requeued) == sorted(jobs[n].id for n in
+                                          ("dead_pid", "restarted", "other_host_silent", "legacy_long_running"))
+        # A second sweep finds nothing left to take
+        assert recover_interrupted_jobs(app) == []
+
+        statuses = {j.source_url: (j.status, j.worker_id) for j in IngestionJob.query}
+        assert statuses["mine"] == ("running", worker_id())
+        assert statuses["dead_pid"] == ("queued", None)
+        assert statuses["other_host_fresh"][0] == "running"
+        assert statuses["legacy_recent"][0] == "running"
+
+        db.session.query(IngestionJob).filter_by(source_url="mine").update({"heartbeat_at": old})
+        db.session.commit()
+        assert heartbeat_jobs() == 1
+        assert IngestionJob.query.filter_by(source_url="mine").one().heartbeat_at > old
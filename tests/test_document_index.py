@@ -0,0 +1,86 @@
+# tests/test_document_index.py
+import pytest
+from langchain.schema import Document
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from chromadb.config import Settings
+
+from app import create_compact_command
+from app.models import User, UploadedDocument, Folder, db
+from app.utils import index_document, get_user_vectorstore, get_user_lexical_index, vectorstore_pool
+
+EMBEDDINGS = DeterministicFakeEmbedding(size=8)
+
+
+@pytest.fixture
+def indexed_user(client, app, tmp_path, monkeypatch):
+    # uploads/ and chroma_db/ live in the test's temporary folder
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("app.document_index.get_embeddings", lambda config: EMBEDDINGS)
+    vectorstore_pool().clear()
+    client.post("/register", data={"username": "keeper", "email": "keeper@example.com", "password": "keeperpw"})
+    client.post("/login", data={"username": "keeper", "password": "keeperpw"})
+    user = User.query.filter_by(username="keeper").first()
+    user_dir = tmp_path / "uploads" / str(user.id)
+    user_dir.mkdir(parents=True)
+    docs = []
+    for i in range(3):
+        path = user_dir / f"doc{i}.txt"
+        path.write_text(f"document {i}")
+        doc = UploadedDocument(filename=path.name, file_type="txt", user_id=user.id)
+        db.session.add(doc)
+        db.session.flush()
+        chunks = [Document(page_content=f"doc{i} chunk {j} about topic{i}") for j in range(40)]
+        index_document(doc, str(path), chunks, EMBEDDINGS, Chroma, Settings)
+        docs.append(doc)
+    db.session.commit()
+    return user, docs
+
+
+def stored(user_id, document_id):
+    vs = get_user_vectorstore(user_id, EMBEDDINGS, Chroma, Settings)
+    return vs._collection.get(where={"document_id": document_id}, include=["metadatas", "embeddings"])
+
+
+def test_rename_and_move_update_chunk_metadata_in_place(client, indexed_user):
+    user, docs = indexed_user
+    before = stored(user.id, docs[0].id)
+    client.post(f"/rename_document/{docs[0].id}", data={"new_name": "renamed.txt"})
+    folder = Folder(name="Archive", user_id=user.id)
+    db.session.add(folder)
+    db.session.commit()
+    client.post(f"/update_folder/{docs[0].id}", data={"folder_id": str(folder.id)})
+
+    after = stored(user.id, docs[0].id)
+    assert {(md["filename"], md["folder_id"]) for md in after["metadatas"]} == {("renamed.txt", folder.id)}
+    # Nothing was re-embedded
+    assert after["ids"] == before["ids"] and (after["embeddings"] == before["embeddings"]).all()
+    hits = get_user_lexical_index(user.id).search("topic0", 3)
+    assert {hit[2]["filename"] for hit in hits} == {"renamed.txt"}
+
+    # Deleting the folder moves its documents back to "no folder"
+    client.post(f"/delete_folder/{folder.id}")
+    assert {md["folder_id"] for md in stored(user.id, docs[0].id)["metadatas"]} == {0}
+
+
+def test_delete_removes_vectors_and_compaction_purges_orphans(client, app, indexed_user):
+    user, docs = indexed_user
+    client.post(f"/delete_document/{docs[0].id}")
+    assert stored(user.id, docs[0].id)["ids"] == []
+    assert get_user_lexical_index(user.id).search("topic0", 3) == []
+
+    # Rows deleted behind the app's back (as before these hooks existed) leave orphans behind
+    db.session.delete(docs[1])
+    db.session.commit()
+    create_compact_command(app)
+    result = app.test_cli_runner().invoke(args=["compact-vectorstores", "--user-id", str(user.id)])
+    assert "40 chunks kept, 40 orphaned removed" in result.output, result.output
+    reclaimed = int(result.output.rsplit("Reclaimed ", 1)[1].split()[0])
+    assert reclaimed > 0
+
+    vs = get_user_vectorstore(user.id, EMBEDDINGS, Chroma, Settings)
+    assert vs._collection.count() == 40
+    assert {md["document_id"] for md in vs._collection.get()["metadatas"]} == {docs[2].id}
+    assert vs.similarity_search("doc2 chunk", k=1)[0].metadata["document_id"] == docs[2].id
+    assert get_user_lexical_index(user.id).search("topic1", 3) == []
+    assert get_user_lexical_index(user.id).count() == 40
@@ -0,0 +1,64 @@
+# tests/test_embedding_cache.py
+from langchain_core.embeddings import Embeddings
+
+from app.embedding_cache import EmbeddingCache, CachedEmbeddings, text_digest
+
+# Local fake embedding model that records every text it is asked to embed
+class CountingEmbeddings(Embeddings):
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.extend(texts)
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_repeated_chunks_are_embedded_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    fake = CountingEmbeddings()
+    emb = CachedEmbeddings(fake, cache)
+
+    first = emb.embed_documents(["alpha", "beta", "alpha"])
+    second = emb.embed_documents(["beta", "gamma"])
+
+    # Duplicates within and across calls only reach the model once
+    assert fake.calls == ["alpha", "beta", "gamma"]
+    assert first[0] == first[2]
+    assert second[0] == first[1]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 4
+    assert stats["entries"] == 3
+
+
+def test_cache_persists_on_disk_and_is_scoped_by_model(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    fake = CountingEmbeddings()
+    CachedEmbeddings(fake, EmbeddingCache(path)).embed_documents(["shared public text"])
+
+    # A new process (new cache object) reuses the stored vector
+    reopened = CachedEmbeddings(fake, EmbeddingCache(path))
+    reopened.embed_documents(["shared public text"])
+    assert fake.calls == ["shared public text"]
+
+    # The same text under a different model name is a separate entry
+    CachedEmbeddings(fake, EmbeddingCache(path), model_name="other-model").embed_documents(["shared public text"])
+    assert len(fake.calls) == 2
+
+
+def test_lru_eviction_keeps_cache_within_size_bound(tmp_path):
+    # Each 3-float vector is 12 bytes; allow roughly four entries
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_bytes=50)
+    emb = CachedEmbeddings(CountingEmbeddings(), cache)
+    for i in range(10):
+        emb.embed_documents([f"chunk {i}"])
+        emb.embed_query("chunk 0")  # keep the first chunk recently used
+
+    stats = cache.stats()
+    assert stats["bytes"] <= 50
+    assert stats["evictions"] > 0
+    assert cache.get_many("fake-model", [text_digest("chunk 0")])
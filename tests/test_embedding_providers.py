@@ -0,0 +1,71 @@
+# tests/test_embedding_providers.py
+import io
+import time
+import random
+
+import numpy as np
+import pytest
+
+from app.embedding_providers import HashingEmbeddings, create_embeddings
+from app.models import UploadedDocument
+from app.utils import get_embeddings, vectorstore_pool
+
+
+def test_local_provider_is_deterministic_and_normalised(app):
+    app.config["EMBEDDING_PROVIDER"] = "local"
+    app.config["LOCAL_EMBEDDING_DIM"] = 256
+    embeddings = get_embeddings(app.config)
+    # Cheaper to compute than to look up, so it is not wrapped in the embedding cache
+    assert isinstance(embeddings, HashingEmbeddings) and embeddings.model_name == "local-hashing-256"
+
+    texts = ["The pump is overheating again.", "Pump overheating was reported.", "Quarterly revenue grew."]
+    vectors = np.array(embeddings.embed_documents(texts))
+    assert vectors.shape == (3, 256)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert np.allclose(HashingEmbeddings(256).embed_query(texts[0]), vectors[0])
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+    assert embeddings.embed_documents([]) == [] and not any(embeddings.embed_query(""))
+
+    app.config["EMBEDDING_PROVIDER"] = "nope"
+    with pytest.raises(ValueError, match="openai"):
+        create_embeddings(app.config)
+
+
+def test_ingestion_and_retrieval_run_offline(client, app, tmp_path, monkeypatch):
+    from app.queries.routes import build_retriever
+    monkeypatch.chdir(tmp_path)
+    vectorstore_pool().clear()
+    # Any call to the OpenAI API would fail against this address
+    app.config.update(EMBEDDING_PROVIDER="local", OPENAI_BASE_URL="http://127.0.0.1:9", RETRIEVAL_MODE="vector")
+    monkeypatch.setattr("app.ingestion._parse_file", lambda path: [(open(path, encoding="utf-8").read(), {})])
+
+    client.post("/register", data={"username": "offline", "email": "offline@example.com", "password": "offlinepw"})
+    client.post("/login", data={"username": "offline", "password": "offlinepw"})
+    for name, text in (("pumps.txt", "Centrifugal pumps need their bearings greased monthly."),
+                       ("finance.txt", "Quarterly revenue and operating margin both improved.")):
+        response = client.post("/upload", data={"document": (io.BytesIO(text.encode()), name)},
+                               content_type="multipart/form-data", headers={"Accept": "application/json"})
+        assert response.get_json()["status"] == "succeeded", response.get_json()
+
+    user_id = UploadedDocument.query.filter_by(filename="pumps.txt").one().user_id
+    docs = build_retriever(user_id).invoke("how often should pump bearings be greased")
+    assert docs[0].metadata["filename"] == "pumps.txt"
+    # Local vectors are recomputed rather than stored in the embedding cache
+    from app.embedding_cache import get_embedding_cache
+    assert get_embedding_cache(app.config["EMBEDDING_CACHE_PATH"]).stats()["entries"] == 0
+
+
+@pytest.mark.benchmark(group="embeddings")
+def test_local_embedding_throughput(benchmark):
+    rng = random.Random(5)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    # ~1000-character chunks, the size ingestion produces
+    chunks = [" ".join(rng.choice(vocabulary) for _ in range(140)) for _ in range(2000)]
+    embeddings = HashingEmbeddings()
+
+    start = time.perf_counter()
+    vectors = benchmark.pedantic(embeddings.embed_documents, args=(chunks,), rounds=1, iterations=1)
+    elapsed = time.perf_counter() - start
+    benchmark.extra_info.update(chunks=len(chunks), chunks_per_second=round(len(chunks) / elapsed))
+    assert len(vectors) == len(chunks) and len(vectors[0]) == embeddings.dim
+    assert len(chunks) / elapsed > 500
@@ -0,0 +1,144 @@
+# tests/test_embedding_scheduler.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.embedding_scheduler import EmbeddingScheduler, token_batches, rate_limit_delay
+
+
+def test_token_batches_respect_budget_and_item_cap():
+    texts = ["x" * 300] * 10  # ~100 tokens each
+    batches = token_batches(texts, max_tokens=250, max_items=5)
+    assert batches == [(0, 2), (2, 4), (4, 6), (6, 8), (8, 10)]
+    assert token_batches(["x" * 3000], max_tokens=10) == [(0, 1)]
+    assert token_batches(["a"] * 7, max_tokens=10_000, max_items=3) == [(0, 3), (3, 6), (6, 7)]
+
+
+# Local fake of the OpenAI embeddings API that adds latency and throttles bursts with 429s
+class FakeEmbeddingsServer:
+    def __init__(self, latency=0.05, max_in_flight=None, retry_after="0.05"):
+        self.latency = latency
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests += 1
+                    busy = server.max_in_flight is not None and server.in_flight >= server.max_in_flight
+                    if busy:
+                        server.throttled += 1
+                    else:
+                        server.in_flight += 1
+                if busy:
+                    payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}).encode()
+                    self.send_response(429)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("retry-after", server.retry_after)
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+                try:
+                    time.sleep(server.latency)
+                    data = [{"object": "embedding", "index": i, "embedding": [float(len(t)), float(i), 1.0]}
+                            for i, t in enumerate(body["input"])]
+                    payload = json.dumps({"object": "list", "data": data, "model": body["model"],
+                                          "usage": {"prompt_tokens": 0, "total_tokens": 0}}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    # Real OpenAI client pointed at the fake server; its own retries are off so 429s reach the scheduler
+    def client(self):
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model="text-embedding-ada-002", openai_api_key="sk-test", base_url=self.url,
+                                check_embedding_ctx_length=False, max_retries=0)
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+    def make(**kwargs):
+        servers.append(FakeEmbeddingsServer(**kwargs))
+        return servers[-1]
+    yield make
+    for s in servers:
+        s.close()
+
+
+def test_batches_are_streamed_in_order(fake_server):
+    server = fake_server(latency=0.01)
+    texts = [f"chunk {i} " + "x" * (i % 7) for i in range(40)]
+    scheduler = EmbeddingScheduler(server.client(), max_concurrency=4, max_batch_size=5)
+
+    starts = [start for start, _vectors in scheduler.iter_batches(texts)]
+    assert starts == list(range(0, 40, 5))
+    vectors = scheduler.embed_documents(texts)
+    assert [v[0] for v in vectors] == [float(len(t)) for t in texts]
+
+
+def test_rate_limit_responses_are_retried_and_reduce_concurrency(fake_server):
+    server = fake_server(latency=0.03, max_in_flight=2, retry_after="0.02")
+    texts = [f"text {i}" for i in range(48)]
+    scheduler = EmbeddingScheduler(server.client(), max_concurrency=6, max_batch_size=4, base_delay=0.01)
+
+    vectors = scheduler.embed_documents(texts)
+    assert [v[0] for v in vectors] == [float(len(t)) for t in texts]
+    assert server.throttled > 0
+    assert scheduler.throttled == server.throttled
+
+
+def test_rate_limit_delay_reads_headers():
+    class Response:
+        status_code = 429
+        headers = {"x-ratelimit-reset-tokens": "1m30s"}
+    class RateLimited(Exception):
+        response = Response()
+    assert rate_limit_delay(RateLimited()) == 90.0
+    assert rate_limit_delay(ValueError("boom")) is None
+
+
+# Wall-clock ingestion of a large document should scale with allowed concurrency, not document size
+@pytest.mark.benchmark(group="embedding_scheduler")
+def test_concurrent_embedding_benchmark(benchmark, fake_server):
+    server = fake_server(latency=0.05, max_in_flight=8, retry_after="0.05")
+    texts = [f"page {i} " + "lorem ipsum " * 50 for i in range(160)]
+
+    start = time.perf_counter()
+    EmbeddingScheduler(server.client(), max_concurrency=1, max_batch_size=8).embed_documents(texts)
+    sequential = time.perf_counter() - start
+
+    scheduler = EmbeddingScheduler(server.client(), max_concurrency=8, max_batch_size=8, base_delay=0.01)
+    vectors = benchmark.pedantic(scheduler.embed_documents, args=(texts,), rounds=1, iterations=1)
+    start = time.perf_counter()
+    scheduler.embed_documents(texts)
+    concurrent = time.perf_counter() - start
+
+    assert len(vectors) == len(texts)
+    # 20 batches at 50ms each: ~1s sequentially, a fraction of that with 8 in flight
+    assert concurrent < sequential / 2
@@ -0,0 +1,67 @@
+# tests/test_pagination.py
+import datetime
+
+from sqlalchemy import text
+
+from app.models import User, QueryHistory, UploadedDocument, db
+
+
+def login_user_with_history(client, questions=120, documents=70):
+    client.post("/register", data={"username": "pager", "email": "pager@example.com", "password": "pagerpass"})
+    client.post("/login", data={"username": "pager", "password": "pagerpass"})
+    user = User.query.filter_by(username="pager").first()
+    base = datetime.datetime(2025, 1, 1)
+    # Several rows share a timestamp so the id tie-breaker is exercised
+    db.session.add_all(QueryHistory(question=f"question {i}", answer=f"answer {i}", user_id=user.id,
+                                    timestamp=base + datetime.timedelta(minutes=i // 3))
+                       for i in range(questions))
+    db.session.add_all(UploadedDocument(filename=f"file{i}.txt", file_type="txt", user_id=user.id,
+                                        upload_date=base + datetime.timedelta(hours=i // 2))
+                       for i in range(documents))
+    db.session.commit()
+    return user
+
+
+def collect(client, url):
+    seen, cursor, pages = [], None, 0
+    while True:
+        data = client.get(url, query_string={"cursor": cursor} if cursor else {}).get_json()
+        seen.extend(item["id"] for item in data["items"])
+        pages += 1
+        cursor = data["next_cursor"]
+        if cursor is None:
+            return seen, pages
+
+
+def test_dashboard_renders_first_page_and_endpoints_page_through_the_rest(client, app):
+    app.config["DASHBOARD_PAGE_SIZE"] = 25
+    with client:
+        login_user_with_history(client)
+        page = client.get("/dashboard").data.decode()
+        assert page.count("<span class=\"font-medium\">Answer:</span>") == 25
+        assert "question 119" in page and "question 94" not in page
+        assert 'id="loadOlderQueries"' in page and 'id="loadMoreDocuments"' in page
+
+        ids, pages = collect(client, "/history")
+        assert pages == 5
+        expected = [q.id for q in QueryHistory.query.order_by(QueryHistory.timestamp.desc(), QueryHistory.id.desc())]
+        assert ids == expected
+
+        ids, pages = collect(client, "/documents")
+        assert pages == 3 and len(ids) == len(set(ids)) == 70
+        item = client.get("/documents", query_string={"limit": 1}).get_json()["items"][0]
+        assert item["filename"] == "file69.txt" and "<tr>" in item["html"]
+
+
+def test_history_pages_seek_on_the_composite_index(client, app):
+    with client:
+        user = login_user_with_history(client, questions=10, documents=0)
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM query_history WHERE user_id = :uid "
+            "AND (timestamp, id) < ('2025-01-01 00:02:00.000000', 5) ORDER BY timestamp DESC, id DESC LIMIT 51"
+        ), {"uid": user.id}).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        assert "ix_query_history_user_timestamp" in details
+        assert "TEMP B-TREE" not in details
+        # A malformed cursor is treated as the first page rather than an error
+        assert client.get("/history", query_string={"cursor": "not-a-cursor"}).status_code == 200
@@ -0,0 +1,63 @@
+# tests/test_parse_cache.py
+from app.parse_cache import ParseCache
+
+
+def test_chunks_are_slices_of_cached_text_and_load_lazily(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    text = " ".join(f"sentence {i} about caching parsed documents." for i in range(60))
+    cache.put("ab" * 32, "loader-1", [(text, {"page_number": 1}), ("short tail", {"page_number": 2})])
+
+    parsed = cache.get("ab" * 32, "loader-1")
+    assert not parsed.loaded
+    chunks = parsed.chunks(chunk_size=200, chunk_overlap=40)
+    assert parsed.loaded
+    assert len(chunks) > 5
+    assert all(len(c.page_content) <= 200 for c in chunks)
+    assert chunks[-1].page_content == "short tail"
+    first = chunks[1]
+    start = first.metadata["start_index"]
+    assert text[start:start + len(first.page_content)] == first.page_content
+
+    # Boundaries were persisted: a fresh handle returns identical chunks
+    again = ParseCache(str(tmp_path)).get("ab" * 32, "loader-1").chunks(chunk_size=200, chunk_overlap=40)
+    assert [c.page_content for c in again] == [c.page_content for c in chunks]
+    # A different loader version is a different entry
+    assert cache.get("ab" * 32, "loader-2") is None
+
+
+def test_concurrent_chunker_settings_are_all_persisted(tmp_path):
+    import threading
+    cache = ParseCache(str(tmp_path))
+    cache.put("cd" * 32, "loader-1", [(" ".join(f"word{i}" for i in range(3000)), {})])
+    parsed = cache.get("cd" * 32, "loader-1")
+    sizes = range(100, 900, 50)
+    threads = [threading.Thread(target=parsed.chunks, args=(size, 10)) for size in sizes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Every setting's boundaries reached the file, none lost to a concurrent write
+    stored = ParseCache(str(tmp_path)).get("cd" * 32, "loader-1")._load()["chunks"]
+    assert set(stored) == {f"{size}:10" for size in sizes}
+
+
+def test_parser_runs_once_per_file_version(app, tmp_path, monkeypatch):
+    from app import ingestion
+    app.config["PARSE_CACHE_DIR"] = str(tmp_path / "parse_cache")
+    calls = []
+    def fake_parse(path):
+        calls.append(path)
+        with open(path, encoding="utf-8") as f:
+            return [(f.read(), {"source": "notes.txt"})]
+    monkeypatch.setattr("app.ingestion._parse_file", fake_parse)
+
+    path = tmp_path / "notes.txt"
+    path.write_text("version one " * 200)
+    first = ingestion.parsed_document(str(path)).chunks(ingestion.CHUNK_SIZE, ingestion.CHUNK_OVERLAP)
+    second = ingestion.parsed_document(str(path)).chunks(ingestion.CHUNK_SIZE, ingestion.CHUNK_OVERLAP)
+    assert len(calls) == 1
+    assert [c.page_content for c in first] == [c.page_content for c in second]
+
+    path.write_text("version two")
+    assert ingestion.parsed_document(str(path)).text == "version two"
+    assert len(calls) == 2
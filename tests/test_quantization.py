@@ -0,0 +1,168 @@
+# tests/test_quantization.py
+import os
+import time
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+from langchain_chroma import Chroma
+from chromadb.config import Settings
+
+from app import create_migrate_vectorstores_command
+from app.embedding_providers import HashingEmbeddings
+from app.models import User, UploadedDocument, db
+from app.quantization import ScalarQuantizer, ProductQuantizer, create_quantizer, save_quantizer, load_quantizer
+from app.utils import index_document, get_user_vectorstore, vectorstore_pool
+from app.vector_engine import MmapCollection
+
+
+# Unit vectors with the low intrinsic dimension of real text embeddings: clustered points in a small
+# latent space, projected up to dim dimensions with a little isotropic noise
+def embedding_like(n, dim, seed=0, latent=48, clusters=200):
+    rng = np.random.default_rng(seed)
+    basis = np.random.default_rng(99).normal(size=(latent, dim))
+    centres = np.random.default_rng(98).normal(size=(clusters, latent))
+    points = centres[rng.integers(clusters, size=n)] + 0.7 * rng.normal(size=(n, latent))
+    vectors = (points @ basis + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall_at(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def test_quantizers_approximate_inner_products_and_round_trip(tmp_path):
+    vectors = embedding_like(2000, 64)
+    query = vectors[7]
+    exact = vectors @ query
+    for quantizer, tolerance in ((ScalarQuantizer(64), 0.02), (ProductQuantizer(64, sub_dims=8), 0.15)):
+        quantizer.train(vectors)
+        codes = quantizer.encode(vectors)
+        assert codes.shape == (2000, quantizer.code_size) and codes.dtype == quantizer.code_dtype
+        approx = quantizer.scores(codes, quantizer.prepare(query))
+        assert np.abs(approx - exact).mean() < tolerance
+        assert np.argmax(approx) == 7
+
+        path = str(tmp_path / f"{quantizer.kind}.npz")
+        save_quantizer(quantizer, path)
+        loaded = load_quantizer(path, 64)
+        assert type(loaded) is type(quantizer)
+        assert (loaded.encode(vectors[:50]) == codes[:50]).all()
+
+    # 1536 dimensions at 16 per subvector: 96 bytes per vector instead of 6144
+    assert create_quantizer("pq", 1536).code_size == 96 and create_quantizer("none", 8) is None
+    with pytest.raises(ValueError, match="int8"):
+        create_quantizer("binary", 8)
+
+
+def test_collection_trains_codes_rescores_and_keeps_its_setting(tmp_path):
+    path = str(tmp_path / "store")
+    vectors = embedding_like(3000, 64, seed=1)
+    store = MmapCollection(path, quantization="pq", train_min=1000, pq_sub_dims=8)
+    store.upsert([str(i) for i in range(500)], vectors[:500], metadatas=[{"document_id": i % 5} for i in range(500)])
+    assert not store.stats()["quantized"]
+    store.upsert([str(i) for i in range(500, 3000)], vectors[500:],
+                 metadatas=[{"document_id": i % 5} for i in range(500, 3000)])
+    stats = store.stats()
+    assert stats["quantized"] and stats["code_bytes"] == 3000 * 8
+
+    queries = embedding_like(40, 64, seed=2)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :10].tolist()
+    found = [[int(hit[0]) for hit in store.search(q, k=10)] for q in queries]
+    assert recall_at(found, truth) >= 0.95
+    # Rescored distances are exact
+    hit = store.search(vectors[9], k=1)[0]
+    assert hit[0] == "9" and hit[3] == pytest.approx(0.0, abs=1e-5)
+    assert {md["document_id"] for _i, _t, md, _d in store.search(queries[0], k=5, where={"document_id": 3})} == {3}
+
+    store.delete(where={"document_id": 3})
+    assert store.compact() == (2400, 0)
+    assert store.search(vectors[9], k=1)[0][0] == "9"
+    store.close()
+
+    # The collection's own setting wins over the default it is opened with
+    reopened = MmapCollection(path, quantization="none", train_min=1000)
+    assert reopened.stats()["quantization"] == "pq" and reopened.search(vectors[9], k=1)[0][0] == "9"
+    reopened.set_quantization("int8")
+    assert reopened.stats()["code_bytes"] == 2400 * 64
+    assert reopened.search(vectors[9], k=1)[0][0] == "9"
+    reopened.set_quantization("none")
+    assert not reopened.stats()["quantized"] and not os.path.exists(os.path.join(path, "quantizer.npz"))
+    reopened.close()
+
+
+def test_migrate_chroma_store_without_reembedding(client, app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    vectorstore_pool().clear()
+    app.config.update(VECTOR_ENGINE="chroma", EMBEDDING_PROVIDER="local", VECTOR_QUANTIZATION_TRAIN_MIN=50)
+    embeddings = HashingEmbeddings(64)
+    client.post("/register", data={"username": "mover", "email": "mover@example.com", "password": "moverpw"})
+    user = User.query.filter_by(username="mover").first()
+    for i in range(3):
+        doc = UploadedDocument(filename=f"doc{i}.txt", file_type="txt", user_id=user.id)
+        db.session.add(doc)
+        db.session.flush()
+        chunks = [Document(page_content=f"doc{i} chunk {j} about topic{i}") for j in range(30)]
+        index_document(doc, __file__, chunks, embeddings, Chroma, Settings)
+    db.session.commit()
+    before = get_user_vectorstore(user.id, embeddings, Chroma, Settings).similarity_search("topic2 chunk 7", k=3)
+
+    create_migrate_vectorstores_command(app)
+    monkeypatch.setattr(HashingEmbeddings, "embed_documents", lambda self, texts: pytest.fail("re-embedded"))
+    result = app.test_cli_runner().invoke(
+        args=["migrate-vectorstores", "--user-id", str(user.id), "--quantization", "int8", "--remove-source"])
+    assert "90 chunks (90 copied from Chroma), quantization int8" in result.output, result.output
+    assert not os.path.exists(os.path.join("chroma_db", f"user_{user.id}_db"))
+
+    app.config["VECTOR_ENGINE"] = "mmap"
+    vs = get_user_vectorstore(user.id, embeddings, Chroma, Settings)
+    assert vs._collection.stats()["quantized"]
+    after = vs.similarity_search("topic2 chunk 7", k=3)
+    assert [d.page_content for d in after] == [d.page_content for d in before]
+    assert after[0].metadata == before[0].metadata
+
+    # Running it again only re-quantizes
+    result = app.test_cli_runner().invoke(args=["migrate-vectorstores", "--user-id", str(user.id),
+                                                "--quantization", "pq"])
+    assert "90 chunks (0 copied from Chroma), quantization pq" in result.output, result.output
+    vectorstore_pool().clear()
+
+
+@pytest.mark.benchmark(group="quantization")
+def test_quantization_recall_latency_and_size(benchmark, tmp_path):
+    n, dim, k = 20000, 384, 10
+    vectors = embedding_like(n, dim, seed=3)
+    ids = [str(i) for i in range(n)]
+    queries = embedding_like(100, dim, seed=4)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k].tolist()
+
+    def measure(name, **options):
+        store = MmapCollection(str(tmp_path / name), hnsw_threshold=n + 1, train_min=n, **options)
+        store.upsert(ids, vectors)
+        store.search(queries[0], k)
+        start = time.perf_counter()
+        found = [[int(hit[0]) for hit in store.search(q, k)] for q in queries]
+        elapsed = time.perf_counter() - start
+        stats = store.stats()
+        store.close()
+        return {"recall_at_10": round(recall_at(found, truth), 3),
+                "query_ms": round(1000 * elapsed / len(queries), 2),
+                # What each query scans: the codes when quantized, otherwise the vectors
+                "scanned_bytes_per_vector": (stats["code_bytes"] or stats["vector_bytes"]) // n,
+                "disk_bytes_per_vector": (stats["code_bytes"] + stats["vector_bytes"]) // n}
+
+    results = {
+        "float32": measure("float32"),
+        "int8": measure("int8", quantization="int8"),
+        "pq_rescored": measure("pq", quantization="pq"),
+        "pq_codes_only": measure("pq_only", quantization="pq", rescore_factor=0),
+    }
+    results["int8_float16"] = benchmark.pedantic(
+        measure, args=("int8_f16",), kwargs={"quantization": "int8", "dtype": "float16"}, rounds=1, iterations=1)
+    benchmark.extra_info.update(chunks=n, dim=dim, **results)
+
+    assert results["int8"]["recall_at_10"] >= 0.98 and results["pq_rescored"]["recall_at_10"] >= 0.9
+    assert results["int8"]["scanned_bytes_per_vector"] == dim
+    assert results["pq_rescored"]["scanned_bytes_per_vector"] == dim // 16
+    assert results["int8_float16"]["disk_bytes_per_vector"] == dim * 3
+    assert results["pq_rescored"]["recall_at_10"] > results["pq_codes_only"]["recall_at_10"]
@@ -0,0 +1,147 @@
+# tests/test_reranking.py
+import time
+import uuid
+import random
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from app.embedding_providers import HashingEmbeddings
+from app.lexical_index import LexicalIndex
+from app.reranking import MMRReranker, TermOverlapReranker, create_reranker, mmr_select, reranker_names
+from app.retrieval import HybridRetriever
+from app.vector_engine import MmapVectorStore
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self, dim=256):
+        super().__init__(dim)
+        self.queries = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+TOPICS = ["pump", "valve", "sensor", "motor", "filter", "bearing"]
+FACTS = ["check the seal for leaks", "tighten the mounting bolts", "replace the worn gasket",
+         "clean the intake screen", "recalibrate the pressure switch"]
+
+
+# Every fact is split into several overlapping chunks, as sliding-window chunking does, so a plain
+# similarity ranking fills the context with copies of the same passage
+def duplicated_corpus(copies=4, seed=5):
+    rng = random.Random(seed)
+    ids, texts, metadatas, facts = [], [], [], {}
+    for t, topic in enumerate(TOPICS):
+        for f, fact in enumerate(FACTS):
+            for c in range(copies):
+                chunk_id = f"doc{t}-{f}-{c}"
+                lead = " ".join(rng.choice(["step", "then", "next", "also"]) for _ in range(c))
+                texts.append(f"{lead} {topic} maintenance: {fact} on the {topic} during service".strip())
+                ids.append(chunk_id)
+                metadatas.append({"document_id": t})
+                facts[chunk_id] = (topic, f)
+    return ids, texts, metadatas, facts
+
+
+def build_indexes(tmp_path, embeddings, corpus):
+    import chromadb
+    from langchain_chroma import Chroma
+    ids, texts, metadatas, _facts = corpus
+    lexical = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    lexical.add(ids, texts, metadatas)
+    vectorstore = Chroma(collection_name=f"rerank_{uuid.uuid4().hex}", embedding_function=embeddings,
+                         client=chromadb.EphemeralClient(), collection_metadata={"hnsw:space": "cosine"})
+    vectorstore.add_texts(texts, metadatas=metadatas, ids=ids)
+    return lexical, vectorstore
+
+
+def test_mmr_selection_trades_relevance_for_diversity():
+    query = np.array([1.0, 0.0, 0.0])
+    candidates = np.array([[1.0, 0.1, 0.0], [1.0, 0.12, 0.0], [0.8, 0.0, 0.6], [0.0, 1.0, 0.0]])
+    # Pure relevance keeps the similarity order; with diversity the near-duplicate second row drops out
+    assert mmr_select(query, candidates, 3, lambda_mult=1.0) == [0, 1, 2]
+    assert mmr_select(query, candidates, 2, lambda_mult=0.5) == [0, 2]
+    assert sorted(mmr_select(query, candidates, 10)) == [0, 1, 2, 3]
+
+    assert reranker_names() == ["mmr", "none", "overlap"]
+    assert create_reranker({"RERANKER": "none"}) is None
+    assert create_reranker({"RERANKER": "MMR", "RERANK_MMR_LAMBDA": 0.4}).lambda_mult == 0.4
+    with pytest.raises(ValueError, match="overlap"):
+        create_reranker({"RERANKER": "cross-encoder"})
+
+
+def test_overlap_reranker_prefers_chunks_with_the_question_terms_and_phrases():
+    docs = [Document(page_content=text) for text in (
+        "Bearings should be greased monthly.",
+        "The pump pressure switch must be recalibrated after a seal change.",
+        "Pressure readings from the pump are logged hourly; switch logs weekly.",
+        "Motor noise usually means a worn bearing.",
+    )]
+    ranked = TermOverlapReranker().rerank("How do I recalibrate the pressure switch on the pump?", docs, 2)
+    assert [d.page_content for d in ranked] == [docs[1].page_content, docs[2].page_content]
+    # Without vectors MMR keeps the first-stage order
+    assert MMRReranker().rerank("pump", docs, 2) == docs[:2]
+
+
+def test_reranked_retrieval_reuses_the_query_embedding_and_reports_stage_timings(tmp_path):
+    corpus = duplicated_corpus()
+    ids, texts, metadatas, facts = corpus
+    embeddings = CountingEmbeddings()
+    lexical, chroma = build_indexes(tmp_path, embeddings, corpus)
+    mmap = MmapVectorStore(str(tmp_path / "mmap"), embedding_function=embeddings)
+    mmap.add_texts(texts, metadatas=metadatas, ids=ids)
+
+    for vectorstore in (chroma, mmap):
+        retriever = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=3, reranker=MMRReranker())
+        embedded = embeddings.queries
+        docs = retriever.invoke("pump maintenance during service")
+        assert embeddings.queries == embedded + 1
+        assert set(retriever.timings) == {"lexical", "vector", "fusion", "rerank"}
+        assert len(docs) == 3 and len({facts[d.id] for d in docs}) == 3
+
+        scoped = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=2, mode="vector",
+                                 reranker=create_reranker({"RERANKER": "overlap"}), document_ids=[2])
+        docs = scoped.invoke("sensor gasket replacement")
+        assert all(d.metadata["document_id"] == 2 for d in docs)
+        assert "gasket" in docs[0].page_content and set(scoped.timings) == {"vector", "rerank"}
+    mmap.close()
+
+
+# Share of the needed facts in the context, and prompt characters: the top 3 fused chunks vs 2 chosen by
+# MMR from 6 candidates. Reranking must cover at least as much with fewer chunks, at a small added cost.
+@pytest.mark.benchmark(group="reranking")
+def test_mmr_cuts_context_without_losing_coverage(benchmark, tmp_path):
+    corpus = duplicated_corpus()
+    _ids, _texts, _metadatas, facts = corpus
+    lexical, vectorstore = build_indexes(tmp_path, CountingEmbeddings(), corpus)
+    baseline = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=3)
+    reranked = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=2, reranker=MMRReranker(),
+                               rerank_candidates=6)
+    # Each question needs two facts about one part
+    queries = [(f"{topic}: {FACTS[f]} and {FACTS[(f + 2) % len(FACTS)]}", {(topic, f), (topic, (f + 2) % len(FACTS))})
+               for topic in TOPICS for f in range(len(FACTS))]
+
+    def measure(retriever):
+        covered, chars, stages = 0, 0, {}
+        start = time.perf_counter()
+        for query, needed in queries:
+            docs = retriever.invoke(query)
+            covered += len({facts[d.id] for d in docs} & needed)
+            chars += sum(len(d.page_content) for d in docs)
+            for stage, seconds in retriever.timings.items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        elapsed = time.perf_counter() - start
+        return {"recall": covered / (2 * len(queries)), "context_chars": chars // len(queries),
+                "query_ms": round(1000 * elapsed / len(queries), 2),
+                **{f"{stage}_ms": round(1000 * s / len(queries), 3) for stage, s in stages.items()}}
+
+    before = measure(baseline)
+    after = benchmark.pedantic(measure, args=(reranked,), rounds=1, iterations=1)
+    # Stage timings are recorded for comparison, not asserted
+    benchmark.extra_info.update(baseline=before, mmr=after)
+
+    assert after["recall"] > before["recall"]
+    assert after["context_chars"] < before["context_chars"]
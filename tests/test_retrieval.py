@@ -0,0 +1,223 @@
+# tests/test_retrieval.py
+import re
+import time
+import logging
+import uuid
+import random
+import zlib
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.lexical_index import LexicalIndex, tokenize
+from app.retrieval import HybridRetriever, is_keyword_query, reciprocal_rank_fusion
+
+
+# Bag-of-words embedding that, like a dense model, is blind to exact identifiers (tokens with digits).
+# latency simulates the embedding API round trip.
+class TopicEmbeddings(Embeddings):
+    def __init__(self, size=64, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.queries = 0
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for word in re.findall(r"[a-z]+", text.lower()):
+            vector[zlib.crc32(word.encode()) % self.size] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        time.sleep(self.latency)
+        return self._embed(text)
+
+
+TOPICS = ["pump", "valve", "sensor", "motor", "filter", "bearing", "gasket", "controller"]
+FAULTS = ["overheating", "leaking", "vibration", "corrosion", "noise", "drift", "failure", "wear"]
+
+
+# Synthetic maintenance notes: every chunk has a unique part number and a topic/fault description
+def synthetic_corpus(n=400, seed=7):
+    rng = random.Random(seed)
+    ids, texts, metadatas = [], [], []
+    for i in range(n):
+        topic, fault = rng.choice(TOPICS), rng.choice(FAULTS)
+        texts.append(f"Part XR-{1000 + i} {topic} service note: inspect the {topic} for {fault} "
+                     f"and replace the {topic} {rng.choice(TOPICS)} assembly if needed.")
+        ids.append(f"doc{i // 10}-{i % 10}")
+        metadatas.append({"document_id": i // 10})
+    return ids, texts, metadatas
+
+
+def build_indexes(tmp_path, embeddings, corpus):
+    import chromadb
+    from langchain_chroma import Chroma
+    ids, texts, metadatas = corpus
+    lexical = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    lexical.add(ids, texts, metadatas)
+    vectorstore = Chroma(collection_name=f"bench_{uuid.uuid4().hex}", embedding_function=embeddings,
+                         client=chromadb.EphemeralClient())
+    vectorstore.add_texts(texts, metadatas=metadatas, ids=ids)
+    return lexical, vectorstore
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Replace XR-200b (v2.1)") == ["replace", "xr-200b", "xr", "200b", "v2.1", "v2", "1"]
+    assert is_keyword_query("XR-1042")
+    assert is_keyword_query('"torque wrench"')
+    assert not is_keyword_query("why is the pump leaking?")
+
+
+def test_bm25_ranks_exact_identifier_first_and_supports_deletes(tmp_path):
+    ids, texts, metadatas = synthetic_corpus(50)
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.add(ids, texts, metadatas)
+    assert index.count() == 50
+
+    chunk_id, text, metadata, _score = index.search("XR-1017", k=3)[0]
+    assert chunk_id == "doc1-7" and "XR-1017" in text and metadata["document_id"] == 1
+
+    # Re-adding the same ids replaces rather than duplicates; documents can be removed as a unit
+    index.add(ids[:10], texts[:10], metadatas[:10])
+    assert index.count() == 50
+    index.delete_document(1)
+    assert index.count() == 40
+    assert all(r[0] != "doc1-7" for r in index.search("XR-1017", k=3))
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]])
+    assert fused[:2] == ["a", "c"]
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_keyword_queries_skip_embedding(tmp_path):
+    embeddings = TopicEmbeddings()
+    lexical, vectorstore = build_indexes(tmp_path, embeddings, synthetic_corpus(60))
+    retriever = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=3)
+
+    docs = retriever.invoke("XR-1042")
+    assert "XR-1042" in docs[0].page_content
+    assert embeddings.queries == 0
+
+    docs = retriever.invoke("which pump is leaking")
+    assert embeddings.queries == 1
+    assert len(docs) == 3
+
+
+def test_hybrid_search_degrades_to_the_index_that_works(tmp_path, caplog, monkeypatch):
+    # create_app's dictConfig disables loggers of modules imported before it, as this one was
+    monkeypatch.setattr(logging.getLogger("app.retrieval"), "disabled", False)
+    lexical, vectorstore = build_indexes(tmp_path, TopicEmbeddings(), synthetic_corpus(60))
+
+    class Broken:
+        embeddings = None
+
+        def __getattr__(self, name):
+            raise RuntimeError("index unavailable")
+
+    docs = HybridRetriever(vectorstore=Broken(), lexical=lexical, k=3).invoke("pump leaking XR-1042 assembly")
+    assert len(docs) == 3 and "Vector search failed" in caplog.text
+    docs = HybridRetriever(vectorstore=vectorstore, lexical=Broken(), k=3).invoke("which pump is leaking")
+    assert len(docs) == 3 and "Lexical search failed" in caplog.text
+    # With neither index the error reaches the caller
+    with pytest.raises(RuntimeError):
+        HybridRetriever(vectorstore=Broken(), lexical=Broken(), k=3).invoke("which pump is leaking")
+
+
+# Recall@3 and latency of vector-only vs hybrid retrieval on a synthetic corpus.
+# Identifier lookups are where pure vector search fails; hybrid must not lose recall on either kind.
+@pytest.mark.benchmark(group="retrieval")
+def test_hybrid_retrieval_recall_and_latency(benchmark, tmp_path):
+    corpus = synthetic_corpus(400)
+    ids, texts, _ = corpus
+    embeddings = TopicEmbeddings(latency=0.01)
+    lexical, vectorstore = build_indexes(tmp_path, embeddings, corpus)
+    vector_only = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=3, mode="vector")
+    hybrid = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=3)
+
+    rng = random.Random(3)
+    targets = rng.sample(range(len(ids)), 40)
+    identifier_queries = [(f"XR-{1000 + i}", {ids[i]}) for i in targets]
+    # Natural-language queries: relevant chunks are those sharing both topic and fault words
+    topic_queries = []
+    for topic in TOPICS[:4]:
+        for fault in FAULTS[:4]:
+            relevant = {ids[i] for i, t in enumerate(texts) if f"the {topic} for {fault}" in t}
+            if relevant:
+                topic_queries.append((f"{topic} {fault} inspection", relevant))
+
+    def recall(retriever, queries):
+        hits = 0
+        for query, relevant in queries:
+            hits += any(d.id in relevant for d in retriever.invoke(query))
+        return hits / len(queries)
+
+    vector_id_recall = recall(vector_only, identifier_queries)
+    hybrid_id_recall = recall(hybrid, identifier_queries)
+    vector_topic_recall = recall(vector_only, topic_queries)
+    hybrid_topic_recall = recall(hybrid, topic_queries)
+
+    start = time.perf_counter()
+    for query, _ in identifier_queries:
+        vector_only.invoke(query)
+    vector_latency = (time.perf_counter() - start) / len(identifier_queries)
+    embedded_before = embeddings.queries
+    benchmark.pedantic(lambda: [hybrid.invoke(q) for q, _ in identifier_queries], rounds=1, iterations=1)
+    start = time.perf_counter()
+    for query, _ in identifier_queries:
+        hybrid.invoke(query)
+    hybrid_latency = (time.perf_counter() - start) / len(identifier_queries)
+
+    benchmark.extra_info.update(
+        vector_identifier_recall=vector_id_recall, hybrid_identifier_recall=hybrid_id_recall,
+        vector_topic_recall=vector_topic_recall, hybrid_topic_recall=hybrid_topic_recall,
+        vector_ms=round(vector_latency * 1000, 2), hybrid_ms=round(hybrid_latency * 1000, 2),
+    )
+    assert hybrid_id_recall == 1.0 and vector_id_recall < 0.5
+    assert hybrid_topic_recall >= vector_topic_recall
+    # Identifier lookups never waited on the embedding round trip
+    assert embeddings.queries == embedded_before
+    assert hybrid_latency < vector_latency
+
+
+# Scoping to a few documents returns only their chunks, from both indexes, and costs less than
+# searching the whole collection
+@pytest.mark.benchmark(group="retrieval")
+def test_scoped_retrieval_is_precise_and_cheaper(benchmark, tmp_path):
+    corpus = synthetic_corpus(2000)
+    ids, texts, metadatas = corpus
+    lexical, vectorstore = build_indexes(tmp_path, TopicEmbeddings(), corpus)
+    scope = [3, 17, 42]
+    in_scope = {i for i, md in enumerate(metadatas) if md["document_id"] in scope}
+    everywhere = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=5)
+    scoped = HybridRetriever(vectorstore=vectorstore, lexical=lexical, k=5, document_ids=scope)
+
+    for query in ("pump overheating inspection", "valve leaking", f"XR-{1000 + min(in_scope)}"):
+        docs = scoped.invoke(query)
+        assert docs and all(d.metadata["document_id"] in scope for d in docs)
+    # An identifier outside the scope is not found, even though it matches exactly elsewhere
+    outside = next(i for i in range(len(ids)) if i not in in_scope)
+    assert all(d.id != ids[outside] for d in scoped.invoke(f"XR-{1000 + outside}"))
+    assert HybridRetriever(vectorstore=vectorstore, lexical=lexical, document_ids=[]).invoke("pump") == []
+
+    queries = [f"{topic} {fault}" for topic in TOPICS for fault in FAULTS[:3]]
+    def timed(search):
+        start = time.perf_counter()
+        for query in queries:
+            search(query)
+        return (time.perf_counter() - start) / len(queries)
+    full_lexical = timed(lambda q: lexical.search(q, 20))
+    scoped_lexical = benchmark.pedantic(timed, args=(lambda q: lexical.search(q, 20, scope),), rounds=1, iterations=1)
+    full_hybrid = timed(everywhere.invoke)
+    scoped_hybrid = timed(scoped.invoke)
+    benchmark.extra_info.update(
+        chunks=len(ids), scoped_chunks=len(in_scope),
+        full_lexical_ms=round(full_lexical * 1000, 2), scoped_lexical_ms=round(scoped_lexical * 1000, 2),
+        full_hybrid_ms=round(full_hybrid * 1000, 2), scoped_hybrid_ms=round(scoped_hybrid * 1000, 2),
+    )
+    assert scoped_lexical < full_lexical
@@ -0,0 +1,48 @@
+# tests/test_startup.py
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules that must only be imported once a feature needs them
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_openai", "langchain_chroma", "chromadb", "openai",
+                 "unstructured", "langchain_unstructured", "nltk", "pypandoc", "alembic", "numpy")
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+print("ELAPSED", time.perf_counter() - start)
+print("LOADED", " ".join(sorted(m for m in {heavy!r} if m in sys.modules)))
+"""
+
+
+# Start the app in a fresh interpreter with -X importtime; returns (seconds, heavy modules loaded, imports)
+def cold_start(cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-test"))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT.format(heavy=HEAVY_MODULES)],
+                            cwd=cwd, env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    lines = dict(line.split(" ", 1) for line in result.stdout.splitlines() if line.startswith(("ELAPSED", "LOADED")))
+    # "import time: self [us] | cumulative | package" lines, top-level packages only
+    imports = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _self, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit() and not name.startswith("  "):
+                imports[name.strip()] = int(cumulative) / 1e6
+    return float(lines["ELAPSED"]), lines.get("LOADED", "").split(), imports
+
+
+@pytest.mark.benchmark(group="startup")
+def test_create_app_does_not_import_heavy_dependencies(benchmark, tmp_path):
+    elapsed, loaded, imports = benchmark.pedantic(cold_start, args=(tmp_path,), rounds=3, iterations=1)
+    slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:10]
+    benchmark.extra_info.update(create_app_seconds=round(elapsed, 3),
+                                slowest_imports={name: round(s, 3) for name, s in slowest})
+    assert loaded == []
+    assert "flask_migrate" not in imports
@@ -0,0 +1,109 @@
+# tests/test_vectorstore_pool.py
+import threading
+import time
+
+from app.vectorstore_pool import VectorStorePool
+
+# Minimal stand-in for a vector store handle backed by a directory on disk
+class FakeHandle:
+    def __init__(self, persist_dir):
+        self._persist_directory = str(persist_dir)
+        self.released = False
+
+
+def make_store(tmp_path, name, size):
+    path = tmp_path / name
+    path.mkdir()
+    (path / "data_level0.bin").write_bytes(b"x" * size)
+    return path
+
+
+def test_warm_lookups_reuse_the_open_handle(tmp_path):
+    pool = VectorStorePool(release=lambda h: setattr(h, "released", True))
+    path = make_store(tmp_path, "user_1_db", 10)
+    opened = []
+    def opener():
+        opened.append(1)
+        return FakeHandle(path)
+
+    first = pool.get((1, "model"), opener)
+    second = pool.get((1, "model"), opener)
+    assert first is second
+    assert len(opened) == 1
+    assert pool.stats()["hits"] == 1 and pool.stats()["bytes"] == 10
+
+
+def test_eviction_by_count_and_by_memory(tmp_path):
+    pool = VectorStorePool(max_handles=2, max_bytes=250, release=lambda h: setattr(h, "released", True))
+    handles = {}
+    for uid in (1, 2):
+        path = make_store(tmp_path, f"user_{uid}_db", 100)
+        handles[uid] = pool.get((uid, "m"), lambda p=path: FakeHandle(p))
+    pool.get((1, "m"), lambda: None)  # touch user 1 so user 2 is least recently used
+
+    path = make_store(tmp_path, "user_3_db", 100)
+    pool.get((3, "m"), lambda: FakeHandle(path))
+    assert handles[2].released and not handles[1].released
+    assert pool.stats()["handles"] == 2
+
+    # A large store pushes the pool over its byte budget
+    path = make_store(tmp_path, "user_4_db", 200)
+    pool.get((4, "m"), lambda: FakeHandle(path))
+    stats = pool.stats()
+    assert stats["bytes"] <= 250
+    assert stats["handles"] == 1
+
+
+def test_invalidate_drops_all_handles_for_a_user(tmp_path):
+    pool = VectorStorePool(release=lambda h: setattr(h, "released", True))
+    path = make_store(tmp_path, "user_1_db", 1)
+    handle = pool.get((1, "m"), lambda: FakeHandle(path))
+    assert pool.invalidate(1) == 1
+    assert handle.released
+    assert pool.get((1, "m"), lambda: FakeHandle(path)) is not handle
+
+
+def test_shared_directory_is_released_with_its_last_handle(tmp_path):
+    pool = VectorStorePool(max_handles=2, release=lambda h: setattr(h, "released", True))
+    path = make_store(tmp_path, "user_1_db", 1)
+    # Two embedding models (or engines) for one user share the store directory
+    first = pool.get((1, "model-a", "chroma"), lambda: FakeHandle(path))
+    second = pool.get((1, "model-b", "chroma"), lambda: FakeHandle(path))
+    pool.get((2, "model-a", "chroma"), lambda: FakeHandle(make_store(tmp_path, "user_2_db", 1)))
+    # Evicting one key leaves the directory's system running for the other
+    assert not first.released
+    pool.get((3, "model-a", "chroma"), lambda: FakeHandle(make_store(tmp_path, "user_3_db", 1)))
+    assert second.released
+    assert pool.stats()["evictions"] == 2
+
+
+def test_concurrent_cold_lookups_open_once(tmp_path):
+    pool = VectorStorePool(release=lambda h: None)
+    path = make_store(tmp_path, "user_1_db", 1)
+    opened = []
+    def slow_opener():
+        opened.append(1)
+        time.sleep(0.05)
+        return FakeHandle(path)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get((1, "m"), slow_opener))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(opened) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_evicted_lexical_indexes_are_closed_and_reopen_on_use(tmp_path):
+    from app.lexical_index import LexicalIndex
+    pool = VectorStorePool(max_handles=2)
+    indexes = [pool.get((uid, "lexical"), lambda uid=uid: LexicalIndex(str(tmp_path / f"user_{uid}.sqlite3")))
+               for uid in (1, 2)]
+    indexes[0].add(["a"], ["pump seal"], [{"document_id": 1}])
+    pool.get((3, "lexical"), lambda: LexicalIndex(str(tmp_path / "user_3.sqlite3")))
+    # The least recently used index gave up its connection
+    assert indexes[0]._db is None and indexes[1]._db is not None
+    # A request still holding it reopens the file instead of failing
+    assert indexes[0].search("seal", 1)[0][0] == "a"